@@ -1,6 +1,7 @@
 # your_project/celery.py
 import os
 from celery import Celery
+from celery.signals import task_prerun
 
 # Set default Django settings
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Automotive.settings')
@@ -12,4 +13,11 @@ app = Celery('Automotive')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django apps.
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+
+@task_prerun.connect
+def reset_primary_pin(**kwargs):
+    # A write in one task must not pin every later task in this worker
+    from Automotive_app.db_router import reset_pin
+    reset_pin()
@@ -0,0 +1,30 @@
+"""
+Settings for running the test suite without MySQL:
+
+    DJANGO_SETTINGS_MODULE=Automotive.test_settings python manage.py test
+
+'default' and 'replica' are two separate SQLite files, so the replica
+router can be tested end to end against a second database. 'replica' is
+not in DATABASE_REPLICAS; tests that want reads routed there say so with
+override_settings.
+"""
+import os
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+TEST_DB_DIR = os.getenv('TEST_DB_DIR', tempfile.gettempdir())
+
+DATABASES = {
+    alias: {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(TEST_DB_DIR, f'automotive_{alias}.sqlite3'),
+        'TEST': {'NAME': os.path.join(TEST_DB_DIR, f'test_automotive_{alias}.sqlite3')},
+    }
+    for alias in ('default', 'replica')
+}
+DATABASE_REPLICAS = []
+
+SECRET_KEY = os.getenv('SECRET_KEY') or 'insecure-key-for-the-test-suite-only'
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
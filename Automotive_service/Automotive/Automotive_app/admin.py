@@ -2,7 +2,7 @@ from django.contrib import admin
 
 # Register your models here.
 
-from .models import Vehicle, Service, Booking, SparePart, DentingRequest,PartOrder,ServiceHistory
+from .models import Vehicle, Service, Booking, SparePart, DentingRequest,PartOrder,PartOrderLine,ServiceHistory,ServiceHistoryItem,ArchivedRecord,RefundJob,UserRole
 
 admin.site.register(Vehicle)
 admin.site.register(Service)
@@ -10,6 +10,11 @@ admin.site.register(Booking)
 admin.site.register(SparePart)
 admin.site.register(DentingRequest)
 admin.site.register(PartOrder)
+admin.site.register(PartOrderLine)
+admin.site.register(RefundJob)
+admin.site.register(UserRole)
 admin.site.register(ServiceHistory)
+admin.site.register(ServiceHistoryItem)
+admin.site.register(ArchivedRecord)
 
 
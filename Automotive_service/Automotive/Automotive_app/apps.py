@@ -6,4 +6,6 @@ class AutomotiveAppConfig(AppConfig):
 
     def ready(self):
         # This import is critical for signals to function
-        import Automotive_app.signals
\ No newline at end of file
+        import Automotive_app.signals
+        import Automotive_app.realtime
+        import Automotive_app.search
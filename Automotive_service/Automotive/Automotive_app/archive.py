@@ -0,0 +1,140 @@
+"""
+Hot/cold archival.
+
+Old finished rows are copied into ArchivedRecord (one JSON payload per row)
+and deleted from the live tables in small batches. Every batch is its own
+short transaction, so the job never holds long locks and can be stopped and
+re-run at any point: rows already copied are skipped by the unique
+(kind, original_id) constraint and rows not yet deleted are picked up again.
+
+Bookings and part orders only go once their payment is settled: a
+finished row that was never paid can still be paid, and a cancelled one
+with a refund still owed keeps its RefundJob (deleted with the row) until
+the refund has gone through.
+
+A logbook entry's ServiceHistoryItem rows are deleted with it, so they are
+part of its payload. The newest entry of each (vehicle, service) stays live
+however old it is: service reminders count the next due date from it.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Booking, PartOrder, ServiceHistory, ServiceHistoryItem, ArchivedRecord, RefundJob
+from .serializers import BookingSerializer, PartOrderSerializer, ArchivedServiceHistorySerializer
+
+
+def latest_service_entries():
+    """ids of the logbook entries holding the newest item of some (vehicle, service)."""
+    newer = ServiceHistoryItem.objects.filter(
+        service_id=OuterRef('service_id'),
+        history__vehicle_id=OuterRef('history__vehicle_id'),
+        history__completion_date__gt=OuterRef('history__completion_date'),
+    )
+    return ServiceHistoryItem.objects.filter(service__isnull=False).exclude(Exists(newer)).values('history_id')
+
+
+def no_open_refund(field):
+    """Rows without a RefundJob that is still queued, running or failed."""
+    return ~Exists(RefundJob.objects.filter(**{field: OuterRef('pk')}).exclude(status='SUCCEEDED'))
+
+
+# Payment states in which a cancelled row owes nothing either way
+CANCELLED_SETTLED = ['REFUNDED', 'PENDING', 'FAILED']
+
+# kind -> (model, time field, extra filter, serializer, select_related, prefetch_related)
+ARCHIVE_RULES = {
+    'booking': (
+        Booking, 'appointment_time',
+        (
+            Q(status='COMPLETED', payment_status__in=['PAID', 'COMPLETED', 'REFUNDED'])
+            | Q(status='CANCELLED', payment_status__in=CANCELLED_SETTLED)
+        ) & no_open_refund('booking'),
+        BookingSerializer, ['user', 'vehicle'], [],
+    ),
+    'part_order': (
+        PartOrder, 'created_at',
+        (
+            Q(status='Delivered', payment_status__in=['PAID', 'REFUNDED'])
+            | Q(status='Cancelled', payment_status__in=CANCELLED_SETTLED)
+        ) & no_open_refund('order'),
+        PartOrderSerializer, ['user', 'part'], ['lines__part'],
+    ),
+    'service_history': (
+        ServiceHistory, 'completion_date', ~Q(pk__in=latest_service_entries()),
+        ArchivedServiceHistorySerializer, ['user', 'vehicle'], ['items'],
+    ),
+}
+
+
+def get_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'ARCHIVE_AFTER_DAYS', 365)
+    return timezone.now() - timedelta(days=days)
+
+
+def archivable(kind, cutoff):
+    model, time_field, extra, *_ = ARCHIVE_RULES[kind]
+    return model.objects.filter(extra, **{f'{time_field}__lt': cutoff})
+
+
+def archive_batch(kind, cutoff, batch_size):
+    """
+    Move up to batch_size rows of one kind into the archive.
+    Returns the number of rows moved (0 means nothing is left).
+    """
+    model, time_field, extra, serializer_class, related, prefetch = ARCHIVE_RULES[kind]
+
+    with transaction.atomic():
+        ids = list(
+            archivable(kind, cutoff)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+
+        rows = (
+            model.objects.filter(pk__in=ids)
+            .select_related(*related)
+            .prefetch_related(*prefetch)
+        )
+        archived = [
+            ArchivedRecord(
+                kind=kind,
+                original_id=obj.pk,
+                user_id=obj.user_id,
+                occurred_at=getattr(obj, time_field),
+                payload=serializer_class(obj).data,
+            )
+            for obj in rows
+        ]
+        ArchivedRecord.objects.bulk_create(archived, ignore_conflicts=True)
+        model.objects.filter(pk__in=ids).delete()
+
+    return len(ids)
+
+
+def archive_old_rows(kinds=None, days=None, batch_size=500, max_batches=20):
+    """
+    Run at most max_batches batches per kind. Returns {kind: moved} and a
+    flag telling the caller whether rows are still waiting.
+    """
+    cutoff = get_cutoff(days)
+    moved = {}
+    remaining = False
+
+    for kind in kinds or ARCHIVE_RULES:
+        moved[kind] = 0
+        for _ in range(max_batches):
+            count = archive_batch(kind, cutoff, batch_size)
+            moved[kind] += count
+            if count < batch_size:
+                break
+        else:
+            remaining = remaining or archivable(kind, cutoff).exists()
+
+    return moved, remaining
@@ -0,0 +1,23 @@
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+
+
+def get_token_user(request):
+    """
+    Resolve the user from a JWT access token for plain Django views
+    (event streams, media files) that browsers open without custom
+    headers. Accepts 'Authorization: Bearer <token>' or '?token=<token>'.
+    Returns AnonymousUser when there is no valid token.
+    """
+    auth = JWTAuthentication()
+    try:
+        header = auth.get_header(request)
+        raw = auth.get_raw_token(header) if header else request.GET.get('token')
+        if not raw:
+            return AnonymousUser()
+        validated = auth.get_validated_token(raw)
+        return auth.get_user(validated)
+    except (AuthenticationFailed, TokenError):
+        return AnonymousUser()
@@ -0,0 +1,156 @@
+"""
+Batch requests: several API calls in one HTTP round trip.
+
+    POST /api/batch/
+    {
+        "atomic": true,
+        "requests": [
+            {"method": "POST", "path": "/api/admin-bookings/12/finalize_booking/", "body": {"final_amount": 2500}},
+            {"method": "POST", "path": "/api/admin-part-orders/40/update_status/", "body": {"status": "Shipped"}},
+            {"method": "GET", "path": "/api/bookings/?status=PENDING"}
+        ]
+    }
+
+Each sub-request is dispatched straight to the view its path resolves to,
+as the user who sent the batch: the JWT is decoded once, for the batch, and
+sub-requests skip the middleware stack. Views still run their own
+permission checks and throttles. Optional "headers" are passed on (for
+example Idempotency-Key).
+
+The response is {"results": [{"status", "body"}, ...]} in request order.
+With "atomic": true the sub-requests share one transaction; the first one
+that fails (status >= 400) stops the batch and everything is rolled back
+("rolled_back": true, HTTP 400). Without it every sub-request stands on its
+own. At most BATCH_MAX_REQUESTS sub-requests per batch.
+
+Views queue their emails and refund tasks with transaction.on_commit, so a
+rolled back atomic batch sends nothing; Stripe calls a sub-request makes
+are not undone.
+"""
+import asyncio
+import io
+import json
+import logging
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.urls import Resolver404, resolve
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .renderers import ORJSONRenderer
+
+logger = logging.getLogger(__name__)
+
+METHODS = {'GET', 'POST', 'PUT', 'PATCH', 'DELETE'}
+API_PREFIX = '/api/'
+# Request headers of the batch that sub-requests must not inherit
+NOT_INHERITED = {'CONTENT_TYPE', 'CONTENT_LENGTH', 'QUERY_STRING', 'HTTP_IF_NONE_MATCH', 'HTTP_IDEMPOTENCY_KEY'}
+
+
+class BatchError(ValueError):
+    pass
+
+
+def _validate(item):
+    if not isinstance(item, dict):
+        raise BatchError('Each request must be an object.')
+    method = str(item.get('method', 'GET')).upper()
+    path = item.get('path')
+    if method not in METHODS:
+        raise BatchError(f'Unsupported method: {method}.')
+    if not isinstance(path, str) or not path.startswith(API_PREFIX):
+        raise BatchError(f'path must start with {API_PREFIX}.')
+    if not isinstance(item.get('headers', {}), dict):
+        raise BatchError('headers must be an object.')
+    return method, path
+
+
+def build_subrequest(request, method, path, body=None, headers=None):
+    """A WSGIRequest for one sub-request, authenticated as the batch's user."""
+    path, _, query = path.partition('?')
+    payload = b'' if body is None else ORJSONRenderer().render(body)
+
+    environ = {k: v for k, v in request.META.items() if k not in NOT_INHERITED and not k.startswith('wsgi.')}
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': io.BytesIO(payload),
+        'wsgi.url_scheme': request.scheme,
+    })
+    for name, value in (headers or {}).items():
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        if key not in ('HTTP_AUTHORIZATION', 'HTTP_COOKIE'):
+            environ[key] = str(value)
+
+    sub = WSGIRequest(environ)
+    # DRF's Request picks these up instead of running the authenticators again
+    sub._force_auth_user = request.user
+    sub._force_auth_token = request.auth
+    return sub
+
+
+def _response_body(response):
+    if isinstance(response, Response):
+        return response.data
+    content = response.content
+    if not content:
+        return None
+    if response.get('Content-Type', '').startswith('application/json'):
+        return json.loads(content)
+    return content.decode(response.charset or 'utf-8', errors='replace')
+
+
+def dispatch(request, item):
+    """Run one sub-request; returns {'status', 'body'}."""
+    try:
+        method, path = _validate(item)
+        match = resolve(path.partition('?')[0])
+    except BatchError as e:
+        return {'status': 400, 'body': {'error': str(e)}}
+    except Resolver404:
+        return {'status': 404, 'body': {'error': 'Not found.'}}
+    if match.func is batch:
+        return {'status': 400, 'body': {'error': 'Batches cannot be nested.'}}
+    if asyncio.iscoroutinefunction(match.func):
+        return {'status': 400, 'body': {'error': 'Streaming endpoints cannot be batched.'}}
+
+    sub = build_subrequest(request, method, path, item.get('body'), item.get('headers'))
+    sub.resolver_match = match
+    try:
+        response = match.func(sub, *match.args, **match.kwargs)
+    except Exception as e:
+        logger.error(f"Batch sub-request {method} {path} failed: {e}")
+        return {'status': 500, 'body': {'error': 'Internal server error.'}}
+    if response.streaming:
+        return {'status': 400, 'body': {'error': 'Streaming endpoints cannot be batched.'}}
+    return {'status': response.status_code, 'body': _response_body(response)}
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch(request):
+    items = request.data.get('requests') if isinstance(request.data, dict) else None
+    if not isinstance(items, list) or not items:
+        return Response({'error': 'requests must be a non-empty list.'}, status=400)
+    limit = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+    if len(items) > limit:
+        return Response({'error': f'At most {limit} requests per batch.'}, status=400)
+
+    if not request.data.get('atomic'):
+        return Response({'results': [dispatch(request, item) for item in items]})
+
+    results = []
+    with transaction.atomic():
+        for item in items:
+            results.append(dispatch(request, item))
+            if results[-1]['status'] >= 400:
+                transaction.set_rollback(True)
+                return Response({'results': results, 'rolled_back': True}, status=400)
+    return Response({'results': results, 'rolled_back': False})
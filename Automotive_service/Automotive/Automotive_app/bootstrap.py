@@ -0,0 +1,98 @@
+"""
+Dashboard bootstrap: everything the React app loads after login, in one
+response.
+
+    GET /api/bootstrap/
+    GET /api/bootstrap/?bookings_limit=50      (per section, up to BOOTSTRAP_MAX_LIMIT)
+
+Sections are the current user's details, vehicles, bookings, part orders,
+service history and denting requests, each newest first and cut at its
+limit (settings.BOOTSTRAP_SECTION_LIMITS). Every section goes through the FastList
+path, so the whole response costs a fixed number of queries: one per
+section plus one for order lines. `more` tells which sections were cut.
+
+The response carries an ETag (hash of the body); a repeat load with
+If-None-Match gets an empty 304. The body is still built to compute the
+tag, so this saves bandwidth and client parsing, not queries: sections
+also show related rows (vehicles, parts, services) that carry no
+updated_at, so no cheap aggregate would notice every change.
+"""
+import hashlib
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .fastpath import FastList
+from .models import Vehicle, Booking, PartOrder, ServiceHistory, DentingRequest
+from .renderers import ORJSONRenderer
+from .roles import role_flags
+from .serializers import (
+    VehicleSerializer, BookingSerializer, PartOrderSerializer,
+    ServiceHistorySerializer, DentingRequestSerializer,
+)
+
+# section -> (serializer, the user's rows in display order)
+SECTIONS = {
+    'vehicles': (VehicleSerializer, lambda user: Vehicle.objects.filter(owner=user).order_by('pk')),
+    'bookings': (BookingSerializer, lambda user: Booking.objects.filter(user=user).order_by('-appointment_time')),
+    'part_orders': (PartOrderSerializer, lambda user: PartOrder.objects.filter(user=user).order_by('-created_at')),
+    'history': (ServiceHistorySerializer, lambda user: ServiceHistory.objects.filter(user=user).order_by('-completion_date')),
+    'denting_requests': (DentingRequestSerializer, lambda user: DentingRequest.objects.filter(user=user).order_by('-created_at')),
+}
+
+def section_limits(params):
+    """Configured limits, overridden by ?<section>_limit= within BOOTSTRAP_MAX_LIMIT."""
+    limits = dict(settings.BOOTSTRAP_SECTION_LIMITS)
+    max_limit = getattr(settings, 'BOOTSTRAP_MAX_LIMIT', 100)
+    for section in SECTIONS:
+        value = params.get(f'{section}_limit')
+        if value is not None:
+            limits[section] = min(max(int(value), 0), max_limit)
+    return limits
+
+
+def build_bootstrap(request, limits):
+    user = request.user
+    data = {'user': {'username': user.username, **role_flags(user)}}
+    more = {}
+    for section, (serializer_class, rows) in SECTIONS.items():
+        limit = limits[section]
+        mapper = FastList(serializer_class(context={'request': request}))
+        # One row past the limit tells whether the section was cut
+        items = mapper.convert(mapper.values(rows(user))[:limit + 1])
+        data[section] = items[:limit]
+        more[section] = len(items) > limit
+    data['more'] = more
+    return data
+
+
+def _etag_matches(etag, header):
+    # Weak comparison: CompressionMiddleware sends W/ tags for compressed bodies
+    return any(tag == '*' or tag.removeprefix('W/') == etag for tag in parse_etags(header))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def bootstrap(request):
+    try:
+        limits = section_limits(request.query_params)
+    except ValueError:
+        return Response({'error': 'Section limits must be numbers.'}, status=400)
+
+    body = ORJSONRenderer().render(build_bootstrap(request, limits))
+    etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+    if _etag_matches(etag, request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # Per user, and always revalidated: the 304 is what makes repeat loads cheap
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+    return response
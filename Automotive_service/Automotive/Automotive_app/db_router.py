@@ -0,0 +1,125 @@
+import hashlib
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+# True while the current request/task must read from the primary database
+_pinned = ContextVar('pinned_to_primary', default=False)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def pin_to_primary():
+    """Send every remaining read in this context to the primary."""
+    _pinned.set(True)
+
+
+def reset_pin():
+    """Start a fresh context (used between Celery tasks)."""
+    _pinned.set(False)
+
+
+@contextmanager
+def use_primary():
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def primary_only(func):
+    """
+    Decorator for views/actions that must never see replica lag
+    (payments, stock changes). Works on plain functions and DRF actions.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with use_primary():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    """
+    Writes always go to 'default'. Reads go to a random replica unless the
+    current context has been pinned to the primary, either explicitly or
+    because something was already written in it.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if not replicas or is_pinned():
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # Read-your-writes inside the same request or task
+        pin_to_primary()
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primary and replicas hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+# --- STICKINESS MIDDLEWARE ---
+
+def _client_key(request):
+    """
+    Identify the client without authenticating it (JWT is only decoded
+    later by DRF). The Authorization header is stable per logged-in user.
+    """
+    ident = (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        or request.META.get('REMOTE_ADDR', '')
+    )
+    return 'primary-pin:' + hashlib.sha1(ident.encode()).hexdigest()
+
+
+class PrimaryStickinessMiddleware:
+    """
+    After a client writes, keep its reads on the primary for
+    PRIMARY_STICKY_SECONDS so it does not read stale data from a lagging
+    replica (e.g. a freshly created Booking missing from the list).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not get_replicas():
+            return self.get_response(request)
+
+        key = _client_key(request)
+        sticky = request.method not in SAFE_METHODS
+        if not sticky:
+            pinned_until = cache.get(key)
+            sticky = pinned_until is not None and pinned_until > time.time()
+
+        token = _pinned.set(sticky)
+        try:
+            response = self.get_response(request)
+            if request.method not in SAFE_METHODS:
+                window = getattr(settings, 'PRIMARY_STICKY_SECONDS', 5)
+                cache.set(key, time.time() + window, window)
+            return response
+        finally:
+            _pinned.reset(token)
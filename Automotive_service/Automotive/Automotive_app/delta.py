@@ -0,0 +1,98 @@
+"""
+"Changes since" polling for dashboards.
+
+    GET /api/admin-bookings/                 -> full list, X-Sync-Cursor header
+    GET /api/admin-bookings/?since=<cursor>  -> {"results": [changed rows],
+                                                 "deleted": [ids],
+                                                 "cursor": "<next cursor>"}
+
+Changed rows come from the indexed updated_at column and deletions from
+Tombstone rows, so each poll costs work proportional to what changed.
+One more query over the changed rows finds those the list's filters
+(?status=PENDING...) now leave out: they have left the client's list, so
+they are reported in "deleted" along with the tombstones.
+The next cursor overlaps the previous poll by DELTA_OVERLAP_SECONDS to
+cover transactions that committed late; clients upsert rows by id, so
+seeing a row twice is harmless.
+"""
+import base64
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .fastpath import FastList, FastListMixin
+from .models import Tombstone
+
+
+def encode_cursor(moment):
+    return base64.urlsafe_b64encode(moment.isoformat().encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    moment = datetime.fromisoformat(base64.urlsafe_b64decode(padded.encode()).decode())
+    if timezone.is_naive(moment):
+        raise ValueError('cursor without timezone')
+    return moment
+
+
+def next_cursor(started):
+    overlap = getattr(settings, 'DELTA_OVERLAP_SECONDS', 2)
+    return encode_cursor(started - timedelta(seconds=overlap))
+
+
+class DeltaSyncMixin:
+    """
+    Adds ?since=<cursor> to a list endpoint. Set delta_all_users = True on
+    admin views so tombstones of every user are returned.
+    """
+    delta_all_users = False
+
+    def delta_sees_all_users(self):
+        return self.delta_all_users
+
+    def list(self, request, *args, **kwargs):
+        started = timezone.now()
+        since = request.query_params.get('since')
+        if since is None:
+            response = super().list(request, *args, **kwargs)
+            response['X-Sync-Cursor'] = next_cursor(started)
+            return response
+
+        try:
+            moment = decode_cursor(since)
+        except ValueError:
+            return Response({'error': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        retention = timedelta(days=getattr(settings, 'TOMBSTONE_RETENTION_DAYS', 7))
+        if moment < started - retention:
+            # Deletions this old were purged; the client must reload everything
+            return Response({'error': 'Cursor expired, reload the full list.'}, status=status.HTTP_410_GONE)
+
+        changed = self.get_queryset().filter(updated_at__gt=moment)
+        queryset = self.filter_queryset(changed)
+        if isinstance(self, FastListMixin):
+            mapper = FastList(self.get_serializer())
+            results = mapper.convert(mapper.values(queryset))
+        else:
+            results = self.get_serializer(queryset, many=True).data
+
+        tombstones = Tombstone.objects.filter(
+            model=queryset.model._meta.model_name,
+            deleted_at__gt=moment,
+        )
+        if not self.delta_sees_all_users():
+            tombstones = tombstones.filter(user_id=request.user.id)
+        deleted = list(tombstones.values_list('object_id', flat=True))
+
+        # Changed rows the filters now leave out
+        deleted.extend(changed.exclude(pk__in=queryset.values('pk')).values_list('pk', flat=True))
+
+        return Response({
+            'results': results,
+            'deleted': deleted,
+            'cursor': next_cursor(started),
+        })
@@ -0,0 +1,286 @@
+"""
+Model-free fast path for read-only list endpoints.
+
+Instead of building a model instance per row and walking every serializer
+field on it, FastList reads the serializer's fields once, works out which
+columns they need, fetches those with values_list() and maps each tuple
+straight to the output dict. Converters are the serializer fields' own
+to_representation methods, so the output is the same as serializer.data.
+
+Many relations (services, order lines, ...) are fetched with one extra
+query per relation, keyed by the parent pk.
+"""
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+
+class Computed:
+    """Output value computed from one or more columns of the row."""
+
+    def __init__(self, columns, func):
+        self.columns = columns
+        self.func = func
+
+
+class ComputedMany:
+    """Output list computed from the rows of a many relation."""
+
+    def __init__(self, relation, columns, func):
+        self.relation = relation
+        self.columns = columns
+        self.func = func
+
+
+# Serializer fields that are not plain columns (properties and
+# SerializerMethodFields), keyed by serializer class name
+COMPUTED = {
+    'SparePartSerializer': {
+        'is_available': Computed(('stock',), lambda stock: stock > 0),
+    },
+    'BookingSerializer': {
+        'vehicle_info': Computed(
+            ('vehicle__year', 'vehicle__make', 'vehicle__model'),
+            lambda year, make, model: f"{year} {make} {model}",
+        ),
+        # Read from the snapshot column; no M2M query
+        'services': Computed(('services_snapshot',), lambda snapshot: [entry['id'] for entry in snapshot]),
+        'service_names': Computed(('services_snapshot',), lambda snapshot: [entry['name'] for entry in snapshot]),
+    },
+}
+
+
+class _Columns:
+    def __init__(self, first=()):
+        self.paths = list(first)
+
+    def add(self, path):
+        if path not in self.paths:
+            self.paths.append(path)
+        return self.paths.index(path)
+
+
+class _Relation:
+    """One many relation of the top-level model, fetched in one query."""
+
+    def __init__(self, model, key):
+        self.model = model
+        self.key = key
+        self.columns = _Columns()
+        self.grouped = {}
+
+    def fetch(self, pks):
+        self.grouped = {}
+        rows = self.model.objects.filter(**{f'{self.key}__in': pks}).values_list(self.key, *self.columns.paths)
+        for row in rows:
+            self.grouped.setdefault(row[0], []).append(row[1:])
+
+
+def _model_field(model, path):
+    field = None
+    for part in path.split('__'):
+        if field is not None:
+            model = field.related_model
+        field = model._meta.get_field(part)
+    return field
+
+
+def _converter(field):
+    to_representation = field.to_representation
+
+    def convert(value):
+        return None if value is None else to_representation(value)
+    return convert
+
+
+def _file_converter(field, model_field, request):
+    storage = model_field.storage
+    use_url = getattr(field, 'use_url', True)
+
+    def convert(name):
+        if not name:
+            return None
+        if not use_url:
+            return name
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    return convert
+
+
+class FastList:
+
+    def __init__(self, serializer):
+        self.request = serializer.context.get('request')
+        self.model = serializer.Meta.model
+        self.columns = _Columns(['pk'])
+        self.relations = {}
+        self.plan = self._compile(serializer, self.model, '', self.columns, top=True)
+
+    # --- compilation ---
+
+    def _relation(self, model, source):
+        if source in self.relations:
+            return self.relations[source]
+        rel = model._meta.get_field(source)
+        if rel.many_to_many and not rel.auto_created:
+            key = rel.related_query_name()
+        elif rel.one_to_many:
+            key = rel.field.name
+        else:
+            raise ImproperlyConfigured(f"{model.__name__}.{source} is not a many relation")
+        self.relations[source] = _Relation(rel.related_model, key)
+        return self.relations[source]
+
+    def _compile(self, serializer, model, prefix, columns, top=False):
+        plan = []
+        computed = COMPUTED.get(type(serializer).__name__, {})
+
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            spec = computed.get(name)
+
+            if isinstance(spec, Computed):
+                idx = [columns.add(prefix + c) for c in spec.columns]
+                plan.append((name, self._computed_getter(idx, spec.func)))
+
+            elif isinstance(spec, ComputedMany) or isinstance(field, (serializers.ListSerializer, serializers.ManyRelatedField)):
+                if not top:
+                    raise ImproperlyConfigured(f"Nested many relation '{name}' is not supported by FastList")
+                if spec is not None:
+                    relation = self._relation(model, spec.relation)
+                    idx = [relation.columns.add(c) for c in spec.columns]
+                    func = spec.func
+                    child = lambda r, idx=idx, func=func: func(*[r[i] for i in idx])
+                elif isinstance(field, serializers.ListSerializer):
+                    relation = self._relation(model, field.source)
+                    child_plan = self._compile(field.child, relation.model, '', relation.columns)
+                    child = lambda r, child_plan=child_plan: {n: get(r) for n, get in child_plan}
+                else:
+                    relation = self._relation(model, field.source)
+                    pk = relation.columns.add('pk')
+                    child = lambda r, pk=pk: r[pk]
+                plan.append((name, self._many_getter(relation, child)))
+
+            elif isinstance(field, serializers.BaseSerializer):
+                related = model._meta.get_field(field.source).related_model
+                null_idx = columns.add(prefix + field.source)
+                child_plan = self._compile(field, related, f'{prefix}{field.source}__', columns)
+                plan.append((name, self._nested_getter(null_idx, child_plan)))
+
+            elif isinstance(field, serializers.SerializerMethodField):
+                raise ImproperlyConfigured(
+                    f"{type(serializer).__name__}.{name} needs an entry in fastpath.COMPUTED"
+                )
+
+            else:
+                path = prefix + '__'.join(field.source_attrs)
+                try:
+                    model_field = _model_field(model, '__'.join(field.source_attrs))
+                except FieldDoesNotExist:
+                    raise ImproperlyConfigured(
+                        f"{type(serializer).__name__}.{name} is not a column; add it to fastpath.COMPUTED"
+                    )
+                idx = columns.add(path)
+                if isinstance(field, serializers.FileField):
+                    convert = _file_converter(field, model_field, self.request)
+                elif isinstance(field, serializers.PrimaryKeyRelatedField):
+                    # values_list already returns the pk
+                    convert = _converter(field.pk_field) if field.pk_field else (lambda value: value)
+                else:
+                    convert = _converter(field)
+                plan.append((name, lambda r, idx=idx, convert=convert: convert(r[idx])))
+
+        return plan
+
+    @staticmethod
+    def _computed_getter(idx, func):
+        return lambda r: func(*[r[i] for i in idx])
+
+    @staticmethod
+    def _nested_getter(null_idx, child_plan):
+        def get(r):
+            if r[null_idx] is None:
+                return None
+            return {n: g(r) for n, g in child_plan}
+        return get
+
+    @staticmethod
+    def _many_getter(relation, child):
+        def get(r):
+            return [child(c) for c in relation.grouped.get(r[0], ())]
+        return get
+
+    # --- execution ---
+
+    def values(self, queryset):
+        """The column tuples; paginate this instead of the model queryset."""
+        return queryset.prefetch_related(None).values_list(*self.columns.paths)
+
+    def convert(self, rows):
+        rows = list(rows)
+        if self.relations and rows:
+            pks = [r[0] for r in rows]
+            for relation in self.relations.values():
+                relation.fetch(pks)
+        plan = self.plan
+        return [{name: get(r) for name, get in plan} for r in rows]
+
+
+def optimize_queryset(queryset, serializer):
+    """
+    Load only what the (possibly ?fields= reduced) serializer will output:
+    select_related for the foreign keys it follows, prefetch_related for its
+    many relations and only() for its columns. Fields that were not
+    requested cost neither a join nor a prefetch.
+    """
+    try:
+        plan = FastList(serializer)
+    except ImproperlyConfigured:
+        # Unknown method fields may touch anything; leave the query alone
+        return queryset
+
+    paths = [p for p in plan.columns.paths if p != 'pk']
+    joins = {p.rsplit('__', 1)[0] for p in paths if '__' in p}
+    # A nested serializer on a FK adds the FK itself; only() needs it either way
+    queryset = queryset.select_related(*joins) if joins else queryset.select_related(None)
+
+    prefetches = []
+    for source, relation in plan.relations.items():
+        columns = [c for c in relation.columns.paths if c != 'pk']
+        if relation.model._meta.get_field(relation.key).many_to_one:
+            columns.append(relation.key)
+        child_joins = {c.rsplit('__', 1)[0] for c in columns if '__' in c}
+        related = relation.model.objects.select_related(*child_joins).only(*columns)
+        prefetches.append(Prefetch(source, queryset=related))
+    queryset = queryset.prefetch_related(None).prefetch_related(*prefetches)
+
+    return queryset.only(*paths)
+
+
+class QueryOptimizerMixin:
+    """Apply optimize_queryset() to read requests."""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method in SAFE_METHODS:
+            queryset = optimize_queryset(queryset, self.get_serializer())
+        return queryset
+
+
+class FastListMixin(QueryOptimizerMixin):
+    """
+    Read-only list mode for ModelViewSets: list() goes through FastList,
+    every other action keeps the normal serializer.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        mapper = FastList(self.get_serializer())
+
+        page = self.paginate_queryset(mapper.values(queryset))
+        if page is not None:
+            return self.get_paginated_response(mapper.convert(page))
+        return Response(mapper.convert(mapper.values(queryset)))
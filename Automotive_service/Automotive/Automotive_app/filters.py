@@ -0,0 +1,56 @@
+"""
+Server-side filters for the admin lists and the logbook.
+
+    /api/admin-bookings/?status=CONFIRMED&date_from=2026-01-01&date_to=2026-02-01
+    /api/admin-part-orders/?payment_status=PAID&status=Shipped
+    /api/history/?vehicle=12
+
+Every filter is backed by an index (see the Meta.indexes of each model and
+the FK indexes on user/vehicle); FilterIndexTests checks the query plans.
+"""
+import django_filters
+
+from .models import Booking, PartOrder, DentingRequest, ServiceHistory
+
+
+class BookingFilter(django_filters.FilterSet):
+    date_from = django_filters.DateTimeFilter(field_name='appointment_time', lookup_expr='gte')
+    date_to = django_filters.DateTimeFilter(field_name='appointment_time', lookup_expr='lt')
+    user = django_filters.NumberFilter(field_name='user_id')
+    vehicle = django_filters.NumberFilter(field_name='vehicle_id')
+
+    class Meta:
+        model = Booking
+        fields = ['status', 'payment_status', 'user', 'vehicle', 'date_from', 'date_to']
+
+
+class PartOrderFilter(django_filters.FilterSet):
+    date_from = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
+    date_to = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lt')
+    user = django_filters.NumberFilter(field_name='user_id')
+    vehicle = django_filters.NumberFilter(field_name='vehicle_id')
+
+    class Meta:
+        model = PartOrder
+        fields = ['status', 'payment_status', 'user', 'vehicle', 'date_from', 'date_to']
+
+
+class DentingRequestFilter(django_filters.FilterSet):
+    date_from = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
+    date_to = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lt')
+    user = django_filters.NumberFilter(field_name='user_id')
+
+    class Meta:
+        model = DentingRequest
+        fields = ['status', 'user', 'date_from', 'date_to']
+
+
+class ServiceHistoryFilter(django_filters.FilterSet):
+    date_from = django_filters.DateTimeFilter(field_name='completion_date', lookup_expr='gte')
+    date_to = django_filters.DateTimeFilter(field_name='completion_date', lookup_expr='lt')
+    user = django_filters.NumberFilter(field_name='user_id')
+    vehicle = django_filters.NumberFilter(field_name='vehicle_id')
+
+    class Meta:
+        model = ServiceHistory
+        fields = ['user', 'vehicle', 'date_from', 'date_to']
@@ -0,0 +1,124 @@
+"""
+Restock forecasting.
+
+Paid order lines from the last RESTOCK_HISTORY_DAYS whole days (up to
+today's midnight) are summed per part and day by the database and scattered
+into one (parts x days) NumPy matrix.
+Simple exponential smoothing then runs over all parts at once, one vector
+step per day, giving each part's expected daily demand. From that:
+
+    days_of_cover    = stock / demand
+    reorder_quantity = demand * (lead time + target cover) + safety stock - stock
+
+with safety stock = z * (std of daily demand) * sqrt(lead time). The whole
+RestockSuggestion table is swapped in one transaction.
+"""
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import PartOrderLine, RestockSuggestion, SparePart
+
+# Orders that really took stock
+SOLD = {'order__payment_status': 'PAID'}
+EXCLUDED_STATUSES = ['Cancelled', 'Expired']
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def demand_matrix(part_ids, start, days):
+    """Units sold per part (rows, in part_ids order) and day since start (columns)."""
+    row_of = {pk: i for i, pk in enumerate(part_ids)}
+    matrix = np.zeros((len(part_ids), days), dtype=np.float32)
+
+    end = start + timedelta(days=days)
+    daily = (
+        PartOrderLine.objects.filter(order__created_at__gte=start, order__created_at__lt=end, **SOLD)
+        .exclude(order__status__in=EXCLUDED_STATUSES)
+        .annotate(day=TruncDate('order__created_at'))
+        .values_list('part_id', 'day')
+        .annotate(units=Sum('quantity'))
+        .order_by()
+    )
+    rows, cols, units = [], [], []
+    start_date = start.date()
+    for part_id, day, quantity in daily.iterator(chunk_size=10000):
+        row = row_of.get(part_id)
+        col = (day - start_date).days
+        if row is not None and 0 <= col < days:
+            rows.append(row)
+            cols.append(col)
+            units.append(quantity)
+    if rows:
+        np.add.at(matrix, (np.array(rows), np.array(cols)), np.array(units, dtype=np.float32))
+    return matrix
+
+
+def smooth(matrix, alpha):
+    """Simple exponential smoothing of every row; returns the final level per row."""
+    warmup = min(7, matrix.shape[1])
+    level = matrix[:, :warmup].mean(axis=1)
+    for t in range(warmup, matrix.shape[1]):
+        level = alpha * matrix[:, t] + (1 - alpha) * level
+    return level
+
+
+def suggest(stock, matrix, alpha, lead_days, target_days, z):
+    """Vectorized (daily_demand, days_of_cover, reorder_quantity) for every part."""
+    demand = smooth(matrix, alpha).astype(np.float64)
+    spread = matrix.std(axis=1).astype(np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cover = np.where(demand > 0, stock / demand, np.nan)
+    safety = z * spread * math.sqrt(lead_days)
+    reorder = np.ceil(demand * (lead_days + target_days) + safety - stock)
+    reorder = np.clip(np.nan_to_num(reorder), 0, None).astype(np.int64)
+    return demand, cover, reorder
+
+
+def forecast_restock(now=None, batch_size=5000):
+    """Recompute RestockSuggestion for every part. Returns the number of parts."""
+    now = now or timezone.now()
+    days = _setting('RESTOCK_HISTORY_DAYS', 90)
+    # Whole days only: today's partial column would read as a sudden drop
+    today = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    start = today - timedelta(days=days)
+
+    parts = list(SparePart.objects.order_by('pk').values_list('pk', 'stock'))
+    if not parts:
+        return 0
+    part_ids = [pk for pk, _ in parts]
+    stock = np.array([s for _, s in parts], dtype=np.float64)
+
+    matrix = demand_matrix(part_ids, start, days)
+    demand, cover, reorder = suggest(
+        stock, matrix,
+        alpha=_setting('RESTOCK_SMOOTHING_ALPHA', 0.3),
+        lead_days=_setting('RESTOCK_LEAD_DAYS', 7),
+        target_days=_setting('RESTOCK_TARGET_DAYS', 30),
+        z=_setting('RESTOCK_SERVICE_Z', 1.65),
+    )
+
+    suggestions = [
+        RestockSuggestion(
+            part_id=pk,
+            stock=int(s),
+            daily_demand=round(float(d), 4),
+            days_of_cover=None if math.isnan(c) else round(float(c), 1),
+            reorder_quantity=int(r),
+            computed_at=now,
+        )
+        for pk, s, d, c, r in zip(part_ids, stock, demand, cover, reorder)
+    ]
+    with transaction.atomic():
+        RestockSuggestion.objects.all().delete()
+        RestockSuggestion.objects.bulk_create(suggestions, batch_size=batch_size)
+    return len(suggestions)
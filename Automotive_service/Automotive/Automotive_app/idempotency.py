@@ -0,0 +1,132 @@
+"""
+Idempotency-Key support for POST endpoints that charge money or create orders.
+
+    POST /api/part-orders/checkout/
+    Idempotency-Key: 5b0f6c1e-...
+
+The first request with a key runs normally and its response is stored.
+Retries with the same key get that stored response back (with an
+Idempotent-Replayed header) instead of running the view again. A retry that
+arrives while the first request is still running gets 409 and Retry-After,
+so concurrent duplicates never run side by side. Server errors (5xx) are
+not stored, so the client can retry them. Requests without the header are
+not affected.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyRecord
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+
+def get_key(request):
+    return getattr(request, 'idempotency_key', None) or request.META.get(HEADER)
+
+
+def stripe_options(request, scope):
+    """
+    Extra kwargs for a Stripe create call, so Stripe also collapses retries
+    that got past us (e.g. after the stored record was purged).
+    """
+    key = get_key(request)
+    if not key:
+        return {}
+    return {'idempotency_key': f'{scope}-{request.user.pk}-{key}'}
+
+
+def request_hash(request):
+    body = json.dumps(request.data, sort_keys=True, cls=JSONEncoder)
+    raw = f'{request.method} {request.path}\n{body}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _claim(user, key, fingerprint):
+    """
+    Insert the record for this key, or return the existing one.
+    Returns (record, created).
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            record = IdempotencyRecord.objects.create(
+                user=user, key=key, request_hash=fingerprint, locked_at=now
+            )
+        return record, True
+    except IntegrityError:
+        record = IdempotencyRecord.objects.get(user=user, key=key)
+
+    # The first request died without finishing: let this one take over
+    timeout = getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60)
+    if record.response_status is None and record.locked_at < now - timedelta(seconds=timeout):
+        taken = IdempotencyRecord.objects.filter(
+            pk=record.pk, response_status__isnull=True, locked_at=record.locked_at
+        ).update(locked_at=now)
+        if taken:
+            record.locked_at = now
+            return record, True
+    return record, False
+
+
+def idempotent(view):
+    """Decorator for DRF actions: def action(self, request, *args, **kwargs)."""
+    @wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'error': 'Idempotency-Key is too long.'}, status=400)
+
+        fingerprint = request_hash(request)
+        record, created = _claim(request.user, key, fingerprint)
+
+        if not created:
+            if record.request_hash != fingerprint:
+                return Response(
+                    {'error': 'Idempotency-Key was already used for a different request.'},
+                    status=422,
+                )
+            if record.response_status is None:
+                return Response(
+                    {'error': 'A request with this Idempotency-Key is still in progress.'},
+                    status=409,
+                    headers={'Retry-After': '1'},
+                )
+            return Response(
+                record.response_body,
+                status=record.response_status,
+                headers={'Idempotent-Replayed': 'true'},
+            )
+
+        request.idempotency_key = key
+        try:
+            response = view(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+
+        if response.status_code >= 500:
+            record.delete()
+        else:
+            record.response_status = response.status_code
+            record.response_body = response.data
+            record.save(update_fields=['response_status', 'response_body'])
+        return response
+    return wrapper
+
+
+def purge_expired(hours=None):
+    if hours is None:
+        hours = getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24)
+    cutoff = timezone.now() - timedelta(hours=hours)
+    deleted, _ = IdempotencyRecord.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,99 @@
+"""
+Benchmark the FastList read path against the regular serializers.
+
+    python manage.py bench_fastlist --rows 2000
+
+Seeds the rows inside a transaction that is rolled back at the end, so it
+is safe to run against a development database.
+"""
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from Automotive_app.fastpath import FastList
+from Automotive_app.models import Vehicle, Service, Booking, SparePart, PartOrder
+from Automotive_app.renderers import ORJSONRenderer
+from Automotive_app.serializers import SparePartSerializer, BookingSerializer, PartOrderSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+def best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+class Command(BaseCommand):
+    help = 'Compare serializer.data with the FastList values() path on list endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def seed(self, rows):
+        user = User.objects.create_user('bench_fastlist_user', 'bench@example.com')
+        vehicle = Vehicle.objects.create(owner=user, make='Hyundai', model='Creta', year=2021)
+        services = [Service.objects.create(name=f'Service {i}', description='Inspection ' * 20, base_price='999.00') for i in range(3)]
+
+        parts = SparePart.objects.bulk_create(
+            SparePart(name=f'Part {i}', brand='Bosch', model='Creta', year='2021', description='Ceramic pads ' * 30,
+                      price='2450.00', stock=i % 5, image=f'spare_parts/{i}.jpg')
+            for i in range(rows)
+        )
+        now = timezone.now()
+        bookings = Booking.objects.bulk_create(
+            Booking(user=user, vehicle=vehicle, appointment_time=now - timedelta(hours=i), total_amount='2997.00')
+            for i in range(rows)
+        )
+        Booking.services.through.objects.bulk_create(
+            Booking.services.through(booking_id=b.id, service_id=s.id) for b in bookings for s in services
+        )
+        PartOrder.objects.bulk_create(
+            PartOrder(user=user, part=parts[i], vehicle=vehicle, total_price='4900.00', quantity=2)
+            for i in range(rows)
+        )
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        request = RequestFactory().get('/')
+        renderer = ORJSONRenderer()
+
+        try:
+            with transaction.atomic():
+                self.seed(rows)
+                cases = (
+                    ('spare-parts', SparePart.objects.all(), SparePartSerializer),
+                    ('admin-bookings', Booking.objects.order_by('-appointment_time'), BookingSerializer),
+                    ('admin-part-orders', PartOrder.objects.order_by('-created_at'), PartOrderSerializer),
+                )
+                for label, queryset, serializer_class in cases:
+                    context = {'request': request}
+
+                    def slow():
+                        return serializer_class(queryset.all(), many=True, context=context).data
+
+                    def fast():
+                        mapper = FastList(serializer_class(context=context))
+                        return mapper.convert(mapper.values(queryset.all()))
+
+                    same = renderer.render(slow()) == renderer.render(fast())
+                    slow_time, fast_time = best_of(slow, repeat), best_of(fast, repeat)
+                    self.stdout.write(
+                        f'{label:<18} serializer {slow_time * 1000:8.1f} ms   '
+                        f'fastlist {fast_time * 1000:8.1f} ms   {slow_time / fast_time:5.1f}x   '
+                        f'identical={same}'
+                    )
+                raise Rollback
+        except Rollback:
+            pass
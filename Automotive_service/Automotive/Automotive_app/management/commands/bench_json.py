@@ -0,0 +1,106 @@
+"""
+Benchmark JSON encoding and bytes on the wire for large admin lists.
+
+    python manage.py bench_json --rows 5000
+
+Rows are synthetic but shaped exactly like BookingSerializer and
+PartOrderSerializer output (nested services_details / part_details,
+Decimals, datetimes), so no database is needed.
+"""
+import gzip
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from Automotive_app.renderers import ORJSONRenderer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def booking_rows(n):
+    now = timezone.now()
+    services = [
+        {'id': i, 'name': f'Service {i}', 'description': 'Full synthetic oil change with filter replacement and a 40 point inspection.', 'base_price': f'{999 + i}.00'}
+        for i in range(3)
+    ]
+    return [
+        {
+            'id': i, 'user_username': f'customer{i % 500}', 'vehicle': i % 800,
+            'vehicle_info': '2021 Hyundai Creta', 'services': [0, 1, 2],
+            'services_details': services, 'service_names': [s['name'] for s in services],
+            'appointment_time': now - timedelta(hours=i), 'status': 'CONFIRMED',
+            'total_amount': Decimal('3000.00'), 'final_amount': None,
+            'payment_status': 'PENDING', 'stripe_payment_intent_id': f'pi_3Nk{i:020d}',
+        }
+        for i in range(n)
+    ]
+
+
+def part_order_rows(n):
+    now = timezone.now()
+    return [
+        {
+            'id': i, 'user_username': f'customer{i % 500}', 'part': i % 300,
+            'part_details': {
+                'id': i % 300, 'name': 'Brake Pad Set', 'brand': 'Bosch', 'model': 'Creta', 'year': '2021',
+                'description': 'Ceramic front brake pads with wear sensor. Low dust, quiet operation. ' * 3,
+                'price': '2450.00', 'image': f'http://localhost:8000/media/spare_parts/{i % 300}.jpg',
+                'stock': 12, 'is_available': True,
+            },
+            'vehicle': i % 800, 'phone_number': '9876543210',
+            'shipping_address': '42, MG Road, Bengaluru, Karnataka 560001',
+            'total_price': Decimal('4900.00'), 'payment_status': 'PAID',
+            'stripe_payment_intent_id': f'pi_3Nk{i:020d}', 'status': 'Confirmed',
+            'created_at': now - timedelta(minutes=i), 'quantity': 2,
+        }
+        for i in range(n)
+    ]
+
+
+def best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+class Command(BaseCommand):
+    help = 'Compare DRF JSONRenderer vs ORJSONRenderer and gzip/brotli sizes on admin list payloads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+
+        for label, data in (('admin-bookings', booking_rows(rows)), ('admin-part-orders', part_order_rows(rows))):
+            self.stdout.write(f'\n{label} ({rows} rows)')
+
+            drf, fast = JSONRenderer(), ORJSONRenderer()
+            drf_body, fast_body = drf.render(data), fast.render(data)
+            if drf_body != fast_body:
+                self.stdout.write(self.style.WARNING('  output differs between renderers!'))
+
+            drf_time = best_of(lambda: drf.render(data), repeat)
+            fast_time = best_of(lambda: fast.render(data), repeat)
+            self.stdout.write(f'  encode  JSONRenderer   {drf_time * 1000:8.1f} ms')
+            self.stdout.write(f'  encode  ORJSONRenderer {fast_time * 1000:8.1f} ms  ({drf_time / fast_time:.1f}x)')
+
+            self.stdout.write(f'  bytes   identity       {len(fast_body):>10,}')
+            gz_time = best_of(lambda: gzip.compress(fast_body, compresslevel=6, mtime=0), repeat)
+            gz = gzip.compress(fast_body, compresslevel=6, mtime=0)
+            self.stdout.write(f'  bytes   gzip (6)       {len(gz):>10,}  {gz_time * 1000:6.1f} ms')
+            if brotli is not None:
+                br_time = best_of(lambda: brotli.compress(fast_body, quality=5), repeat)
+                br = brotli.compress(fast_body, quality=5)
+                self.stdout.write(f'  bytes   brotli (5)     {len(br):>10,}  {br_time * 1000:6.1f} ms')
@@ -0,0 +1,43 @@
+"""
+Rebuild the admin search index from scratch.
+
+    python manage.py rebuild_search_index
+    python manage.py rebuild_search_index --kind booking --batch-size 500
+
+Needed once after deploying the index, and after bulk changes that skip
+model signals (queryset.update(), bulk_update, raw SQL).
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from Automotive_app.models import SearchToken
+from Automotive_app.search import DOCUMENTS, index_objects
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the SearchToken index used by /api/admin/search/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=list(DOCUMENTS), action='append')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        for kind in options['kind'] or DOCUMENTS:
+            model, related, *_ = DOCUMENTS[kind]
+            SearchToken.objects.filter(kind=kind).delete()
+
+            count, last_pk = 0, 0
+            while True:
+                batch = list(
+                    model.objects.filter(pk__gt=last_pk).select_related(*related).order_by('pk')[:batch_size]
+                )
+                if not batch:
+                    break
+                with transaction.atomic():
+                    index_objects(kind, batch)
+                count += len(batch)
+                last_pk = batch[-1].pk
+
+            self.stdout.write(f'{kind}: {count} indexed')
@@ -0,0 +1,203 @@
+"""
+Media files (uploads under MEDIA_ROOT), with access checks.
+
+    <img src="/media/spare_parts/brake.jpg">
+    <img src="/media/denting_photos/dent.jpg?token=<access>">
+
+Spare part images are public. Denting photos are private: only the
+request's owner and staff/specialists may load them, authenticated by the
+session or a JWT (header or ?token=, since <img> tags send no headers).
+Anything else under MEDIA_ROOT is not served.
+
+Once access is granted the bytes are sent by the front server when
+MEDIA_SENDFILE_HEADER is set:
+  'X-Accel-Redirect'  nginx; MEDIA_ACCEL_REDIRECT_PREFIX is an `internal`
+                      location aliased to MEDIA_ROOT.
+  'X-Sendfile'        Apache mod_xsendfile / lighttpd; absolute file path.
+Otherwise a FileResponse streams the file itself (sendfile through the WSGI
+server's file_wrapper), with single-range Range requests and ETag /
+Last-Modified revalidation.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+from .authentication import get_token_user
+from .models import DentingRequest
+from .roles import get_roles
+
+PUBLIC_PREFIXES = ('spare_parts/',)
+PRIVATE_PREFIXES = ('denting_photos/',)
+
+_range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _clean(path):
+    """Storage name for a URL path, or None if it tries to leave MEDIA_ROOT."""
+    name = posixpath.normpath(path).lstrip('/')
+    if name.startswith('..') or '\\' in name or '\x00' in name:
+        return None
+    return name
+
+
+def _user(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    return get_token_user(request)
+
+
+def can_view(request, name):
+    """(allowed, private) for a storage name."""
+    if name.startswith(PUBLIC_PREFIXES):
+        return True, False
+    if not name.startswith(PRIVATE_PREFIXES):
+        return False, True
+
+    user = _user(request)
+    if not user.is_authenticated:
+        return False, True
+    owner_ids = set(DentingRequest.objects.filter(damage_image=name).values_list('user_id', flat=True))
+    return bool(owner_ids) and (user.id in owner_ids or bool(get_roles(user))), True
+
+
+# --- RANGES ---
+
+class FileRange:
+    """
+    Read-only view of bytes [start, start + length) of an open file.
+    fileno() is kept so the WSGI server can still sendfile() it; the file is
+    positioned at start and Content-Length bounds the copy.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single 'bytes=' range, None to send it all, or 'invalid'."""
+    match = _range_re.match(header.strip())
+    if not match:
+        return None  # absent, malformed or multi-range: a full 200 is allowed
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        suffix = int(last)
+        if suffix == 0:
+            return 'invalid'
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        return 'invalid'
+    return start, end
+
+
+def _if_range_matches(request, etag, mtime):
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    return parse_http_date_safe(value) == int(mtime)
+
+
+# --- VIEW ---
+
+def _offload(name, full_path):
+    header = getattr(settings, 'MEDIA_SENDFILE_HEADER', None)
+    if not header:
+        return None
+    response = HttpResponse(content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream')
+    if header == 'X-Accel-Redirect':
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name)
+    else:
+        response[header] = full_path
+    return response
+
+
+def serve_media(request, path):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponse(status=405, headers={'Allow': 'GET, HEAD'})
+    name = _clean(path)
+    if name is None:
+        raise Http404
+    allowed, private = can_view(request, name)
+    if not allowed:
+        # Same answer for "not yours" and "does not exist"
+        raise Http404
+
+    try:
+        full_path = default_storage.path(name)
+    except NotImplementedError:
+        # Remote storage (S3 etc.) serves its own URLs
+        return HttpResponseRedirect(default_storage.url(name))
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404
+
+    response = _offload(name, full_path)
+    if response is None:
+        response = _file_response(request, full_path, stat)
+    if private:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'MEDIA_PUBLIC_MAX_AGE', 86400))
+    return response
+
+
+def _file_response(request, full_path, stat):
+    etag = '"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+
+    size = stat.st_size
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and _if_range_matches(request, etag, stat.st_mtime):
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+    if byte_range == 'invalid':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    handle = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(handle)
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(handle, start, end - start + 1), status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
@@ -0,0 +1,120 @@
+import gzip
+import re
+import threading
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'application/xml')
+
+_accept_re = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q=([0-9.]+))?')
+
+
+def _accepted_encodings(header):
+    """Parse Accept-Encoding into {coding: q}."""
+    accepted = {}
+    for part in header.split(','):
+        match = _accept_re.match(part)
+        if match:
+            try:
+                accepted[match.group(1).lower()] = float(match.group(2) or 1)
+            except ValueError:
+                continue
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = _accepted_encodings(header)
+    wildcard = accepted.get('*', 0)
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0
+    for coding in candidates:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _no_transform(response):
+    directives = response.get('Cache-Control', '').split(',')
+    return any(d.strip().lower() == 'no-transform' for d in directives)
+
+
+class CompressionMiddleware:
+    """
+    Brotli/gzip compression for API responses, negotiated from
+    Accept-Encoding. Small bodies (below COMPRESSION_MIN_BYTES), streaming
+    responses and responses marked Cache-Control: no-transform are sent as
+    they are.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_bytes = getattr(settings, 'COMPRESSION_MIN_BYTES', 1024)
+        self.gzip_level = getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)
+        self.brotli_quality = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if _no_transform(response):
+            return response
+        if not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES):
+            return response
+
+        # Vary even when not compressing, so caches keep both variants apart
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < self.min_bytes:
+            return response
+
+        coding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if coding == 'br':
+            compressed = brotli.compress(response.content, quality=self.brotli_quality)
+        elif coding == 'gzip':
+            compressed = gzip.compress(response.content, compresslevel=self.gzip_level, mtime=0)
+        else:
+            return response
+
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = coding
+
+        # The body changed, so a strong ETag no longer applies
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Load shedding: at most MAX_CONCURRENT_REQUESTS requests run at once in
+    this process. Anything above that gets an immediate 503 with
+    Retry-After, instead of queueing until the client or proxy times out.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slots = threading.BoundedSemaphore(getattr(settings, 'MAX_CONCURRENT_REQUESTS', 32))
+        self.retry_after = getattr(settings, 'LOAD_SHED_RETRY_AFTER', 1)
+
+    def __call__(self, request):
+        if not self.slots.acquire(blocking=False):
+            response = JsonResponse({'error': 'Server busy, please retry shortly.'}, status=503)
+            response['Retry-After'] = str(self.retry_after)
+            return response
+        try:
+            return self.get_response(request)
+        finally:
+            self.slots.release()
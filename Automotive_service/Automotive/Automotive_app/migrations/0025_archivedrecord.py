@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-19 01:53
+
+import django.db.models.deletion
+import rest_framework.utils.encoders
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Automotive_app', '0024_partorder_quantity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('booking', 'Booking'), ('part_order', 'Part Order'), ('service_history', 'Service History')], max_length=20)),
+                ('original_id', models.BigIntegerField()),
+                ('occurred_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('payload', models.JSONField(encoder=rest_framework.utils.encoders.JSONEncoder)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'kind', '-occurred_at'], name='archive_user_kind_idx'), models.Index(fields=['kind', '-occurred_at'], name='archive_kind_time_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'original_id'), name='archive_kind_original_uniq')],
+            },
+        ),
+    ]
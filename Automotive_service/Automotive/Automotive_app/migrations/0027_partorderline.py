@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-19 02:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_lines_for_existing_orders(apps, schema_editor):
+    PartOrder = apps.get_model('Automotive_app', 'PartOrder')
+    PartOrderLine = apps.get_model('Automotive_app', 'PartOrderLine')
+
+    batch = []
+    for order in PartOrder.objects.filter(part__isnull=False).iterator(chunk_size=1000):
+        quantity = order.quantity or 1
+        batch.append(PartOrderLine(
+            order_id=order.id,
+            part_id=order.part_id,
+            quantity=quantity,
+            unit_price=order.total_price / quantity,
+            line_total=order.total_price,
+        ))
+        if len(batch) >= 1000:
+            PartOrderLine.objects.bulk_create(batch)
+            batch = []
+    PartOrderLine.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Automotive_app', '0026_updated_at_tombstone'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='partorder',
+            name='part',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='Automotive_app.sparepart'),
+        ),
+        migrations.CreateModel(
+            name='PartOrderLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('line_total', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='Automotive_app.partorder')),
+                ('part', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Automotive_app.sparepart')),
+            ],
+        ),
+        migrations.RunPython(create_lines_for_existing_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Automotive_app', '0029_refundjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='stripe_payment_intent_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='partorder',
+            name='stripe_payment_intent_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-19 02:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Automotive_app', '0030_payment_intent_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='partorder',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Confirmed', 'Confirmed'), ('Shipped', 'Shipped'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled'), ('Expired', 'Expired')], default='Pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='partorder',
+            index=models.Index(fields=['payment_status', 'status', 'created_at'], name='partorder_pay_status_time_idx'),
+        ),
+    ]
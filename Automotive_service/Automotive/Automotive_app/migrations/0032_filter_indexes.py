@@ -0,0 +1,55 @@
+# Generated by Django 6.0 on 2026-10-19 02:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Automotive_app', '0031_partorder_expiry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'appointment_time'], name='booking_status_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['payment_status', 'appointment_time'], name='booking_paystatus_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['appointment_time'], name='booking_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dentingrequest',
+            index=models.Index(fields=['status', 'created_at'], name='denting_status_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dentingrequest',
+            index=models.Index(fields=['created_at'], name='denting_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='partorder',
+            index=models.Index(fields=['status', 'created_at'], name='partorder_status_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='partorder',
+            index=models.Index(fields=['created_at'], name='partorder_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicehistory',
+            index=models.Index(fields=['user', 'completion_date'], name='history_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicehistory',
+            index=models.Index(fields=['vehicle', 'completion_date'], name='history_vehicle_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicehistory',
+            index=models.Index(fields=['completion_date'], name='history_completion_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-19 02:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_roles_for_existing_users(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    UserRole = apps.get_model('Automotive_app', 'UserRole')
+
+    batch = []
+    users = User.objects.select_related('profile').iterator(chunk_size=1000)
+    for user in users:
+        profile = getattr(user, 'profile', None)
+        flags = {
+            'staff': user.is_staff,
+            'mechanic': profile is not None and profile.is_mechanic,
+            'billing': profile is not None and profile.is_billing,
+            'ecommerce': profile is not None and profile.is_ecommerce,
+        }
+        batch.extend(UserRole(user_id=user.id, role=role) for role, held in flags.items() if held)
+        if len(batch) >= 1000:
+            UserRole.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    UserRole.objects.bulk_create(batch, ignore_conflicts=True)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Automotive_app', '0033_searchtoken'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserRole',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('staff', 'Staff'), ('mechanic', 'Mechanic'), ('billing', 'Billing'), ('ecommerce', 'E-commerce')], max_length=20)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='roles', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['role', 'user'], name='userrole_role_user_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'role'), name='userrole_user_role_uniq')],
+            },
+        ),
+        migrations.RunPython(create_roles_for_existing_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.0 on 2026-10-19 02:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Automotive_app', '0034_userrole'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='interval_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='interval_km',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ServiceReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cycle_start', models.DateTimeField()),
+                ('due_date', models.DateField()),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Automotive_app.service')),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='Automotive_app.vehicle')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['sent_at', 'id'], name='reminder_unsent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('vehicle', 'service', 'cycle_start'), name='reminder_cycle_uniq')],
+            },
+        ),
+    ]
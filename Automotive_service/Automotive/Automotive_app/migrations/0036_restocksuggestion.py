@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-19 02:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Automotive_app', '0035_service_reminders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestockSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.PositiveIntegerField()),
+                ('daily_demand', models.FloatField()),
+                ('days_of_cover', models.FloatField(blank=True, null=True)),
+                ('reorder_quantity', models.PositiveIntegerField(default=0)),
+                ('computed_at', models.DateTimeField()),
+                ('part', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='restock', to='Automotive_app.sparepart')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['days_of_cover'], name='restock_cover_idx')],
+            },
+        ),
+    ]
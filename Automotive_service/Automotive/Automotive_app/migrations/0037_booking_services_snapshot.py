@@ -0,0 +1,48 @@
+# Generated by Django 6.0 on 2026-10-19 02:21
+
+import rest_framework.utils.encoders
+from django.db import migrations, models
+
+
+def snapshot_existing_bookings(apps, schema_editor):
+    # Past bookings only have today's catalog prices to go on; total_amount
+    # is the bill that was set at the time and is left alone
+    Booking = apps.get_model('Automotive_app', 'Booking')
+    Through = Booking.services.through
+
+    last_pk = 0
+    while True:
+        ids = list(Booking.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:1000])
+        if not ids:
+            break
+        last_pk = ids[-1]
+
+        snapshots = {pk: [] for pk in ids}
+        rows = (
+            Through.objects.filter(booking_id__in=ids).order_by('booking_id', 'service_id')
+            .values_list('booking_id', 'service_id', 'service__name', 'service__description', 'service__base_price')
+        )
+        for booking_id, pk, name, description, base_price in rows:
+            snapshots[booking_id].append({
+                'id': pk, 'name': name, 'description': description, 'base_price': str(base_price),
+            })
+        Booking.objects.bulk_update(
+            [Booking(pk=pk, services_snapshot=snapshot) for pk, snapshot in snapshots.items()],
+            ['services_snapshot'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Automotive_app', '0036_restocksuggestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='services_snapshot',
+            field=models.JSONField(blank=True, default=list, encoder=rest_framework.utils.encoders.JSONEncoder),
+        ),
+        migrations.RunPython(snapshot_existing_bookings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 6.0 on 2026-10-19 02:23
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+SOURCE_BOOKING = re.compile(r'Booking #(\d+)')
+# What the completion signal wrote when a booking had no services
+PLACEHOLDER = 'general service'
+
+
+def items_from_text(apps, schema_editor):
+    """
+    Split services_rendered into items. Entries auto-generated from a booking
+    take the booked services and prices from its services_snapshot; the rest
+    are matched to the catalog by name and have no price.
+    """
+    Service = apps.get_model('Automotive_app', 'Service')
+    Booking = apps.get_model('Automotive_app', 'Booking')
+    ServiceHistory = apps.get_model('Automotive_app', 'ServiceHistory')
+    ServiceHistoryItem = apps.get_model('Automotive_app', 'ServiceHistoryItem')
+
+    catalog = {}
+    for pk, name in Service.objects.order_by('-pk').values_list('pk', 'name'):
+        catalog[name.strip().lower()] = pk  # lowest pk wins on duplicate names
+    in_catalog = set(catalog.values())
+
+    last_pk = 0
+    while True:
+        rows = list(
+            ServiceHistory.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', 'services_rendered', 'admin_notes')[:1000]
+        )
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+
+        sources = {}
+        for pk, _, notes in rows:
+            match = SOURCE_BOOKING.search(notes or '')
+            if match:
+                sources[pk] = int(match.group(1))
+        snapshots = dict(
+            Booking.objects.filter(pk__in=set(sources.values())).values_list('pk', 'services_snapshot')
+        )
+
+        items = []
+        for pk, rendered, _ in rows:
+            booking_id = sources.get(pk)
+            if snapshots.get(booking_id):
+                items.extend(
+                    ServiceHistoryItem(
+                        history_id=pk, booking_id=booking_id, name=entry['name'][:100], price=entry['base_price'],
+                        service_id=entry['id'] if entry['id'] in in_catalog else None,
+                    )
+                    for entry in snapshots[booking_id]
+                )
+                continue
+            for name in (rendered or '').split(','):
+                name = name.strip()
+                service_id = catalog.get(name.lower())
+                if not name or (service_id is None and name.lower() == PLACEHOLDER):
+                    continue
+                items.append(ServiceHistoryItem(
+                    history_id=pk, booking_id=booking_id if booking_id in snapshots else None,
+                    name=name[:100], service_id=service_id,
+                ))
+        ServiceHistoryItem.objects.bulk_create(items, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Automotive_app', '0037_booking_services_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceHistoryItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('booking', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='Automotive_app.booking')),
+                ('history', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='Automotive_app.servicehistory')),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='Automotive_app.service')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['service', 'history'], name='historyitem_service_idx')],
+            },
+        ),
+        migrations.RunPython(items_from_text, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 02:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Automotive_app', '0038_servicehistoryitem'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['vehicle', 'appointment_time'], name='booking_vehicle_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='partorder',
+            index=models.Index(fields=['vehicle', 'created_at'], name='partorder_vehicle_time_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-19 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Automotive_app', '0039_vehicle_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dentingrequest',
+            name='damage_image',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='denting_photos/'),
+        ),
+    ]
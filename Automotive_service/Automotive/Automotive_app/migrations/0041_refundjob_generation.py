@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-19 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Automotive_app', '0040_denting_image_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refundjob',
+            name='generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.core.validators import MinValueValidator
+from rest_framework.utils.encoders import JSONEncoder
 
 # 1. Vehicle Model
 class Vehicle(models.Model):
@@ -20,6 +21,9 @@ class Service(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
     base_price = models.DecimalField(max_digits=8, decimal_places=2)
+    # Recommended repeat interval, whichever comes first (empty = no reminders)
+    interval_days = models.PositiveIntegerField(null=True, blank=True)
+    interval_km = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return self.name
@@ -38,6 +42,7 @@ class Booking(models.Model):
         ('PENDING', 'Pending'),
         ('PAID', 'Paid'),
         ('FAILED', 'Failed'),
+        ('REFUND_PENDING', 'Refund Pending'),
         ('REFUNDED', 'Refunded'),
         ('COMPLETED', 'Completed')
     )
@@ -49,6 +54,9 @@ class Booking(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE)
     services = models.ManyToManyField(Service)
+    # [{id, name, description, base_price}] as booked; kept in sync with
+    # `services` by signals.snapshot_booking_services so reads skip the M2M
+    services_snapshot = models.JSONField(default=list, blank=True, encoder=JSONEncoder)
     appointment_time = models.DateTimeField()
     status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='PENDING')
     
@@ -58,22 +66,60 @@ class Booking(models.Model):
     final_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True) 
     
     # Stripe Fields (Replaced Razorpay)
-    payment_status = models.CharField(max_length=10, choices=PAYMENT_STATUS_CHOICES, default='PENDING')
-    stripe_payment_intent_id = models.CharField(max_length=255, null=True, blank=True)
+    payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='PENDING')
+    stripe_payment_intent_id = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    # Kept so a retried "pay" reuses the open intent instead of creating another
+    stripe_client_secret = models.CharField(max_length=255, null=True, blank=True)
+    stripe_intent_amount = models.PositiveIntegerField(null=True, blank=True)
+    stripe_intent_created_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Admin filters (Automotive_app.filters), newest first
+            models.Index(fields=['status', 'appointment_time'], name='booking_status_time_idx'),
+            models.Index(fields=['payment_status', 'appointment_time'], name='booking_paystatus_time_idx'),
+            models.Index(fields=['appointment_time'], name='booking_time_idx'),
+            # Vehicle timeline (Automotive_app.timeline)
+            models.Index(fields=['vehicle', 'appointment_time'], name='booking_vehicle_time_idx'),
+        ]
 
     def __str__(self):
         return f"Booking {self.id} - {self.user.username} ({self.status})"
 
+    def build_services_snapshot(self):
+        """
+        Snapshot of the current services. Entries already in the snapshot keep
+        the price they were booked at; new services get today's base_price.
+        """
+        booked = {entry['id']: entry for entry in self.services_snapshot or []}
+        snapshot = []
+        for pk, name, description, base_price in self.services.order_by('pk').values_list(
+            'pk', 'name', 'description', 'base_price'
+        ):
+            snapshot.append(booked.get(pk) or {
+                'id': pk, 'name': name, 'description': description, 'base_price': str(base_price),
+            })
+        return snapshot
+
 # 4. Denting / Painting Request
 class DentingRequest(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     description = models.TextField()
-    damage_image = models.ImageField(upload_to='denting_photos/', null=True, blank=True)
+    # Indexed for the access check in Automotive_app.media
+    damage_image = models.ImageField(upload_to='denting_photos/', null=True, blank=True, db_index=True)
     vehicle_make = models.CharField(max_length=50)
     vehicle_model = models.CharField(max_length=50)
     status = models.CharField(max_length=20, default='Pending Review')
     created_at = models.DateTimeField(auto_now_add=True)
     estimated_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='denting_status_time_idx'),
+            models.Index(fields=['created_at'], name='denting_created_idx'),
+        ]
     
 
 # 5. Spare Parts Catalog
@@ -106,11 +152,12 @@ class SparePart(models.Model):
 
 # 6. Part Orders
 class PartOrder(models.Model):
-    ORDER_STATUS = (('Pending', 'Pending'), ('Confirmed', 'Confirmed'), ('Shipped', 'Shipped'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled'))
-    PAYMENT_STATUS = (('PENDING', 'Pending'), ('PAID', 'Paid'), ('FAILED', 'Failed'), ('REFUNDED', 'Refunded'))
+    ORDER_STATUS = (('Pending', 'Pending'), ('Confirmed', 'Confirmed'), ('Shipped', 'Shipped'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled'), ('Expired', 'Expired'))
+    PAYMENT_STATUS = (('PENDING', 'Pending'), ('PAID', 'Paid'), ('FAILED', 'Failed'), ('REFUND_PENDING', 'Refund Pending'), ('REFUNDED', 'Refunded'))
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    part = models.ForeignKey(SparePart, on_delete=models.CASCADE)
+    # Single-part orders keep the part here; cart orders list their parts in lines
+    part = models.ForeignKey(SparePart, on_delete=models.CASCADE, null=True, blank=True)
     quantity = models.PositiveIntegerField(default=1)
 
     vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, null=True)
@@ -120,9 +167,33 @@ class PartOrder(models.Model):
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS, default='PENDING')
     
     # Stripe Field
-    stripe_payment_intent_id = models.CharField(max_length=255, null=True, blank=True)
+    stripe_payment_intent_id = models.CharField(max_length=255, null=True, blank=True, db_index=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Stale unpaid checkouts: payment_status='PENDING' AND status='Pending' AND created_at < cutoff
+            models.Index(fields=['payment_status', 'status', 'created_at'], name='partorder_pay_status_time_idx'),
+            models.Index(fields=['status', 'created_at'], name='partorder_status_time_idx'),
+            models.Index(fields=['created_at'], name='partorder_created_idx'),
+            models.Index(fields=['vehicle', 'created_at'], name='partorder_vehicle_time_idx'),
+        ]
+
+    def describe_items(self):
+        """'2x Brake Pad, 1x Wiper Blade' for emails."""
+        return ", ".join(f"{line.quantity}x {line.part.name}" for line in self.lines.select_related('part'))
+
+class PartOrderLine(models.Model):
+    order = models.ForeignKey(PartOrder, on_delete=models.CASCADE, related_name='lines')
+    part = models.ForeignKey(SparePart, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    line_total = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.quantity}x {self.part_id} (Order {self.order_id})"
 
 # 7. Service History (The Logbook)
 class ServiceHistory(models.Model):
@@ -133,11 +204,38 @@ class ServiceHistory(models.Model):
     odometer_reading = models.IntegerField(default=0)
     completion_date = models.DateTimeField(auto_now_add=True)
     admin_notes = models.TextField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'completion_date'], name='history_user_time_idx'),
+            models.Index(fields=['vehicle', 'completion_date'], name='history_vehicle_time_idx'),
+            models.Index(fields=['completion_date'], name='history_completion_idx'),
+        ]
 
     def __str__(self):
         return f"{self.vehicle.model} - {self.completion_date.date()}"
 
 
+class ServiceHistoryItem(models.Model):
+    """One rendered service of a logbook entry (services_rendered is the display text; edits to it re-sync the items)."""
+    history = models.ForeignKey(ServiceHistory, on_delete=models.CASCADE, related_name='items')
+    # Null when the service was removed from the catalog or the name matched none
+    service = models.ForeignKey(Service, on_delete=models.SET_NULL, null=True, blank=True)
+    booking = models.ForeignKey(Booking, on_delete=models.SET_NULL, null=True, blank=True)
+    name = models.CharField(max_length=100)
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # "Which vehicles had service X" without touching the logbook text
+            models.Index(fields=['service', 'history'], name='historyitem_service_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} (History {self.history_id})"
+
+
 # --- AUTOMATION SIGNALS ---
 
 @receiver(post_save, sender=Booking)
@@ -158,12 +256,11 @@ def create_service_history_on_completion(sender, instance, **kwargs):
             total_paid=actual_cost
         ).exists():
             
-            # Use a simpler way to join services if signal fires before M2M is ready
-            # Note: In production, it's better to trigger this when payment is PAID
-            service_list = instance.services.all()
-            service_names = ", ".join([s.name for s in service_list]) if service_list else "General Service"
+            # Services and prices as booked (Booking.services_snapshot)
+            snapshot = instance.services_snapshot or []
+            service_names = ", ".join(entry['name'] for entry in snapshot) if snapshot else "General Service"
             
-            ServiceHistory.objects.create(
+            history = ServiceHistory.objects.create(
                 user=instance.user,
                 vehicle=instance.vehicle,
                 services_rendered=service_names,
@@ -171,6 +268,17 @@ def create_service_history_on_completion(sender, instance, **kwargs):
                 odometer_reading=0, 
                 admin_notes=f"Auto-generated from Booking #{instance.id}. Billing finalized."
             )
+            in_catalog = set(Service.objects.filter(pk__in=[e['id'] for e in snapshot]).values_list('pk', flat=True))
+            ServiceHistoryItem.objects.bulk_create([
+                ServiceHistoryItem(
+                    history=history,
+                    service_id=entry['id'] if entry['id'] in in_catalog else None,
+                    booking=instance,
+                    name=entry['name'],
+                    price=entry['base_price'],
+                )
+                for entry in snapshot
+            ])
 
 # Add these fields to handle the staff roles
 class UserProfile(models.Model):
@@ -190,4 +298,187 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+    instance.profile.save()
+
+# 8. Archive (cold storage for old orders, bookings and history)
+class ArchivedRecord(models.Model):
+    KIND_CHOICES = (
+        ('booking', 'Booking'),
+        ('part_order', 'Part Order'),
+        ('service_history', 'Service History'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    original_id = models.BigIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    occurred_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    # Serializer output at archive time, so the history endpoint returns
+    # the same shape as the live endpoints did
+    payload = models.JSONField(encoder=JSONEncoder)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'original_id'], name='archive_kind_original_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'kind', '-occurred_at'], name='archive_user_kind_idx'),
+            models.Index(fields=['kind', '-occurred_at'], name='archive_kind_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.original_id} (archived)"
+
+
+# 9. Tombstones (deletions, for "changes since" polling)
+class Tombstone(models.Model):
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    # Owner of the deleted row; plain id because the user may be gone too
+    user_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'deleted_at'], name='tombstone_model_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} deleted"
+
+
+# 10. Idempotency keys (first response for each client retry key)
+class IdempotencyRecord(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    # Hash of method, path and body; the same key with another request is rejected
+    request_hash = models.CharField(max_length=64)
+    # Null while the first request is still running
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=JSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    locked_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.user_id})"
+
+
+# 11. Refund jobs (one per cancelled paid order or booking, processed by Celery)
+class RefundJob(models.Model):
+    STATUS_CHOICES = (
+        ('QUEUED', 'Queued'),
+        ('PROCESSING', 'Processing'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('FAILED', 'Failed'),
+    )
+
+    order = models.OneToOneField(PartOrder, on_delete=models.CASCADE, null=True, blank=True, related_name='refund_job')
+    booking = models.OneToOneField(Booking, on_delete=models.CASCADE, null=True, blank=True, related_name='refund_job')
+    stripe_payment_intent_id = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='QUEUED')
+    attempts = models.PositiveIntegerField(default=0)
+    # Bumped each time a FAILED job starts over; part of the Stripe idempotency key
+    generation = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    stripe_refund_id = models.CharField(max_length=255, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='refundjob_status_time_idx'),
+        ]
+
+    @property
+    def target(self):
+        return self.order if self.order_id else self.booking
+
+    def __str__(self):
+        return f"Refund {self.stripe_payment_intent_id} ({self.status})"
+
+
+# 12. Admin search index (token -> object, kept current by Automotive_app.search)
+class SearchToken(models.Model):
+    token = models.CharField(max_length=64)
+    kind = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['token', 'kind'], name='searchtoken_token_idx'),
+            models.Index(fields=['kind', 'object_id'], name='searchtoken_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.token} -> {self.kind} #{self.object_id}"
+
+
+# 13. Role index (one row per role a user holds, mirrors is_staff + profile flags)
+class UserRole(models.Model):
+    ROLE_CHOICES = (
+        ('staff', 'Staff'),
+        ('mechanic', 'Mechanic'),
+        ('billing', 'Billing'),
+        ('ecommerce', 'E-commerce'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='roles')
+    role = models.CharField(max_length=20, choices=ROLE_CHOICES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'role'], name='userrole_user_role_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['role', 'user'], name='userrole_role_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.role}"
+
+
+# 14. Service reminders (one per vehicle, service and service cycle)
+class ServiceReminder(models.Model):
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='reminders')
+    service = models.ForeignKey(Service, on_delete=models.CASCADE)
+    # Completion of the service this reminder follows up; a new service starts a new cycle
+    cycle_start = models.DateTimeField()
+    due_date = models.DateField()
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['vehicle', 'service', 'cycle_start'], name='reminder_cycle_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['sent_at', 'id'], name='reminder_unsent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.service} due {self.due_date} ({self.vehicle})"
+
+
+# 15. Restock suggestions (rewritten nightly by Automotive_app.forecast)
+class RestockSuggestion(models.Model):
+    part = models.OneToOneField(SparePart, on_delete=models.CASCADE, related_name='restock')
+    stock = models.PositiveIntegerField()  # stock when the forecast ran
+    daily_demand = models.FloatField()  # smoothed units per day
+    # Days until stock runs out at that rate; empty when there is no demand
+    days_of_cover = models.FloatField(null=True, blank=True)
+    reorder_quantity = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['days_of_cover'], name='restock_cover_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.part_id}: reorder {self.reorder_quantity}"
@@ -0,0 +1,140 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+import stripe
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, When, Value
+from django.utils import timezone
+
+from .models import PartOrder, PartOrderLine, SparePart
+from .realtime import announce, announce_ids
+
+logger = logging.getLogger(__name__)
+stripe.api_key = getattr(settings, 'STRIPE_SECRET_KEY', None)
+
+
+def take_stock(quantities):
+    """
+    Decrement stock for {part_id: quantity} with one locking read and one
+    UPDATE. Must run inside a transaction.
+    """
+    parts = SparePart.objects.select_for_update().filter(pk__in=quantities).only('id', 'stock')
+    new_stock = {}
+    for part in parts:
+        left = part.stock - quantities[part.id]
+        if left < 0:
+            # Paid for but oversold since checkout; keep the order, flag it
+            logger.warning(f"Part {part.id} oversold by {-left} units")
+        new_stock[part.id] = max(left, 0)
+
+    if new_stock:
+        SparePart.objects.filter(pk__in=new_stock).update(stock=Case(
+            *[When(pk=pk, then=Value(stock)) for pk, stock in new_stock.items()],
+            output_field=models.PositiveIntegerField(),
+        ))
+
+
+def mark_orders_paid(order_ids):
+    """
+    Mark orders PAID and take the stock of all their lines atomically.
+    Orders that are already paid (or refunded) are skipped, so repeated
+    verification never takes stock twice. bulk_update sends no post_save,
+    so the status events are published here. Returns the orders that changed.
+    """
+    with transaction.atomic():
+        orders = list(
+            PartOrder.objects.select_for_update()
+            .filter(pk__in=order_ids, payment_status__in=['PENDING', 'FAILED'])
+        )
+        if not orders:
+            return []
+
+        quantities = defaultdict(int)
+        for part_id, quantity in PartOrderLine.objects.filter(order__in=orders).values_list('part_id', 'quantity'):
+            quantities[part_id] += quantity
+        take_stock(quantities)
+
+        now = timezone.now()
+        for order in orders:
+            order.payment_status = 'PAID'
+            order.updated_at = now
+        PartOrder.objects.bulk_update(orders, ['payment_status', 'updated_at'])
+        announce(orders)
+
+    return orders
+
+
+def stale_pending_orders(cutoff):
+    """Unpaid checkouts older than cutoff (served by partorder_pay_status_time_idx)."""
+    return PartOrder.objects.filter(payment_status='PENDING', status='Pending', created_at__lt=cutoff)
+
+
+# Intent states in which the customer cannot be charged any more
+UNCHARGEABLE = ('canceled', 'requires_payment_method')
+
+
+def _cancel_intent(client, intent_id):
+    """
+    Cancel an order's PaymentIntent. Returns False if it cannot be cancelled:
+    the customer paid after all (the reconciler will mark it PAID), or the
+    payment is still settling ('processing'); the order is then left for a
+    later run.
+    """
+    try:
+        client.PaymentIntent.cancel(intent_id)
+    except stripe.InvalidRequestError as e:
+        if getattr(e, 'code', None) == 'payment_intent_unexpected_state':
+            intent = client.PaymentIntent.retrieve(intent_id)
+            return intent['status'] in UNCHARGEABLE
+        if getattr(e, 'code', None) != 'resource_missing':
+            raise
+    return True
+
+
+def expire_stale_orders(hours=None, batch_size=200, max_batches=10, client=stripe):
+    """
+    Cancel the PaymentIntents of abandoned checkouts and mark the orders
+    Expired, batch_size at a time. Returns (expired, skipped).
+    """
+    if hours is None:
+        hours = getattr(settings, 'PART_ORDER_EXPIRY_HOURS', 24)
+    cutoff = timezone.now() - timedelta(hours=hours)
+    expired, skipped = 0, []
+
+    for _ in range(max_batches):
+        batch = list(
+            stale_pending_orders(cutoff).exclude(pk__in=skipped)
+            .order_by('created_at')
+            .values_list('id', 'stripe_payment_intent_id')[:batch_size]
+        )
+        if not batch:
+            break
+
+        cancelled = []
+        for order_id, intent_id in batch:
+            try:
+                if not intent_id or _cancel_intent(client, intent_id):
+                    cancelled.append(order_id)
+                else:
+                    skipped.append(order_id)
+            except stripe.StripeError as e:
+                logger.error(f"Could not cancel intent {intent_id} of order {order_id}: {str(e)}")
+                skipped.append(order_id)
+
+        # Re-check the status so an order paid meanwhile is left alone
+        with transaction.atomic():
+            to_expire = list(
+                PartOrder.objects.select_for_update()
+                .filter(pk__in=cancelled, payment_status='PENDING', status='Pending')
+                .values_list('id', flat=True)
+            )
+            expired += PartOrder.objects.filter(pk__in=to_expire).update(
+                status='Expired', payment_status='FAILED', updated_at=timezone.now()
+            )
+            announce_ids(PartOrder, to_expire)
+        if len(batch) < batch_size:
+            break
+
+    return expired, skipped
@@ -0,0 +1,237 @@
+"""
+Real-time status push over Server-Sent Events.
+
+    const events = new EventSource(`/api/events/?token=${access}`)
+    events.addEventListener('booking', e => ...)
+
+When a Booking, PartOrder or DentingRequest changes status (or payment
+status), an event is published to the owner's channel after the
+transaction commits. Every connected client of that user receives it.
+
+REALTIME_BROKER_URL picks the broker:
+  redis://...  Redis pub/sub, fans out across all processes. The default
+               (REDIS_URL, else a local Redis), so events published by a
+               Celery worker reach the web processes in development too.
+  memory://    In-process only: events from other processes (workers,
+               other web servers) never arrive. Single-process use only.
+Publishing is best effort: a broker outage is logged and never fails the
+request or task that changed the row.
+
+Serve the stream from the ASGI app (Automotive.asgi) so an open connection
+does not hold a worker thread.
+"""
+import asyncio
+import json
+import logging
+import threading
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse, StreamingHttpResponse
+
+from .authentication import get_token_user
+from .models import Booking, PartOrder, DentingRequest
+
+logger = logging.getLogger(__name__)
+
+def channel_name(user_id):
+    return f'events:user:{user_id}'
+
+
+# --- BROKERS ---
+
+class InMemoryBroker:
+    """Single-process broker: one asyncio queue per open stream."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, user_id, message):
+        with self._lock:
+            targets = list(self._subscribers.get(user_id, ()))
+        for loop, queue in targets:
+            loop.call_soon_threadsafe(self._deliver, queue, message)
+
+    @staticmethod
+    def _deliver(queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass  # slow client, drop rather than grow without bound
+
+    @asynccontextmanager
+    async def subscribe(self, user_id):
+        entry = (asyncio.get_running_loop(), asyncio.Queue(maxsize=100))
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(entry)
+        try:
+            yield _MemorySubscription(entry[1])
+        finally:
+            with self._lock:
+                self._subscribers[user_id].discard(entry)
+                if not self._subscribers[user_id]:
+                    del self._subscribers[user_id]
+
+
+class _MemorySubscription:
+    def __init__(self, queue):
+        self.queue = queue
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RedisBroker:
+    """Redis pub/sub broker shared by every process."""
+
+    def __init__(self, url):
+        self.url = url
+        self._client = None
+
+    def publish(self, user_id, message):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(channel_name(user_id), message)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id):
+        import redis.asyncio as aioredis
+
+        client = aioredis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(channel_name(user_id))
+        try:
+            yield _RedisSubscription(pubsub)
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+            await client.aclose()
+
+
+class _RedisSubscription:
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def get(self, timeout):
+        message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if message is None:
+            return None
+        data = message['data']
+        return data.decode() if isinstance(data, bytes) else data
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        url = getattr(settings, 'REALTIME_BROKER_URL', 'redis://localhost:6379/0')
+        _broker = InMemoryBroker() if url.startswith('memory://') else RedisBroker(url)
+    return _broker
+
+
+def publish(user_id, event):
+    try:
+        get_broker().publish(user_id, json.dumps(event))
+    except Exception as e:
+        logger.error(f"Could not publish {event.get('type')} event for user {user_id}: {str(e)}")
+
+
+# --- CHANGE DETECTION ---
+
+# model -> (event type, tracked fields)
+TRACKED = {
+    Booking: ('booking', ('status', 'payment_status')),
+    PartOrder: ('part_order', ('status', 'payment_status')),
+    DentingRequest: ('denting', ('status',)),
+}
+
+
+@receiver(post_init, sender=Booking)
+@receiver(post_init, sender=PartOrder)
+@receiver(post_init, sender=DentingRequest)
+def remember_tracked_fields(sender, instance, **kwargs):
+    # __dict__ so a deferred field is never loaded just for this
+    fields = TRACKED[sender][1]
+    instance._tracked = tuple(instance.__dict__.get(f) for f in fields)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_save, sender=PartOrder)
+@receiver(post_save, sender=DentingRequest)
+def push_status_change(sender, instance, created, **kwargs):
+    event_type, fields = TRACKED[sender]
+    current = tuple(instance.__dict__.get(f) for f in fields)
+    previous = getattr(instance, '_tracked', None)
+    instance._tracked = current
+
+    if created or current == previous:
+        return
+
+    event = {'type': event_type, 'id': instance.pk, **dict(zip(fields, current))}
+    user_id = instance.user_id
+    transaction.on_commit(lambda: publish(user_id, event))
+
+
+def announce(objects):
+    """
+    Publish the current status of rows written with update() or
+    bulk_update(), which send no post_save. Each object needs user_id and
+    the tracked fields loaded. Events go out after the transaction commits.
+    """
+    events = []
+    for obj in objects:
+        event_type, fields = TRACKED[type(obj)]
+        obj._tracked = tuple(getattr(obj, f) for f in fields)
+        events.append((obj.user_id, {'type': event_type, 'id': obj.pk, **dict(zip(fields, obj._tracked))}))
+    if not events:
+        return
+
+    def send():
+        for user_id, event in events:
+            publish(user_id, event)
+    transaction.on_commit(send)
+
+
+def announce_ids(model, ids):
+    """announce() for rows known only by id, e.g. after queryset.update()."""
+    ids = list(ids)
+    if ids:
+        fields = TRACKED[model][1]
+        announce(model.objects.filter(pk__in=ids).only('id', 'user_id', *fields))
+
+
+# --- STREAM VIEW ---
+
+async def _event_stream(user_id):
+    heartbeat = getattr(settings, 'REALTIME_HEARTBEAT_SECONDS', 15)
+    async with get_broker().subscribe(user_id) as subscription:
+        yield ': connected\n\n'
+        while True:
+            message = await subscription.get(timeout=heartbeat)
+            if message is None:
+                yield ': ping\n\n'  # keeps proxies from closing an idle stream
+                continue
+            event_type = json.loads(message).get('type', 'message')
+            yield f'event: {event_type}\ndata: {message}\n\n'
+
+
+async def events_stream(request):
+    user = await sync_to_async(get_token_user)(request)
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+
+    response = StreamingHttpResponse(_event_stream(user.id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: flush every event
+    return response
@@ -0,0 +1,153 @@
+"""
+Stripe reconciliation.
+
+Pages through every PaymentIntent Stripe created in a time window (one list
+call per 100 intents) and corrects local Booking/PartOrder rows still marked
+PENDING or FAILED: succeeded intents become PAID (orders take their stock
+through mark_orders_paid), canceled intents become FAILED. A succeeded
+intent of a booking or order that was cancelled or expired meanwhile is not
+marked PAID; its money goes back through queue_refund. Local rows are found
+with one indexed stripe_payment_intent_id__in lookup per chunk, and bookings
+are written back with bulk_update. Rows written in bulk send no post_save,
+so their status events are published with realtime.announce (the search
+index holds no status, hit subtitles are rendered from the live rows).
+
+The Stripe client is a parameter so tests can pass a stub with the same
+PaymentIntent.list(...).auto_paging_iter() shape.
+"""
+import logging
+from datetime import timedelta
+from itertools import islice
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Booking, PartOrder
+from .orders import mark_orders_paid
+from .realtime import announce, announce_ids
+from .refunds import queue_refund
+from .tasks import send_async_email
+
+logger = logging.getLogger(__name__)
+stripe.api_key = getattr(settings, 'STRIPE_SECRET_KEY', None)
+
+OPEN = ['PENDING', 'FAILED']
+# Closed before the payment landed: refund instead of marking PAID
+CLOSED_BOOKING = ['CANCELLED']
+CLOSED_ORDER = ['Cancelled', 'Expired']
+CHUNK_SIZE = 500
+
+
+def iter_intents(client, since, until=None):
+    created = {'gte': int(since.timestamp())}
+    if until is not None:
+        created['lte'] = int(until.timestamp())
+    return client.PaymentIntent.list(created=created, limit=100).auto_paging_iter()
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _refund_closed(model, ids):
+    """Queue refunds for closed rows whose intent succeeded after all."""
+    with transaction.atomic():
+        rows = list(model.objects.select_for_update().filter(pk__in=ids, payment_status__in=OPEN))
+        for obj in rows:
+            queue_refund(obj)
+            obj.save(update_fields=['payment_status', 'updated_at'])
+    if rows:
+        logger.warning(f"Stripe reconciliation: refunding {len(rows)} closed {model._meta.verbose_name_plural} paid after closing")
+    return len(rows)
+
+
+def _reconcile_bookings(paid_ids, failed_ids, now):
+    bookings = list(
+        Booking.objects.filter(stripe_payment_intent_id__in=paid_ids | failed_ids, payment_status__in=OPEN)
+        .select_related('user')
+        .only('id', 'status', 'payment_status', 'stripe_payment_intent_id', 'user_id', 'user__email')
+    )
+    changed, newly_paid, to_refund = [], [], []
+    for booking in bookings:
+        new_status = 'PAID' if booking.stripe_payment_intent_id in paid_ids else 'FAILED'
+        if booking.payment_status == new_status:
+            continue
+        if new_status == 'PAID' and booking.status in CLOSED_BOOKING:
+            to_refund.append(booking.pk)
+            continue
+        booking.payment_status = new_status
+        booking.updated_at = now
+        changed.append(booking)
+        if new_status == 'PAID':
+            newly_paid.append(booking)
+
+    Booking.objects.bulk_update(changed, ['payment_status', 'updated_at'])
+    announce(changed)
+    refunded = _refund_closed(Booking, to_refund) if to_refund else 0
+    for booking in newly_paid:
+        send_async_email.delay(
+            "Service Payment Confirmed",
+            f"Payment for Booking #{booking.id} was successful. See you at the workshop!",
+            [booking.user.email]
+        )
+    return len(changed) + refunded
+
+
+def _reconcile_orders(paid_ids, failed_ids, now):
+    rows = PartOrder.objects.filter(
+        stripe_payment_intent_id__in=paid_ids | failed_ids, payment_status__in=OPEN
+    ).values_list('id', 'stripe_payment_intent_id', 'status', 'payment_status')
+
+    to_pay, to_fail, to_refund = [], [], []
+    for pk, intent_id, order_status, payment_status in rows:
+        if intent_id in paid_ids:
+            (to_refund if order_status in CLOSED_ORDER else to_pay).append(pk)
+        elif payment_status != 'FAILED':
+            to_fail.append(pk)
+
+    paid = mark_orders_paid(to_pay) if to_pay else []
+    refunded = _refund_closed(PartOrder, to_refund) if to_refund else 0
+    failed = PartOrder.objects.filter(pk__in=to_fail, payment_status='PENDING').update(
+        payment_status='FAILED', updated_at=now
+    )
+    if failed:
+        announce_ids(PartOrder, to_fail)
+    for order in PartOrder.objects.filter(pk__in=[o.pk for o in paid]).select_related('user'):
+        send_async_email.delay(
+            "AutoMart Order Confirmed",
+            f"Your order for {order.describe_items()} is confirmed.",
+            [order.user.email]
+        )
+    return len(paid) + refunded + failed
+
+
+def reconcile_payments(since, until=None, client=stripe):
+    """
+    Reconcile intents created between since and until (default: now).
+    Returns counts of intents seen and rows corrected.
+    """
+    result = {'intents': 0, 'bookings': 0, 'orders': 0}
+    for chunk in _chunks(iter_intents(client, since, until), CHUNK_SIZE):
+        result['intents'] += len(chunk)
+        paid_ids = {i['id'] for i in chunk if i['status'] == 'succeeded'}
+        failed_ids = {i['id'] for i in chunk if i['status'] == 'canceled'}
+        if not paid_ids and not failed_ids:
+            continue
+
+        now = timezone.now()
+        result['bookings'] += _reconcile_bookings(paid_ids, failed_ids, now)
+        result['orders'] += _reconcile_orders(paid_ids, failed_ids, now)
+
+    if result['bookings'] or result['orders']:
+        logger.warning(f"Stripe reconciliation corrected {result['bookings']} bookings and {result['orders']} orders")
+    return result
+
+
+def reconcile_recent(hours=None, client=stripe):
+    if hours is None:
+        hours = getattr(settings, 'STRIPE_RECONCILE_WINDOW_HOURS', 48)
+    return reconcile_payments(timezone.now() - timedelta(hours=hours), client=client)
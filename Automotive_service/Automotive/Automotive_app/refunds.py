@@ -0,0 +1,137 @@
+"""
+Asynchronous refunds.
+
+Cancelling a paid order or booking only records a RefundJob and flips
+payment_status to REFUND_PENDING; the Stripe call happens in a Celery task
+after the transaction commits. The task retries transient Stripe errors with
+backoff and always sends the same idempotency key
+(refund-<job id>-<generation>), so a retry never refunds twice; a FAILED
+job that is queued again gets a new generation, since Stripe would replay
+the earlier failure for the old key. payment_status becomes REFUNDED and the customer
+is emailed only once Stripe has accepted the refund. A periodic sweeper
+re-queues jobs whose task message was lost.
+"""
+import logging
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import RefundJob
+from .tasks import process_refund, send_async_email
+
+logger = logging.getLogger(__name__)
+# Workers never import views, so set the key here as well
+stripe.api_key = getattr(settings, 'STRIPE_SECRET_KEY', None)
+
+# Refund states Stripe reports for an accepted refund
+ACCEPTED = ('succeeded', 'pending')
+
+
+class RetryRefund(Exception):
+    """Transient failure; the task should try again later."""
+
+
+def queue_refund(obj):
+    """
+    Record a refund for a paid PartOrder or Booking. Call inside the
+    transaction that cancels it; the task is sent once that commits.
+    A job that FAILED before (the row went back to PAID) starts over.
+    """
+    field = 'order' if obj._meta.model_name == 'partorder' else 'booking'
+    job, created = RefundJob.objects.get_or_create(
+        **{field: obj},
+        defaults={'stripe_payment_intent_id': obj.stripe_payment_intent_id},
+    )
+    send = created
+    if not created and job.status == 'FAILED':
+        send = True
+        job.status = 'QUEUED'
+        job.attempts = 0
+        job.generation += 1
+        job.last_error = ''
+        job.stripe_payment_intent_id = obj.stripe_payment_intent_id
+        job.save(update_fields=[
+            'status', 'attempts', 'generation', 'last_error', 'stripe_payment_intent_id', 'updated_at',
+        ])
+    obj.payment_status = 'REFUND_PENDING'
+    if send:
+        transaction.on_commit(lambda: process_refund.delay(job.id))
+    return job
+
+
+def _claim(job_id):
+    """Move a job to PROCESSING unless it is already finished."""
+    with transaction.atomic():
+        job = RefundJob.objects.select_for_update().get(pk=job_id)
+        if job.status in ('SUCCEEDED', 'FAILED'):
+            return None
+        job.status = 'PROCESSING'
+        job.attempts += 1
+        job.save(update_fields=['status', 'attempts', 'updated_at'])
+    return job
+
+
+def _finish(job, status, payment_status, **fields):
+    with transaction.atomic():
+        for name, value in fields.items():
+            setattr(job, name, value)
+        job.status = status
+        job.save()
+
+        target = job.target
+        target.payment_status = payment_status
+        target.updated_at = timezone.now()
+        target.save(update_fields=['payment_status', 'updated_at'])
+    return target
+
+
+def _notify(target):
+    if target._meta.model_name == 'partorder':
+        message = f"Your cancelled order for {target.describe_items()} has been refunded ({target.total_price})."
+    else:
+        message = f"The payment for Booking #{target.id} has been refunded."
+    send_async_email.delay("AutoMart Refund Processed", message, [target.user.email])
+
+
+def run_refund(job_id, final_attempt=False):
+    """
+    One attempt at a refund job. Raises RetryRefund on a transient error
+    (unless this is the final attempt, which marks the job FAILED).
+    """
+    job = _claim(job_id)
+    if job is None:
+        return None
+
+    try:
+        refund = stripe.Refund.create(
+            payment_intent=job.stripe_payment_intent_id,
+            idempotency_key=f'refund-{job.id}-{job.generation}',
+        )
+    except stripe.InvalidRequestError as e:
+        if getattr(e, 'code', None) == 'charge_already_refunded':
+            target = _finish(job, 'SUCCEEDED', 'REFUNDED')
+            _notify(target)
+            return job
+        # Bad request: retrying will not help
+        logger.error(f"Refund {job.id} rejected: {str(e)}")
+        _finish(job, 'FAILED', 'PAID', last_error=str(e))
+        return job
+    except stripe.StripeError as e:
+        if final_attempt:
+            logger.error(f"Refund {job.id} gave up after {job.attempts} attempts: {str(e)}")
+            _finish(job, 'FAILED', 'PAID', last_error=str(e))
+            return job
+        job.status = 'QUEUED'
+        job.last_error = str(e)
+        job.save(update_fields=['status', 'last_error', 'updated_at'])
+        raise RetryRefund(str(e))
+
+    if refund['status'] in ACCEPTED:
+        target = _finish(job, 'SUCCEEDED', 'REFUNDED', stripe_refund_id=refund['id'], last_error='')
+        _notify(target)
+    else:
+        logger.error(f"Refund {job.id} returned status {refund['status']}")
+        _finish(job, 'FAILED', 'PAID', stripe_refund_id=refund['id'], last_error=f"Refund status: {refund['status']}")
+    return job
@@ -0,0 +1,208 @@
+"""
+Service reminders.
+
+Nightly, every vehicle's service history and its ServiceHistoryItem rows
+are loaded column-wise in keyset chunks and turned into NumPy arrays. For
+each (vehicle, service) pair the last time the service was done is found
+with one sort, and the due date is
+
+    min(last done + Service.interval_days,
+        the day the odometer is expected to pass last reading + Service.interval_km)
+
+where the expected odometer comes from each vehicle's average km per day
+across its history. Pairs due within SERVICE_REMINDER_LEAD_DAYS get a
+ServiceReminder row; the (vehicle, service, cycle_start) constraint makes
+re-runs idempotent, and each owner gets one email per run listing all
+their due services.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Service, ServiceHistory, ServiceHistoryItem, ServiceReminder
+from .tasks import send_async_email
+
+DAY = 86400.0
+# Only services with at least one interval take part
+HAS_INTERVAL = Q(interval_days__gt=0) | Q(interval_km__gt=0)
+
+
+def service_intervals():
+    """Service ids with their interval arrays (NaN = no interval)."""
+    rows = list(
+        Service.objects.filter(HAS_INTERVAL)
+        .values_list('id', 'interval_days', 'interval_km')
+    )
+    ids = np.array([r[0] for r in rows], dtype=np.int64)
+    days = np.array([r[1] if r[1] else np.nan for r in rows], dtype=np.float64)
+    km = np.array([r[2] if r[2] else np.nan for r in rows], dtype=np.float64)
+    index_of = {r[0]: i for i, r in enumerate(rows)}
+    return ids, days, km, index_of
+
+
+def load_history(index_of, chunk_size=5000):
+    """
+    Read (vehicle, completion time, odometer) in pk order, plus the services
+    of each entry from ServiceHistoryItem. Returns per-row arrays and
+    per-(row, service) arrays, services as indexes into service_intervals().
+    """
+    row_vehicle, row_ts, row_odo = [], [], []
+    pair_row = []
+    pair_service = []
+
+    last_pk = 0
+    while True:
+        chunk = list(
+            ServiceHistory.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', 'vehicle_id', 'completion_date', 'odometer_reading')[:chunk_size]
+        )
+        if not chunk:
+            break
+        row_of = {}
+        for pk, vehicle_id, completed, odometer in chunk:
+            row_of[pk] = len(row_vehicle)
+            row_vehicle.append(vehicle_id)
+            row_ts.append(completed.timestamp())
+            row_odo.append(odometer or 0)
+
+        # The chunk's items in one range scan of the history FK index
+        items = ServiceHistoryItem.objects.filter(
+            history_id__gt=last_pk, history_id__lte=chunk[-1][0], service_id__isnull=False,
+        ).values_list('history_id', 'service_id')
+        for history_id, service_id in items:
+            index = index_of.get(service_id)
+            if index is not None and history_id in row_of:
+                pair_row.append(row_of[history_id])
+                pair_service.append(index)
+        last_pk = chunk[-1][0]
+
+    return (
+        np.array(row_vehicle, dtype=np.int64),
+        np.array(row_ts, dtype=np.float64),
+        np.array(row_odo, dtype=np.float64),
+        np.array(pair_row, dtype=np.int64),
+        np.array(pair_service, dtype=np.int64),
+    )
+
+
+def compute_due(row_vehicle, row_ts, row_odo, pair_row, pair_service, interval_days, interval_km):
+    """
+    Vectorized due dates. Returns arrays (vehicle_id, service_index,
+    cycle_start_ts, due_ts), one entry per (vehicle, service) pair.
+    """
+    if len(pair_row) == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, np.array([]), np.array([])
+
+    vehicles, vidx = np.unique(row_vehicle, return_inverse=True)
+    n = len(vehicles)
+
+    # Per-vehicle odometer trend from readings > 0 (auto-generated entries carry 0)
+    has_odo = row_odo > 0
+    first_ts = np.full(n, np.inf)
+    last_ts = np.full(n, -np.inf)
+    low_odo = np.full(n, np.inf)
+    high_odo = np.full(n, -np.inf)
+    np.minimum.at(first_ts, vidx[has_odo], row_ts[has_odo])
+    np.maximum.at(last_ts, vidx[has_odo], row_ts[has_odo])
+    np.minimum.at(low_odo, vidx[has_odo], row_odo[has_odo])
+    np.maximum.at(high_odo, vidx[has_odo], row_odo[has_odo])
+    span_days = (last_ts - first_ts) / DAY
+    with np.errstate(divide='ignore', invalid='ignore'):
+        km_per_day = np.where(span_days > 0, (high_odo - low_odo) / span_days, np.nan)
+    km_per_day[km_per_day <= 0] = np.nan
+
+    # Last occurrence of each (vehicle, service): sort by pair then time, keep the tail
+    pair_vidx = vidx[pair_row]
+    keys = pair_vidx * len(interval_days) + pair_service
+    order = np.lexsort((row_ts[pair_row], keys))
+    keys_sorted = keys[order]
+    tail = np.r_[keys_sorted[1:] != keys_sorted[:-1], True]
+    last = pair_row[order][tail]
+    v = vidx[last]
+    s = pair_service[order][tail]
+
+    done_ts = row_ts[last]
+    done_odo = row_odo[last]
+
+    due_by_days = done_ts + interval_days[s] * DAY
+    with np.errstate(invalid='ignore'):
+        km_left = done_odo + interval_km[s] - high_odo[v]
+        due_by_km = last_ts[v] + km_left / km_per_day[v] * DAY
+    due_by_km[done_odo <= 0] = np.nan
+
+    due = np.fmin(due_by_days, due_by_km)
+    known = ~np.isnan(due)
+    return vehicles[v][known], s[known], done_ts[known], due[known]
+
+
+def _to_datetime(ts):
+    return datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+
+
+def queue_reminders(now=None, lead_days=None, batch_size=1000):
+    """Create the ServiceReminder rows that are due. Returns how many are new or still unsent."""
+    now = now or timezone.now()
+    if lead_days is None:
+        lead_days = getattr(settings, 'SERVICE_REMINDER_LEAD_DAYS', 7)
+
+    service_ids, interval_days, interval_km, index_of = service_intervals()
+    if not len(service_ids):
+        return 0
+
+    arrays = load_history(index_of)
+    vehicle_ids, service_index, cycle_ts, due_ts = compute_due(*arrays, interval_days, interval_km)
+
+    horizon = (now + timedelta(days=lead_days)).timestamp()
+    due_now = due_ts <= horizon
+    reminders = [
+        ServiceReminder(
+            vehicle_id=int(vehicle_id),
+            service_id=int(service_ids[index]),
+            cycle_start=_to_datetime(cycle),
+            due_date=_to_datetime(due).date(),
+        )
+        for vehicle_id, index, cycle, due in zip(
+            vehicle_ids[due_now], service_index[due_now], cycle_ts[due_now], due_ts[due_now]
+        )
+    ]
+    ServiceReminder.objects.bulk_create(reminders, batch_size=batch_size, ignore_conflicts=True)
+    return ServiceReminder.objects.filter(sent_at__isnull=True).count()
+
+
+def send_reminders(batch_size=500):
+    """
+    Email owners about unsent reminders, one email per owner per batch.
+    Each owner's reminders are marked sent as soon as their email is queued,
+    so a failure part way through a batch does not email earlier owners again.
+    """
+    sent = 0
+    while True:
+        batch = list(
+            ServiceReminder.objects.filter(sent_at__isnull=True)
+            .select_related('vehicle__owner', 'service')
+            .order_by('id')[:batch_size]
+        )
+        if not batch:
+            break
+
+        by_owner = defaultdict(list)
+        for reminder in batch:
+            by_owner[reminder.vehicle.owner].append(reminder)
+        for owner, reminders in by_owner.items():
+            lines = "\n".join(
+                f"- {r.service.name} for your {r.vehicle.year} {r.vehicle.make} {r.vehicle.model}, due {r.due_date}"
+                for r in reminders
+            )
+            send_async_email.delay(
+                "AutoMart Service Reminder",
+                f"Hi {owner.username}, the following services are due soon:\n{lines}\n\nBook a slot from your dashboard.",
+                [owner.email]
+            )
+            ServiceReminder.objects.filter(pk__in=[r.pk for r in reminders]).update(sent_at=timezone.now())
+            sent += len(reminders)
+    return sent
@@ -0,0 +1,142 @@
+"""
+Roles: the denormalized role index and the per-user role cache.
+
+A user's roles live in two places (User.is_staff and the UserProfile
+flags); UserRole keeps one indexed row per role held so lists like "all
+mechanics" are a single index range instead of a users x profiles scan.
+sync_roles() is called from the UserProfile post_save receiver and inside
+the role toggle transactions.
+
+get_roles() answers permission checks from a small in-process LRU, then
+the shared cache, and only then the database. The signal receivers in
+signals.py call invalidate_roles() whenever a User or UserProfile is saved
+(which includes both toggle views). Local entries also expire after
+ROLE_CACHE_LOCAL_SECONDS so other processes pick up a change quickly.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+
+from .models import UserRole
+
+# role -> where the flag lives
+ROLE_SOURCES = {
+    'staff': lambda user, profile: user.is_staff,
+    'mechanic': lambda user, profile: profile.is_mechanic,
+    'billing': lambda user, profile: profile.is_billing,
+    'ecommerce': lambda user, profile: profile.is_ecommerce,
+}
+
+
+def roles_of(user, profile):
+    return {role for role, held in ROLE_SOURCES.items() if held(user, profile)}
+
+
+def sync_roles(user, profile):
+    """Make the UserRole rows of a user match its flags."""
+    wanted = roles_of(user, profile)
+    current = set(UserRole.objects.filter(user=user).values_list('role', flat=True))
+
+    if current - wanted:
+        UserRole.objects.filter(user=user, role__in=current - wanted).delete()
+    if wanted - current:
+        UserRole.objects.bulk_create(
+            [UserRole(user=user, role=role) for role in wanted - current],
+            ignore_conflicts=True,
+        )
+    return wanted
+
+
+# --- ROLE CACHE ---
+
+SPECIALIST_ROLES = {'mechanic', 'billing', 'ecommerce'}
+
+
+class _LRU:
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = _LRU(getattr(settings, 'ROLE_CACHE_SIZE', 1024))
+
+
+def _cache_key(user_id):
+    return f'roles:{user_id}'
+
+
+def _load_roles(user):
+    try:
+        profile = user.profile
+    except ObjectDoesNotExist:
+        profile = None
+    roles = {'staff'} if user.is_staff else set()
+    if profile is not None:
+        roles = roles_of(user, profile)
+    if user.is_superuser:
+        roles.add('superuser')
+    return frozenset(roles)
+
+
+def get_roles(user):
+    """Frozen set of 'superuser', 'staff', 'mechanic', 'billing', 'ecommerce'."""
+    if not user or not user.is_authenticated:
+        return frozenset()
+
+    roles = _local.get(user.pk)
+    if roles is None:
+        roles = cache.get(_cache_key(user.pk))
+        if roles is None:
+            roles = _load_roles(user)
+            cache.set(_cache_key(user.pk), roles, getattr(settings, 'ROLE_CACHE_SECONDS', 600))
+        _local.set(user.pk, roles, getattr(settings, 'ROLE_CACHE_LOCAL_SECONDS', 5))
+    return roles
+
+
+def invalidate_roles(user_id):
+    _local.pop(user_id)
+    cache.delete(_cache_key(user_id))
+
+
+def role_flags(user):
+    """The is_* flags the frontend reads, from the cached role set."""
+    roles = get_roles(user)
+    return {
+        'is_staff': 'staff' in roles,
+        'is_superuser': 'superuser' in roles,
+        'is_mechanic': 'mechanic' in roles,
+        'is_billing': 'billing' in roles,
+        'is_ecommerce': 'ecommerce' in roles,
+    }
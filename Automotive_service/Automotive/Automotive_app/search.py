@@ -0,0 +1,259 @@
+"""
+Admin search over users, bookings, part orders and denting requests.
+
+    GET /api/admin/search/?q=ka01 honda&types=booking,part_order&limit=20
+
+Searchable values (usernames, emails, license plates, ids, Stripe intent
+ids, vehicle make/model) are split into lowercase tokens and stored in
+SearchToken, one row per (token, object). A query matches objects that have
+every query term as a token prefix; hits are ranked by the weight of the
+fields that matched, exact tokens counting double. Matching, intersection
+and ranking are one GROUP BY query: each term's best score per object is a
+conditional MAX, objects missing a term are dropped by HAVING, and only the
+top `limit` rows come back, however many postings the terms have.
+
+The index is kept current by the signal receivers below (a change to a
+user or vehicle re-indexes the rows that show it; saves that change no
+indexed column, such as status updates, are skipped). Run
+`manage.py rebuild_search_index` once to fill it, or after bulk updates
+that bypass signals.
+"""
+import re
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import models
+from django.db.models import Case, F, Max, Q, Value, When
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Booking, PartOrder, DentingRequest, Vehicle, SearchToken
+
+WORD = re.compile(r'[a-z0-9_]+')
+MAX_TOKEN_LENGTH = 64
+
+# Field weights
+ID, NAME, VEHICLE, OWNER = 5, 4, 2, 1
+
+
+def tokenize(value):
+    """'KA-01 AB 1234' -> {'ka', '01', 'ab', '1234', 'ka01ab1234'}"""
+    if value in (None, ''):
+        return set()
+    text = str(value).lower()
+    words = WORD.findall(text)
+    tokens = set(words)
+    if len(words) > 1:
+        tokens.add(''.join(words))
+    return {t[:MAX_TOKEN_LENGTH] for t in tokens}
+
+
+# --- DOCUMENTS ---
+
+def _user_fields(user):
+    return [(user.username, NAME), (user.email, NAME), (user.first_name, OWNER), (user.last_name, OWNER)]
+
+
+def _vehicle_fields(vehicle):
+    if vehicle is None:
+        return []
+    return [(vehicle.license_plate, ID), (vehicle.make, VEHICLE), (vehicle.model, VEHICLE)]
+
+
+def _owner_fields(user):
+    return [(user.username, OWNER), (user.email, OWNER)]
+
+
+# kind -> (model, select_related, fields of one object, hit title and subtitle)
+DOCUMENTS = {
+    'user': (
+        User, [],
+        _user_fields,
+        lambda u: (u.username, u.email),
+    ),
+    'booking': (
+        Booking, ['user', 'vehicle'],
+        lambda b: [(b.id, ID), (b.stripe_payment_intent_id, ID), *_owner_fields(b.user), *_vehicle_fields(b.vehicle)],
+        lambda b: (f"Booking #{b.id}", f"{b.user.username} · {b.vehicle.make} {b.vehicle.model} · {b.status}"),
+    ),
+    'part_order': (
+        PartOrder, ['user', 'vehicle'],
+        lambda o: [(o.id, ID), (o.stripe_payment_intent_id, ID), *_owner_fields(o.user), *_vehicle_fields(o.vehicle)],
+        lambda o: (f"Order #{o.id}", f"{o.user.username} · {o.status} · {o.payment_status}"),
+    ),
+    'denting': (
+        DentingRequest, ['user'],
+        lambda d: [(d.id, ID), *_owner_fields(d.user), (d.vehicle_make, VEHICLE), (d.vehicle_model, VEHICLE)],
+        lambda d: (f"Denting #{d.id}", f"{d.user.username} · {d.vehicle_make} {d.vehicle_model} · {d.status}"),
+    ),
+}
+
+
+def _tokens_for(kind, obj):
+    best = {}
+    for value, weight in DOCUMENTS[kind][2](obj):
+        for token in tokenize(value):
+            best[token] = max(weight, best.get(token, 0))
+    return [SearchToken(token=t, kind=kind, object_id=obj.pk, weight=w) for t, w in best.items()]
+
+
+def index_objects(kind, objects):
+    """Replace the tokens of already loaded objects (related rows selected)."""
+    objects = list(objects)
+    if not objects:
+        return
+    SearchToken.objects.filter(kind=kind, object_id__in=[o.pk for o in objects]).delete()
+    SearchToken.objects.bulk_create([t for obj in objects for t in _tokens_for(kind, obj)], batch_size=1000)
+
+
+def reindex(kind, ids):
+    model, related, *_ = DOCUMENTS[kind]
+    ids = list(ids)
+    objects = model.objects.filter(pk__in=ids).select_related(*related)
+    index_objects(kind, objects)
+
+
+def remove(kind, ids):
+    SearchToken.objects.filter(kind=kind, object_id__in=list(ids)).delete()
+
+
+# --- QUERY ---
+
+def search(query, kinds=None, limit=20):
+    # Plain words only: the joined form tokenize() adds is for indexing
+    terms = sorted({w[:MAX_TOKEN_LENGTH] for w in WORD.findall(query.lower())})
+    kinds = [k for k in (kinds or DOCUMENTS) if k in DOCUMENTS]
+    if not terms or not kinds:
+        return []
+
+    matched, term_scores = Q(), {}
+    for i, term in enumerate(terms):
+        # One character matches too much as a prefix; require it exactly
+        lookup = Q(token=term) if len(term) < 2 else Q(token__startswith=term)
+        matched |= lookup
+        term_scores[f'term{i}'] = Max(Case(
+            When(token=term, then=F('weight') * 2),
+            When(lookup, then=F('weight')),
+            default=Value(0),
+            output_field=models.IntegerField(),
+        ))
+
+    order = list(DOCUMENTS)
+    rows = (
+        SearchToken.objects.filter(matched, kind__in=kinds)
+        .values('kind', 'object_id')
+        .annotate(**term_scores)
+        # Every term must match
+        .filter(**{f'{name}__gt': 0 for name in term_scores})
+        .annotate(
+            score=sum(F(name) for name in term_scores),
+            kind_rank=Case(*[When(kind=k, then=Value(i)) for i, k in enumerate(order)], output_field=models.IntegerField()),
+        )
+        .order_by('-score', 'kind_rank', '-object_id')
+        .values_list('kind', 'object_id', 'score')[:limit]
+    )
+    ranked = [((kind, object_id), score) for kind, object_id, score in rows]
+
+    by_kind = defaultdict(list)
+    for (kind, object_id), _ in ranked:
+        by_kind[kind].append(object_id)
+    loaded = {}
+    for kind, ids in by_kind.items():
+        model, related, *_ = DOCUMENTS[kind]
+        for obj in model.objects.filter(pk__in=ids).select_related(*related):
+            loaded[kind, obj.pk] = obj
+
+    hits = []
+    for (kind, object_id), score in ranked:
+        obj = loaded.get((kind, object_id))
+        if obj is None:
+            continue  # deleted since it was indexed
+        title, subtitle = DOCUMENTS[kind][3](obj)
+        hits.append({'type': kind, 'id': object_id, 'score': score, 'title': title, 'subtitle': subtitle})
+    return hits
+
+
+# --- INCREMENTAL UPDATES ---
+
+# What the user's own document and the documents it owns read from the user
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name')
+OWNER_FIELDS = ('username', 'email')
+
+
+def _user_values(instance):
+    return {f: instance.__dict__.get(f) for f in USER_FIELDS}
+
+
+@receiver(post_init, sender=User)
+def remember_user_fields(sender, instance, **kwargs):
+    instance._indexed = _user_values(instance)
+
+
+@receiver(post_save, sender=User)
+def index_user(sender, instance, created, update_fields=None, **kwargs):
+    # Logins save last_login only; nothing searchable changed
+    if update_fields is not None and not set(USER_FIELDS) & set(update_fields):
+        return
+    current = _user_values(instance)
+    previous, instance._indexed = getattr(instance, '_indexed', None), current
+    if created or previous is None:
+        index_objects('user', [instance])
+        return
+    changed = {f for f in USER_FIELDS if current[f] != previous[f]}
+    if changed:
+        index_objects('user', [instance])
+    # Owned documents only show the username and email
+    if changed & set(OWNER_FIELDS):
+        for kind in ('booking', 'part_order', 'denting'):
+            model = DOCUMENTS[kind][0]
+            reindex(kind, model.objects.filter(user=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Vehicle)
+def index_vehicle(sender, instance, created, **kwargs):
+    if created:
+        return
+    reindex('booking', Booking.objects.filter(vehicle=instance).values_list('pk', flat=True))
+    reindex('part_order', PartOrder.objects.filter(vehicle=instance).values_list('pk', flat=True))
+
+
+# Columns of the documents themselves that end up in the index
+INDEXED_FIELDS = {
+    Booking: ('user_id', 'vehicle_id', 'stripe_payment_intent_id'),
+    PartOrder: ('user_id', 'vehicle_id', 'stripe_payment_intent_id'),
+    DentingRequest: ('user_id', 'vehicle_make', 'vehicle_model'),
+}
+
+
+def _indexed_values(sender, instance):
+    # __dict__ so a deferred field is never loaded just for this
+    return tuple(instance.__dict__.get(f) for f in INDEXED_FIELDS[sender])
+
+
+@receiver(post_init, sender=Booking)
+@receiver(post_init, sender=PartOrder)
+@receiver(post_init, sender=DentingRequest)
+def remember_indexed_fields(sender, instance, **kwargs):
+    instance._indexed = _indexed_values(sender, instance)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_save, sender=PartOrder)
+@receiver(post_save, sender=DentingRequest)
+def index_document(sender, instance, created, **kwargs):
+    current = _indexed_values(sender, instance)
+    previous, instance._indexed = getattr(instance, '_indexed', None), current
+    # Status and payment updates leave the tokens as they are
+    if not created and current == previous:
+        return
+    kind = {Booking: 'booking', PartOrder: 'part_order', DentingRequest: 'denting'}[sender]
+    reindex(kind, [instance.pk])
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Booking)
+@receiver(post_delete, sender=PartOrder)
+@receiver(post_delete, sender=DentingRequest)
+def unindex_document(sender, instance, **kwargs):
+    kind = {User: 'user', Booking: 'booking', PartOrder: 'part_order', DentingRequest: 'denting'}[sender]
+    remove(kind, [instance.pk])
@@ -1,9 +1,76 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from django.contrib.auth.models import User
-from .models import Vehicle, Service, Booking, SparePart, DentingRequest, PartOrder, ServiceHistory
+from .models import Vehicle, Service, Booking, SparePart, DentingRequest, PartOrder, PartOrderLine, ServiceHistory, ServiceHistoryItem, ArchivedRecord, RestockSuggestion
+
+# --- SPARSE FIELDSETS ---
+
+def parse_fields(value):
+    """'id,part_details.name' -> {'id': set(), 'part_details': {'name'}}"""
+    requested = {}
+    for item in value.split(','):
+        name, _, sub = item.strip().partition('.')
+        if name:
+            requested.setdefault(name, set())
+            if sub:
+                requested[name].add(sub)
+    return requested
+
+
+class SparseFieldsMixin:
+    """
+    Read requests can ask for a subset of fields and for expansions:
+
+        ?fields=id,status,part_details.name
+        ?expand=vehicle
+
+    Dotted names reach one level into nested serializers. Expandable fields
+    are listed in Meta.expandable_fields ({name: SerializerClass}) and replace
+    the pk with the nested object. Writes always use the full serializer.
+    """
+
+    def _sparse_params(self):
+        if hasattr(self, '_requested_fields'):
+            return self._requested_fields, set()
+
+        # Only the top-level serializer (or the child of a top-level many=True) reads the query string
+        parent = self.parent
+        if parent is not None and not (isinstance(parent, serializers.ListSerializer) and parent.parent is None):
+            return None, set()
+
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return None, set()
+
+        params = getattr(request, 'query_params', request.GET)
+        fields = params.get('fields')
+        expand = {e.strip() for e in params.get('expand', '').split(',') if e.strip()}
+        return (parse_fields(fields) if fields else None), expand
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested, expand = self._sparse_params()
+
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name in expand:
+            if name in expandable:
+                fields[name] = expandable[name](read_only=True)
+
+        if requested is None:
+            return fields
+
+        fields = {name: field for name, field in fields.items() if name in requested}
+        for name, sub in requested.items():
+            if sub and name in fields:
+                nested = fields[name]
+                nested = getattr(nested, 'child', nested)
+                if isinstance(nested, SparseFieldsMixin):
+                    nested._requested_fields = dict.fromkeys(sub, set())
+        return fields
+
 
 # --- USER SERIALIZER ---
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     is_mechanic = serializers.BooleanField(source='profile.is_mechanic', read_only=True)
     is_billing = serializers.BooleanField(source='profile.is_billing', read_only=True)
     is_ecommerce = serializers.BooleanField(source='profile.is_ecommerce', read_only=True)
@@ -16,7 +83,7 @@ class UserSerializer(serializers.ModelSerializer):
             'password': {'write_only': True}}
 
 # --- SPARE PART SERIALIZER ---
-class SparePartSerializer(serializers.ModelSerializer):
+class SparePartSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # We include the property in the fields list
     is_available = serializers.ReadOnlyField()
 
@@ -28,7 +95,7 @@ class SparePartSerializer(serializers.ModelSerializer):
         ]
 
 # --- DENTING & PAINTING REQUEST SERIALIZER ---
-class DentingRequestSerializer(serializers.ModelSerializer):
+class DentingRequestSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_username = serializers.ReadOnlyField(source='user.username')
 
     class Meta:
@@ -40,22 +107,37 @@ class DentingRequestSerializer(serializers.ModelSerializer):
         read_only_fields = ['status', 'created_at']
 
 # --- SERVICE SERIALIZER ---
-class ServiceSerializer(serializers.ModelSerializer):
+class ServiceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Service
         fields = '__all__'
 
 # --- VEHICLE SERIALIZER ---
-class VehicleSerializer(serializers.ModelSerializer):
+class VehicleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Vehicle
         fields = ['id', 'make', 'model', 'year']
 
 # --- BOOKING SERIALIZER ---
-class BookingSerializer(serializers.ModelSerializer):
+class SnapshotServicesField(serializers.ManyRelatedField):
+    """Writes Service pks like the default field; reads them from services_snapshot."""
+
+    def get_attribute(self, instance):
+        return [entry['id'] for entry in instance.services_snapshot]
+
+    def to_representation(self, ids):
+        return list(ids)
+
+
+class BookingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_username = serializers.ReadOnlyField(source='user.username')
     vehicle_info = serializers.SerializerMethodField()
-    services_details = ServiceSerializer(source='services', many=True, read_only=True)
+    services = SnapshotServicesField(
+        child_relation=serializers.PrimaryKeyRelatedField(queryset=Service.objects.all()),
+        allow_empty=False,
+    )
+    # Services and prices as booked, not as they are in the catalog today
+    services_details = serializers.JSONField(source='services_snapshot', read_only=True)
     service_names = serializers.SerializerMethodField()
     
     # We allow null=True here because if a booking is new, the admin might 
@@ -84,6 +166,7 @@ class BookingSerializer(serializers.ModelSerializer):
         ]
         # Stripe IDs should never be manually edited via API
         read_only_fields = ['stripe_payment_intent_id']
+        expandable_fields = {'vehicle': VehicleSerializer}
 
     def get_vehicle_info(self, obj):
         try:
@@ -92,13 +175,22 @@ class BookingSerializer(serializers.ModelSerializer):
             return "N/A"
 
     def get_service_names(self, obj):
-        # Using a list comprehension to get names of all linked services
-        return [s.name for s in obj.services.all()]
+        return [entry['name'] for entry in obj.services_snapshot]
 
-# --- PART ORDER SERIALIZER ---
-class PartOrderSerializer(serializers.ModelSerializer):
+# --- PART ORDER SERIALIZERS ---
+class PartOrderLineSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    part_name = serializers.ReadOnlyField(source='part.name')
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, coerce_to_string=False, read_only=True)
+    line_total = serializers.DecimalField(max_digits=10, decimal_places=2, coerce_to_string=False, read_only=True)
+
+    class Meta:
+        model = PartOrderLine
+        fields = ['id', 'part', 'part_name', 'quantity', 'unit_price', 'line_total']
+
+class PartOrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_username = serializers.ReadOnlyField(source='user.username')
     part_details = SparePartSerializer(source='part', read_only=True)
+    lines = PartOrderLineSerializer(many=True, read_only=True)
     
     total_price = serializers.DecimalField(
         max_digits=10, 
@@ -111,12 +203,13 @@ class PartOrderSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'user_username', 'part', 'part_details', 'vehicle', 
             'phone_number', 'shipping_address', 'total_price',
-            'payment_status', 'stripe_payment_intent_id', 'status', 'created_at','quantity',
+            'payment_status', 'stripe_payment_intent_id', 'status', 'created_at','quantity', 'lines',
         ]
         read_only_fields = ['payment_status', 'stripe_payment_intent_id', 'status', 'created_at']
+        expandable_fields = {'vehicle': VehicleSerializer}
 
 # --- SERVICE HISTORY SERIALIZER ---
-class ServiceHistorySerializer(serializers.ModelSerializer):
+class ServiceHistorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     vehicle_name = serializers.ReadOnlyField(source='vehicle.model')
     vehicle_make = serializers.ReadOnlyField(source='vehicle.make')
     user_username = serializers.ReadOnlyField(source='user.username')
@@ -128,3 +221,41 @@ class ServiceHistorySerializer(serializers.ModelSerializer):
             'services_rendered', 'total_paid', 'odometer_reading', 
             'completion_date', 'admin_notes'
         ]
+        expandable_fields = {'vehicle': VehicleSerializer}
+
+
+# --- ARCHIVED HISTORY SERIALIZER ---
+class ServiceHistoryItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ServiceHistoryItem
+        fields = ['name', 'service', 'booking', 'price']
+
+
+class ArchivedServiceHistorySerializer(ServiceHistorySerializer):
+    """Archive payload of a logbook entry: its items are deleted with it, so they are kept here."""
+    items = ServiceHistoryItemSerializer(many=True, read_only=True)
+
+    class Meta(ServiceHistorySerializer.Meta):
+        fields = ServiceHistorySerializer.Meta.fields + ['items']
+
+
+class ArchivedRecordSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    data = serializers.JSONField(source='payload', read_only=True)
+
+    class Meta:
+        model = ArchivedRecord
+        fields = ['id', 'kind', 'original_id', 'occurred_at', 'archived_at', 'data']
+
+
+# --- RESTOCK SUGGESTION SERIALIZER ---
+class RestockSuggestionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    part_name = serializers.ReadOnlyField(source='part.name')
+    brand = serializers.ReadOnlyField(source='part.brand')
+    current_stock = serializers.ReadOnlyField(source='part.stock')
+
+    class Meta:
+        model = RestockSuggestion
+        fields = [
+            'part', 'part_name', 'brand', 'stock', 'current_stock',
+            'daily_demand', 'days_of_cover', 'reorder_quantity', 'computed_at',
+        ]
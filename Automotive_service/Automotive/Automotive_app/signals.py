@@ -1,7 +1,16 @@
-from django.db.models.signals import post_save, pre_save
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from django.db.models.signals import post_init, post_save, pre_save, post_delete, m2m_changed
+from django.contrib.auth.models import User
+from django.db import transaction
 from django.dispatch import receiver
 from django.core.mail import send_mail
-from .models import Booking
+from django.utils import timezone
+from .models import Booking, PartOrder, DentingRequest, Service, ServiceHistory, ServiceHistoryItem, Tombstone, UserProfile
+from .roles import sync_roles, invalidate_roles
 
 @receiver(post_save, sender=Booking)
 def handle_booking_notifications(sender, instance, created, **kwargs):
@@ -25,4 +34,124 @@ def handle_booking_notifications(sender, instance, created, **kwargs):
         try:
             send_mail(subject, message, None, [instance.user.email])
         except Exception as e:
-            print(f"Email error: {e}")
\ No newline at end of file
+            print(f"Email error: {e}")
+
+
+# --- SERVICES SNAPSHOT ---
+
+def refresh_services_snapshot(booking):
+    """Rewrite services_snapshot and total_amount (the sum of the booked prices)."""
+    snapshot = booking.build_services_snapshot()
+    total = sum((Decimal(entry['base_price']) for entry in snapshot), Decimal('0.00'))
+    now = timezone.now()
+    # update() so the booking emails and post_save handlers do not fire again
+    Booking.objects.filter(pk=booking.pk).update(services_snapshot=snapshot, total_amount=total, updated_at=now)
+    booking.services_snapshot, booking.total_amount, booking.updated_at = snapshot, total, now
+
+
+@receiver(m2m_changed, sender=Booking.services.through)
+def snapshot_booking_services(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_services_snapshot(instance)
+        return
+
+    # service.booking_set.add/remove/clear(): instance is the Service
+    if action == 'pre_clear':
+        instance._cleared_booking_ids = list(instance.booking_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        ids = pk_set if action != 'post_clear' else instance.__dict__.pop('_cleared_booking_ids', [])
+        for booking in Booking.objects.filter(pk__in=ids):
+            refresh_services_snapshot(booking)
+
+
+# --- SERVICE HISTORY ITEMS ---
+
+# What the completion signal writes when a booking had no services
+PLACEHOLDER = 'general service'
+
+
+def sync_items_from_text(history):
+    """
+    Make the items match services_rendered after it was edited by hand.
+    Names still listed keep their item (service, booking and price); new
+    names are matched to the catalog by name and have no price.
+    """
+    names = [n.strip()[:100] for n in history.services_rendered.split(',') if n.strip()]
+    existing = {}
+    for item in history.items.all():
+        existing.setdefault(item.name.lower(), []).append(item)
+
+    keep, added = [], []
+    for name in names:
+        if existing.get(name.lower()):
+            keep.append(existing[name.lower()].pop(0))
+        elif name.lower() != PLACEHOLDER:
+            added.append(name)
+
+    catalog = {}
+    if added:
+        matches = Service.objects.filter(reduce(or_, [Q(name__iexact=n) for n in added])).order_by('-pk')
+        for pk, name in matches.values_list('pk', 'name'):
+            catalog[name.lower()] = pk  # lowest pk wins on duplicate names
+    booking_id = keep[0].booking_id if keep else None
+
+    history.items.exclude(pk__in=[item.pk for item in keep]).delete()
+    ServiceHistoryItem.objects.bulk_create([
+        ServiceHistoryItem(history=history, name=name, service_id=catalog.get(name.lower()), booking_id=booking_id)
+        for name in added
+    ])
+
+
+@receiver(post_init, sender=ServiceHistory)
+def remember_services_rendered(sender, instance, **kwargs):
+    instance._rendered = instance.__dict__.get('services_rendered')
+
+
+@receiver(post_save, sender=ServiceHistory)
+def resync_history_items(sender, instance, created, update_fields=None, **kwargs):
+    # services_rendered is editable (history/<pk>/update/, the admin); the
+    # items must follow it. New entries get their items from their creator.
+    current = instance.__dict__.get('services_rendered')
+    previous, instance._rendered = getattr(instance, '_rendered', None), current
+    if created or current is None or current == previous:
+        return
+    if update_fields is not None and 'services_rendered' not in update_fields:
+        return
+    sync_items_from_text(instance)
+
+
+# --- TOMBSTONES (deletions for delta sync) ---
+
+@receiver(post_delete, sender=Booking)
+@receiver(post_delete, sender=PartOrder)
+@receiver(post_delete, sender=DentingRequest)
+@receiver(post_delete, sender=ServiceHistory)
+def record_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.create(
+        model=sender._meta.model_name,
+        object_id=instance.pk,
+        user_id=instance.user_id,
+    )
+
+
+# --- ROLE INDEX ---
+
+# Every User save also saves its profile (models.save_user_profile), so this
+# catches is_staff changes as well as the profile flags
+@receiver(post_save, sender=UserProfile)
+def sync_user_roles(sender, instance, **kwargs):
+    sync_roles(instance.user, instance)
+
+
+# --- ROLE CACHE ---
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=UserProfile)
+def invalidate_cached_roles(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    user_id = instance.pk if sender is User else instance.user_id
+    invalidate_roles(user_id)
+    # Again after commit, in case a request re-cached the old roles meanwhile
+    transaction.on_commit(lambda: invalidate_roles(user_id))
@@ -1,7 +1,11 @@
 # accounts/tasks.py
+from datetime import timedelta
+
 from celery import shared_task
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 
 
 @shared_task
@@ -13,4 +17,105 @@ def send_async_email(subject, message, recipient_list, html_message=None):
         recipient_list=recipient_list,
         html_message=html_message, # This is crucial!
         fail_silently=True,
-    )
\ No newline at end of file
+    )
+
+
+def send_email_on_commit(subject, message, recipient_list, html_message=None):
+    """
+    Queue send_async_email once the current transaction commits, so a
+    rolled back write (an atomic batch, a failed save) sends no email.
+    Outside a transaction it is queued right away.
+    """
+    transaction.on_commit(lambda: send_async_email.delay(subject, message, recipient_list, html_message=html_message))
+
+@shared_task
+def archive_old_records(kinds=None, days=None, batch_size=500, max_batches=20):
+    """
+    Nightly hot/cold archival. Each run is bounded; if rows are still
+    waiting it queues itself again instead of running for hours.
+    """
+    from .archive import archive_old_rows
+
+    moved, remaining = archive_old_rows(kinds, days, batch_size, max_batches)
+    if remaining:
+        archive_old_records.apply_async(
+            kwargs={'kinds': kinds, 'days': days, 'batch_size': batch_size, 'max_batches': max_batches},
+            countdown=5,
+        )
+    return moved
+
+
+
+@shared_task
+def purge_tombstones():
+    """Deletions older than TOMBSTONE_RETENTION_DAYS are no longer needed by any valid cursor."""
+    from .models import Tombstone
+
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'TOMBSTONE_RETENTION_DAYS', 7))
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
+
+
+@shared_task
+def purge_idempotency_keys():
+    """Forget stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL_HOURS."""
+    from .idempotency import purge_expired
+    return purge_expired()
+
+
+@shared_task(bind=True, max_retries=None)
+def process_refund(self, job_id):
+    """Run one refund attempt; transient Stripe errors retry with exponential backoff."""
+    from .refunds import RetryRefund, run_refund
+
+    max_attempts = getattr(settings, 'REFUND_MAX_ATTEMPTS', 8)
+    try:
+        run_refund(job_id, final_attempt=self.request.retries + 1 >= max_attempts)
+    except RetryRefund as exc:
+        countdown = min(30 * 2 ** self.request.retries, 3600)
+        raise self.retry(exc=exc, countdown=countdown)
+
+
+@shared_task
+def sweep_refunds():
+    """Re-queue refund jobs whose task was lost (worker crash, broker restart)."""
+    from .models import RefundJob
+
+    stale = timezone.now() - timedelta(minutes=getattr(settings, 'REFUND_SWEEP_AFTER_MINUTES', 90))
+    job_ids = list(
+        RefundJob.objects.filter(status__in=['QUEUED', 'PROCESSING'], updated_at__lt=stale)
+        .values_list('id', flat=True)
+    )
+    for job_id in job_ids:
+        process_refund.delay(job_id)
+    return len(job_ids)
+
+
+@shared_task
+def reconcile_stripe_payments(hours=None):
+    """Fix PENDING/FAILED bookings and orders whose Stripe intent says otherwise."""
+    from .reconcile import reconcile_recent
+    return reconcile_recent(hours)
+
+
+@shared_task
+def expire_stale_part_orders():
+    """Cancel abandoned checkouts older than PART_ORDER_EXPIRY_HOURS."""
+    from .orders import expire_stale_orders
+    expired, skipped = expire_stale_orders()
+    return {'expired': expired, 'skipped': len(skipped)}
+
+
+@shared_task
+def send_service_reminders():
+    """Nightly: work out which vehicles are due for service and email their owners."""
+    from .reminders import queue_reminders, send_reminders
+    queued = queue_reminders()
+    return {'queued': queued, 'sent': send_reminders()}
+
+
+@shared_task
+def forecast_restock():
+    """Nightly: rebuild restock suggestions from recent paid order lines."""
+    from .forecast import forecast_restock as run
+    return run()
@@ -1,3 +1,2133 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
+
+from celery.exceptions import Retry
+import brotli
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import RefreshToken
+import fakeredis
+import numpy as np
+import redis
+import redis.asyncio
+import stripe
+
+from .models import (
+    Vehicle, Service, Booking, SparePart, DentingRequest, PartOrder, PartOrderLine, ServiceHistory, RefundJob,
+    IdempotencyRecord, RestockSuggestion, ServiceHistoryItem, ArchivedRecord, SearchToken, ServiceReminder,
+    UserProfile, UserRole,
+)
+from .serializers import BookingSerializer, SparePartSerializer, DentingRequestSerializer, PartOrderSerializer
+from .renderers import ORJSONRenderer
+from .fastpath import FastList
+from .db_router import PrimaryReplicaRouter, PrimaryStickinessMiddleware, use_primary, is_pinned, reset_pin
+from .reconcile import reconcile_payments
+from .forecast import demand_matrix, smooth, suggest, forecast_restock
+from .orders import expire_stale_orders
+from .archive import archive_batch, archive_old_rows, get_cutoff
+from .search import search
+from .delta import encode_cursor
+from .roles import get_roles
+from . import roles
+from .views import toggle_staff_status
+from .reminders import compute_due, queue_reminders, send_reminders
+from .filters import BookingFilter, PartOrderFilter, DentingRequestFilter, ServiceHistoryFilter
+from .tasks import send_async_email, process_refund, sweep_refunds
+from .refunds import queue_refund, run_refund, RetryRefund
+from .throttling import SlidingWindowThrottle, LoginRateThrottle, LoginUsernameThrottle
+from .middleware import CompressionMiddleware, ConcurrencyLimitMiddleware, choose_encoding
+from . import realtime
 
 # Create your tests here.
+
+
+class NoBrokerMixin:
+    """
+    There are no brokers in tests: Celery task messages are recorded on mocks
+    (self.emails, self.refund_tasks) instead of sent, and status events go
+    to an in-process broker instead of Redis.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.emails = self.mock_delay(send_async_email)
+        self.refund_tasks = self.mock_delay(process_refund)
+        patcher = patch.object(realtime, '_broker', realtime.InMemoryBroker())
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+    def mock_delay(self, task):
+        patcher = patch.object(task, 'delay')
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+
+# --- READ REPLICA ROUTER ---
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class PrimaryReplicaRouterTests(TestCase):
+    def setUp(self):
+        reset_pin()
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        reset_pin()
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.router.db_for_read(Booking), 'replica1')
+
+    def test_write_pins_following_reads(self):
+        self.assertEqual(self.router.db_for_write(Booking), 'default')
+        self.assertEqual(self.router.db_for_read(Booking), 'default')
+
+    def test_use_primary(self):
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Booking), 'default')
+        self.assertEqual(self.router.db_for_read(Booking), 'replica1')
+
+    def test_client_sticks_to_primary_after_write(self):
+        seen = []
+
+        def view(request):
+            seen.append(is_pinned())
+            return HttpResponse()
+
+        middleware = PrimaryStickinessMiddleware(view)
+        headers = {'HTTP_AUTHORIZATION': 'Bearer abc'}
+
+        middleware(self.factory.get('/api/bookings/', **headers))
+        middleware(self.factory.post('/api/bookings/', **headers))
+        middleware(self.factory.get('/api/bookings/', **headers))
+        # Another client is not affected
+        middleware(self.factory.get('/api/bookings/', HTTP_AUTHORIZATION='Bearer xyz'))
+
+        self.assertEqual(seen, [False, True, True, False])
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_configured(self):
+        self.assertEqual(self.router.db_for_read(Booking), 'default')
+
+
+@skipUnless('replica' in settings.DATABASES, "needs the second SQLite database of Automotive.test_settings")
+@override_settings(DATABASE_REPLICAS=['replica'], PRIMARY_STICKY_SECONDS=5)
+class ReplicaReadTests(TransactionTestCase):
+    """
+    End to end through the middleware. 'default' and 'replica' are separate
+    SQLite files; replicate() copies the primary over, and rows written
+    after that are missing from the replica, as with replication lag.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('ravi', 'ravi@example.com', 'pass')
+        self.replicate()
+        reset_pin()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def tearDown(self):
+        reset_pin()
+
+    def replicate(self):
+        for alias in ('default', 'replica'):
+            connections[alias].ensure_connection()
+        connections['default'].connection.backup(connections['replica'].connection)
+
+    def request(self, method, *args, **kwargs):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.client, method)(*args, **kwargs)
+        return response, len(primary), len(replica)
+
+    def models(self, response):
+        return sorted(v['model'] for v in response.data)
+
+    def test_separate_databases(self):
+        self.assertNotEqual(connections['default'].settings_dict['NAME'], connections['replica'].settings_dict['NAME'])
+        Vehicle.objects.create(owner=self.user, make='Honda', model='Jazz', year=2019)
+        self.assertEqual(Vehicle.objects.using('default').count(), 1)
+        self.assertEqual(Vehicle.objects.using('replica').count(), 0)
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        response, primary, replica = self.request(
+            'post', '/api/vehicles/', {'make': 'Honda', 'model': 'City', 'year': 2020}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        # Within the window: the new row, not yet on the replica, is read back from the primary
+        response, primary, replica = self.request('get', '/api/vehicles/')
+        self.assertEqual(self.models(response), ['City'])
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        # The replica catches up with the City, but not with a later write
+        self.replicate()
+        Vehicle.objects.create(owner=self.user, make='Honda', model='Jazz', year=2019)
+
+        # After the window: reads go to the replica and see its (lagging) rows
+        later = time.time() + 6
+        with patch('Automotive_app.db_router.time.time', return_value=later):
+            response, primary, replica = self.request('get', '/api/vehicles/')
+        self.assertEqual(self.models(response), ['City'])
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+
+# --- FAST LIST PATH ---
+
+class FastListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', 'admin@example.com', 'pass', is_staff=True)
+        cls.customer = User.objects.create_user('ravi', 'ravi@example.com', 'pass')
+        vehicle = Vehicle.objects.create(owner=cls.customer, make='Hyundai', model='Creta', year=2021)
+        oil = Service.objects.create(name='Oil Change', description='Synthetic oil', base_price='1499.00')
+        wash = Service.objects.create(name='Wash', description='Foam wash', base_price='299.50')
+
+        now = timezone.now()
+        for i in range(3):
+            booking = Booking.objects.create(
+                user=cls.customer, vehicle=vehicle, appointment_time=now - timedelta(days=i),
+                total_amount='1798.50', final_amount='1800.00' if i else None,
+            )
+            booking.services.set([oil, wash][:i + 1])
+
+        with_image = SparePart.objects.create(name='Brake Pad', brand='Bosch', price='2450.00', stock=4, image='spare_parts/bmw.jpg')
+        SparePart.objects.create(name='Wiper \u2028Blade', description='Rain', price='350.10', stock=0)
+
+        PartOrder.objects.create(user=cls.customer, part=with_image, vehicle=vehicle, total_price='4900.00', quantity=2)
+        PartOrder.objects.create(user=cls.customer, part=with_image, total_price='2450.00', phone_number='98765')
+
+        DentingRequest.objects.create(user=cls.customer, description='Scratch', vehicle_make='Hyundai', vehicle_model='Creta', damage_image='denting_photos/a.jpg')
+        DentingRequest.objects.create(user=cls.customer, description='Dent', vehicle_make='Kia', vehicle_model='Seltos', estimated_price='5000')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.request = RequestFactory().get('/')
+
+    def assertSameAsSerializer(self, url, queryset, serializer_class):
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        expected = serializer_class(queryset, many=True, context={'request': self.request}).data
+        self.assertEqual(response.content, ORJSONRenderer().render(expected))
+
+    def test_spare_parts(self):
+        self.assertSameAsSerializer('/api/spare-parts/', SparePart.objects.all(), SparePartSerializer)
+
+    def test_admin_bookings(self):
+        self.assertSameAsSerializer('/api/admin-bookings/', Booking.objects.order_by('-appointment_time'), BookingSerializer)
+
+    def test_admin_part_orders(self):
+        self.assertSameAsSerializer('/api/admin-part-orders/', PartOrder.objects.order_by('-created_at'), PartOrderSerializer)
+
+    def test_admin_denting(self):
+        self.assertSameAsSerializer('/api/admin-denting/', DentingRequest.objects.order_by('-created_at'), DentingRequestSerializer)
+
+    def test_one_query_per_many_relation(self):
+        mapper = FastList(PartOrderSerializer(context={'request': self.request}))
+        # orders + one query for the lines
+        with self.assertNumQueries(2):
+            rows = mapper.convert(mapper.values(PartOrder.objects.all()))
+        self.assertEqual(len(rows), 2)
+
+    def test_bookings_read_services_snapshot(self):
+        mapper = FastList(BookingSerializer(context={'request': self.request}))
+        with self.assertNumQueries(1):
+            rows = mapper.convert(mapper.values(Booking.objects.order_by('appointment_time')))
+        self.assertEqual([r['service_names'] for r in rows], [['Oil Change', 'Wash'], ['Oil Change', 'Wash'], ['Oil Change']])
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user('ravi', 'ravi@example.com', 'pass')
+        vehicle = Vehicle.objects.create(owner=self.customer, make='Hyundai', model='Creta', year=2021)
+        part = SparePart.objects.create(name='Brake Pad', brand='Bosch', price='2450.00', stock=4)
+        self.order = PartOrder.objects.create(
+            user=self.customer, part=part, vehicle=vehicle, total_price='4900.00', quantity=2,
+            shipping_address='12 MG Road',
+        )
+        PartOrderLine.objects.create(order=self.order, part=part, quantity=2, unit_price='2450.00', line_total='4900.00')
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        sql = [q['sql'] for q in queries if 'automotive_app_partorder"' in q['sql'].lower()]
+        return response.data[0], sql, [q['sql'].lower() for q in queries]
+
+    def test_fields_prune_columns_and_joins(self):
+        data, (sql,), queries = self.get('/api/part-orders/?fields=id,status')
+
+        self.assertEqual(dict(data), {'id': self.order.pk, 'status': 'Pending'})
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('shipping_address', sql)
+        self.assertFalse(any('partorderline' in q for q in queries))
+
+    def test_nested_fields_join_only_what_they_need(self):
+        data, (sql,), queries = self.get('/api/part-orders/?fields=id,part_details.name')
+
+        self.assertEqual(data['part_details'], {'name': 'Brake Pad'})
+        self.assertIn('automotive_app_sparepart', sql.lower())
+        self.assertNotIn('automotive_app_vehicle', sql.lower())
+        self.assertNotIn('"automotive_app_sparepart"."description"', sql.lower())
+        self.assertFalse(any('partorderline' in q for q in queries))
+
+    def test_full_response_prefetches_lines(self):
+        data, _, queries = self.get('/api/part-orders/')
+
+        self.assertEqual(data['vehicle'], self.order.vehicle_id)
+        self.assertEqual([line['quantity'] for line in data['lines']], [2])
+        self.assertEqual(sum('partorderline' in q for q in queries), 1)
+
+    def test_expand_nests_the_vehicle(self):
+        data, (sql,), _ = self.get('/api/part-orders/?fields=id,vehicle&expand=vehicle')
+
+        self.assertEqual(data['vehicle']['model'], 'Creta')
+        self.assertIn('automotive_app_vehicle', sql.lower())
+
+        data, _, _ = self.get('/api/part-orders/?fields=id,vehicle&expand=owner')
+        self.assertEqual(data['vehicle'], self.order.vehicle_id)
+
+    def test_fast_list_path_honours_fields(self):
+        self.client.force_authenticate(User.objects.create_user('admin', 'admin@example.com', 'pass', is_staff=True))
+        data, (sql,), queries = self.get('/api/admin-part-orders/?fields=id,part_details.name')
+
+        self.assertEqual(data, {'id': self.order.pk, 'part_details': {'name': 'Brake Pad'}})
+        self.assertNotIn('shipping_address', sql)
+        self.assertFalse(any('partorderline' in q for q in queries))
+
+    def test_writes_return_every_field(self):
+        response = self.client.patch(
+            f'/api/part-orders/{self.order.pk}/?fields=id', {'shipping_address': '14 MG Road'}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['shipping_address'], '14 MG Road')
+        self.assertIn('lines', response.data)
+
+
+class ServicesSnapshotTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        vehicle = Vehicle.objects.create(owner=user, make='Honda', model='City', year=2020)
+        self.oil = Service.objects.create(name='Oil Change', description='Synthetic oil', base_price='1499.00')
+        self.wash = Service.objects.create(name='Wash', description='Foam wash', base_price='299.50')
+        self.booking = Booking.objects.create(user=user, vehicle=vehicle, appointment_time=timezone.now())
+
+    def test_booked_prices_survive_catalog_changes(self):
+        self.booking.services.set([self.oil])
+        Service.objects.filter(pk=self.oil.pk).update(base_price='1999.00')
+        self.booking.services.add(self.wash)
+
+        self.booking.refresh_from_db()
+        self.assertEqual(
+            [(e['name'], e['base_price']) for e in self.booking.services_snapshot],
+            [('Oil Change', '1499.00'), ('Wash', '299.50')],
+        )
+        self.assertEqual(self.booking.total_amount, Decimal('1798.50'))
+
+    def test_remove_and_clear(self):
+        self.booking.services.set([self.oil, self.wash])
+        self.wash.booking_set.remove(self.booking)
+        self.booking.refresh_from_db()
+        self.assertEqual([e['id'] for e in self.booking.services_snapshot], [self.oil.pk])
+
+        self.booking.services.clear()
+        self.booking.refresh_from_db()
+        self.assertEqual((self.booking.services_snapshot, self.booking.total_amount), ([], Decimal('0.00')))
+
+    def test_completion_writes_history_items(self):
+        self.booking.services.set([self.oil, self.wash])
+        self.booking.status = 'COMPLETED'
+        self.booking.save()
+
+        history = ServiceHistory.objects.get()
+        self.assertEqual(history.services_rendered, 'Oil Change, Wash')
+        self.assertEqual(
+            list(history.items.order_by('service_id').values_list('service_id', 'booking_id', 'price')),
+            [(self.oil.pk, self.booking.pk, Decimal('1499.00')), (self.wash.pk, self.booking.pk, Decimal('299.50'))],
+        )
+
+    def test_edited_text_resyncs_items(self):
+        alignment = Service.objects.create(name='Wheel Alignment', description='', base_price='800.00')
+        self.booking.services.set([self.oil, self.wash])
+        self.booking.status = 'COMPLETED'
+        self.booking.save()
+        history = ServiceHistory.objects.get()
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True))
+
+        response = client.patch(f'/api/history/{history.pk}/update/', {'services_rendered': 'oil change, Wheel alignment, Tyre rotation'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(history.items.values_list('name', 'service_id', 'booking_id', 'price')),
+            [
+                ('Oil Change', self.oil.pk, self.booking.pk, Decimal('1499.00')),  # kept as booked
+                ('Tyre rotation', None, self.booking.pk, None),
+                ('Wheel alignment', alignment.pk, self.booking.pk, None),
+            ],
+        )
+
+        # Saves that leave the text alone do not touch the items
+        item_ids = set(history.items.values_list('pk', flat=True))
+        client.patch(f'/api/history/{history.pk}/update/', {'odometer_reading': 42000}, format='json')
+        self.assertEqual(set(history.items.values_list('pk', flat=True)), item_ids)
+
+
+# --- RESPONSE COMPRESSION ---
+
+class CompressionTests(TestCase):
+    body = json.dumps([{'id': i, 'name': 'Brake pad', 'brand': 'Bosch'} for i in range(100)]).encode()
+
+    def respond(self, accept='', body=None, **headers):
+        def view(request):
+            response = HttpResponse(self.body if body is None else body, content_type='application/json')
+            for name, value in headers.items():
+                response[name] = value
+            return response
+        request = RequestFactory().get('/api/spare-parts/', HTTP_ACCEPT_ENCODING=accept)
+        with override_settings(COMPRESSION_MIN_BYTES=1024):
+            return CompressionMiddleware(view)(request)
+
+    def test_negotiation(self):
+        self.assertEqual(choose_encoding('gzip, deflate, br'), 'br')
+        self.assertEqual(choose_encoding('gzip, br;q=0.5'), 'gzip')
+        self.assertEqual(choose_encoding('br;q=0, gzip'), 'gzip')
+        self.assertEqual(choose_encoding('*'), 'br')
+        self.assertEqual(choose_encoding('gzip;q=0, *;q=0.1'), 'br')
+        self.assertIsNone(choose_encoding('identity'))
+        self.assertIsNone(choose_encoding('gzip;q=0, br;q=0'))
+        self.assertIsNone(choose_encoding(''))
+
+    def test_compresses_with_the_preferred_coding(self):
+        response = self.respond('gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), self.body)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+
+        response = self.respond('gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.body)
+
+        response = self.respond('identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, self.body)
+
+    def test_small_bodies_are_sent_as_they_are(self):
+        small = self.body[:1000]
+        response = self.respond('br, gzip', body=small)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, small)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+        self.assertEqual(self.respond('br, gzip', body=self.body[:1024] + b' ')['Content-Encoding'], 'br')
+
+    def test_etag_turns_weak_and_vary_is_added(self):
+        response = self.respond('gzip', ETag='"abc"', Vary='Authorization')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertEqual(response['Vary'], 'Authorization, Accept-Encoding')
+
+        # Uncompressed responses keep the strong tag but still vary
+        response = self.respond('identity', ETag='"abc"')
+        self.assertEqual(response['ETag'], '"abc"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+        response = self.respond('gzip', ETag='W/"abc"')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+
+    def test_no_transform_is_respected(self):
+        response = self.respond('br, gzip', ETag='"abc"', **{'Cache-Control': 'private, No-Transform'})
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, self.body)
+        self.assertEqual(response['ETag'], '"abc"')
+
+    def test_other_types_and_encoded_bodies_are_skipped(self):
+        response = self.respond('gzip', **{'Content-Type': 'image/png'})
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertFalse(response.has_header('Vary'))
+
+        response = self.respond('gzip', **{'Content-Encoding': 'br'})
+        self.assertEqual(response.content, self.body)
+
+
+class ORJSONRendererTests(TestCase):
+    def test_matches_drf_json_renderer(self):
+        data = {
+            'price': Decimal('1499.50'),
+            'whole': Decimal('10'),
+            'utc': datetime(2026, 3, 1, 9, 30, 15, 123456, tzinfo=dt_timezone.utc),
+            'naive': datetime(2026, 3, 1, 9, 30),
+            'offset': datetime(2026, 3, 1, 9, 30, tzinfo=timezone.get_fixed_timezone(330)),
+            'date': date(2026, 3, 1),
+            'time': datetime(2026, 3, 1, 9, 30, 15, 123456).time(),
+            'duration': timedelta(hours=2),
+            'text': 'Café\u2028line',
+            'nested': [{'amount': Decimal('0.10')}, None, True],
+            7: 'int key',
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_indent_uses_drf_path(self):
+        data = {'price': Decimal('1.50')}
+        context = {'indent': 2}
+        self.assertEqual(
+            ORJSONRenderer().render(data, renderer_context=context),
+            JSONRenderer().render(data, renderer_context=context),
+        )
+
+
+# --- DELTA SYNC ---
+
+class DeltaSyncTests(NoBrokerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = User.objects.create_user('ravi', 'ravi@example.com', 'pass')
+        self.other = User.objects.create_user('anita', 'anita@example.com', 'pass')
+        self.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        self.vehicle = Vehicle.objects.create(owner=self.customer, make='Honda', model='City', year=2020)
+        self.old = self.booking(self.customer)
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        # Everything so far happened before the client's last poll
+        Booking.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        self.cursor = encode_cursor(timezone.now() - timedelta(minutes=30))
+
+    def booking(self, user):
+        return Booking.objects.create(user=user, vehicle=self.vehicle, appointment_time=timezone.now() + timedelta(days=1))
+
+    def poll(self, url, cursor=None, **filters):
+        response = self.client.get(url, {'since': cursor or self.cursor, **filters})
+        self.assertEqual(response.status_code, 200)
+        return [r['id'] for r in response.data['results']], response.data['deleted'], response.data['cursor']
+
+    def test_full_list_hands_out_a_cursor(self):
+        response = self.client.get('/api/bookings/')
+        self.assertEqual([b['id'] for b in response.data], [self.old.pk])
+        self.assertTrue(response['X-Sync-Cursor'])
+
+    def test_only_changed_rows(self):
+        self.assertEqual(self.poll('/api/bookings/')[:2], ([], []))
+
+        new = self.booking(self.customer)
+        self.booking(self.other)
+        results, deleted, cursor = self.poll('/api/bookings/')
+        self.assertEqual((results, deleted), ([new.pk], []))
+
+        # The next cursor overlaps this poll, so the row may come again but nothing older does
+        self.assertEqual(self.poll('/api/bookings/', cursor)[0], [new.pk])
+
+    def test_deletions_come_from_tombstones(self):
+        mine = [self.old.pk, self.booking(self.customer).pk]
+        theirs = self.booking(self.other).pk
+        Booking.objects.filter(pk__in=mine + [theirs]).delete()
+
+        results, deleted, _ = self.poll('/api/bookings/')
+        self.assertEqual((results, sorted(deleted)), ([], mine))
+
+        # Admin lists see every user's deletions
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(sorted(self.poll('/api/admin-bookings/')[1]), mine + [theirs])
+
+    def test_rows_leaving_a_filtered_list_are_deleted(self):
+        self.client.force_authenticate(self.staff)
+        pending = self.booking(self.customer)
+        confirmed = self.booking(self.customer)
+        confirmed.status = 'CONFIRMED'
+        confirmed.save()
+        self.old.status = 'CONFIRMED'
+        self.old.save()
+
+        results, deleted, _ = self.poll('/api/admin-bookings/', status='PENDING')
+        self.assertEqual(results, [pending.pk])
+        self.assertEqual(sorted(deleted), sorted([confirmed.pk, self.old.pk]))
+
+        results, deleted, _ = self.poll('/api/admin-bookings/', status='CONFIRMED')
+        self.assertEqual(sorted(results), sorted([confirmed.pk, self.old.pk]))
+        self.assertEqual(deleted, [pending.pk])
+
+    def test_bad_and_expired_cursors(self):
+        self.assertEqual(self.client.get('/api/bookings/', {'since': 'not-a-cursor'}).status_code, 400)
+        naive = encode_cursor(timezone.now().replace(tzinfo=None))
+        self.assertEqual(self.client.get('/api/bookings/', {'since': naive}).status_code, 400)
+
+        with override_settings(TOMBSTONE_RETENTION_DAYS=7):
+            expired = encode_cursor(timezone.now() - timedelta(days=8))
+            response = self.client.get('/api/bookings/', {'since': expired})
+            self.assertEqual(response.status_code, 410)
+            self.assertEqual(self.client.get('/api/bookings/', {'since': self.cursor}).status_code, 200)
+
+
+# --- STRIPE RECONCILIATION ---
+
+class StubStripe:
+    """Just enough of the stripe module: PaymentIntent.list(...).auto_paging_iter()."""
+
+    def __init__(self, intents):
+        stub = self
+
+        class PaymentIntent:
+            @staticmethod
+            def list(**params):
+                stub.list_params = params
+                return StubPage(intents)
+
+        self.PaymentIntent = PaymentIntent
+
+
+class StubPage:
+    def __init__(self, intents):
+        self.intents = intents
+
+    def auto_paging_iter(self):
+        return iter(self.intents)
+
+
+class ReconcileTests(NoBrokerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        vehicle = Vehicle.objects.create(owner=self.user, make='Honda', model='City', year=2020)
+        self.part = SparePart.objects.create(name='Filter', price='10.00', stock=5)
+
+        self.booking = Booking.objects.create(
+            user=self.user, vehicle=vehicle, appointment_time=timezone.now(),
+            total_amount='50.00', stripe_payment_intent_id='pi_booking',
+        )
+        self.order = PartOrder.objects.create(
+            user=self.user, part=self.part, quantity=2, total_price='20.00',
+            stripe_payment_intent_id='pi_order',
+        )
+        PartOrderLine.objects.create(order=self.order, part=self.part, quantity=2, unit_price='10.00', line_total='20.00')
+        self.cancelled = PartOrder.objects.create(
+            user=self.user, part=self.part, total_price='10.00', stripe_payment_intent_id='pi_cancelled',
+        )
+
+    def test_applies_stripe_status(self):
+        client = StubStripe([
+            {'id': 'pi_booking', 'status': 'succeeded'},
+            {'id': 'pi_order', 'status': 'succeeded'},
+            {'id': 'pi_cancelled', 'status': 'canceled'},
+            {'id': 'pi_unknown', 'status': 'succeeded'},
+        ])
+        since = timezone.now() - timedelta(hours=1)
+
+        result = reconcile_payments(since, client=client)
+
+        self.assertEqual(result, {'intents': 4, 'bookings': 1, 'orders': 2})
+        self.assertEqual(client.list_params['created'], {'gte': int(since.timestamp())})
+        self.booking.refresh_from_db()
+        self.order.refresh_from_db()
+        self.cancelled.refresh_from_db()
+        self.part.refresh_from_db()
+        self.assertEqual(self.booking.payment_status, 'PAID')
+        self.assertEqual(self.order.payment_status, 'PAID')
+        self.assertEqual(self.cancelled.payment_status, 'FAILED')
+        self.assertEqual(self.part.stock, 3)
+        self.assertEqual(self.emails.call_count, 2)
+
+    def test_publishes_bulk_status_changes(self):
+        client = StubStripe([{'id': 'pi_booking', 'status': 'succeeded'}, {'id': 'pi_cancelled', 'status': 'canceled'}])
+        with patch.object(realtime, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            reconcile_payments(timezone.now() - timedelta(hours=1), client=client)
+
+        events = {(args[1]['type'], args[1]['id']): args[1] for args, _ in publish.call_args_list}
+        self.assertEqual(events['booking', self.booking.pk]['payment_status'], 'PAID')
+        self.assertEqual(events['part_order', self.cancelled.pk]['payment_status'], 'FAILED')
+        self.assertTrue(all(args[0] == self.user.pk for args, _ in publish.call_args_list))
+
+    def test_closed_orders_are_refunded_not_paid(self):
+        PartOrder.objects.filter(pk=self.order.pk).update(status='Cancelled')
+        Booking.objects.filter(pk=self.booking.pk).update(status='CANCELLED')
+        client = StubStripe([{'id': 'pi_order', 'status': 'succeeded'}, {'id': 'pi_booking', 'status': 'succeeded'}])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = reconcile_payments(timezone.now() - timedelta(hours=1), client=client)
+
+        self.assertEqual((result['bookings'], result['orders']), (1, 1))
+        self.order.refresh_from_db()
+        self.booking.refresh_from_db()
+        self.part.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'REFUND_PENDING')
+        self.assertEqual(self.booking.payment_status, 'REFUND_PENDING')
+        self.assertEqual(self.part.stock, 5)  # no stock taken for a cancelled order
+        self.assertEqual(RefundJob.objects.filter(stripe_payment_intent_id__in=['pi_order', 'pi_booking']).count(), 2)
+        self.assertEqual(self.refund_tasks.call_count, 2)
+        self.emails.assert_not_called()
+
+    def test_second_run_changes_nothing(self):
+        client = StubStripe([{'id': 'pi_order', 'status': 'succeeded'}])
+        reconcile_payments(timezone.now() - timedelta(hours=1), client=client)
+
+        result = reconcile_payments(timezone.now() - timedelta(hours=1), client=client)
+
+        self.assertEqual(result['orders'], 0)
+        self.part.refresh_from_db()
+        self.assertEqual(self.part.stock, 3)
+
+
+# --- CART CHECKOUT ---
+
+class CheckoutTests(NoBrokerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user('meera', 'meera@example.com', 'pass')
+        self.pads = SparePart.objects.create(name='Brake Pads', price='450.00', stock=10)
+        self.oil = SparePart.objects.create(name='Engine Oil', price='600.00', stock=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        patcher = patch.object(stripe.PaymentIntent, 'create', return_value={'id': 'pi_cart', 'client_secret': 'pi_cart_secret'})
+        self.create_intent = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def checkout(self, items):
+        return self.client.post('/api/part-orders/checkout/', {'items': items}, format='json')
+
+    def test_orders_are_only_created_by_checkout(self):
+        body = {'part': self.pads.pk, 'quantity': 1, 'total_price': '450.00'}
+        self.assertEqual(self.client.post('/api/part-orders/', body, format='json').status_code, 405)
+        self.client.force_authenticate(User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True))
+        self.assertEqual(self.client.post('/api/admin-part-orders/', body, format='json').status_code, 405)
+        self.assertFalse(PartOrder.objects.exists())
+
+    def test_cart_is_one_order_and_one_intent(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.checkout([
+                {'part_id': self.pads.pk, 'quantity': 2},
+                {'part_id': self.oil.pk, 'quantity': 1},
+                {'part_id': self.pads.pk, 'quantity': 1},
+            ])
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['clientSecret'], 'pi_cart_secret')
+        self.create_intent.assert_called_once()
+        self.assertEqual(self.create_intent.call_args.kwargs['amount'], 195000)
+
+        order = PartOrder.objects.get(pk=response.data['order_id'])
+        self.assertEqual(order.total_price, Decimal('1950.00'))
+        self.assertEqual(order.quantity, 4)
+        self.assertIsNone(order.part)
+        self.assertEqual(
+            sorted(order.lines.values_list('part_id', 'quantity', 'line_total')),
+            sorted([(self.pads.pk, 3, Decimal('1350.00')), (self.oil.pk, 1, Decimal('600.00'))]),
+        )
+
+        sql = [q['sql'] for q in queries.captured_queries]
+        part_reads = [q for q in sql if q.startswith('SELECT') and 'FROM "Automotive_app_sparepart"' in q]
+        line_inserts = [q for q in sql if q.startswith('INSERT INTO "Automotive_app_partorderline"')]
+        self.assertEqual(len(part_reads), 1)
+        self.assertEqual(len(line_inserts), 1)
+
+    def test_stock_is_checked_before_paying(self):
+        response = self.checkout([{'part_id': self.pads.pk, 'quantity': 1}, {'part_id': self.oil.pk, 'quantity': 2}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['part_id'], self.oil.pk)
+        self.create_intent.assert_not_called()
+        self.assertFalse(PartOrder.objects.exists())
+
+    def test_unknown_part(self):
+        response = self.checkout([{'part_id': 999999, 'quantity': 1}])
+
+        self.assertEqual(response.status_code, 400)
+        self.create_intent.assert_not_called()
+
+    def test_payment_takes_stock_and_publishes(self):
+        order_id = self.checkout([{'part_id': self.pads.pk, 'quantity': 2}]).data['order_id']
+
+        with patch.object(stripe.PaymentIntent, 'retrieve', return_value={'status': 'succeeded'}), \
+                patch.object(realtime, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/part-orders/{order_id}/verify_part_payment/', {'payment_intent_id': 'pi_cart'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.pads.refresh_from_db()
+        self.assertEqual(self.pads.stock, 8)
+        publish.assert_called_once_with(self.user.pk, {'type': 'part_order', 'id': order_id, 'status': 'Pending', 'payment_status': 'PAID'})
+        self.assertEqual(self.emails.call_count, 1)
+
+
+# --- IDEMPOTENCY KEYS ---
+
+class IdempotencyTests(NoBrokerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user('meera', 'meera@example.com', 'pass')
+        self.part = SparePart.objects.create(name='Brake Pads', price='450.00', stock=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        patcher = patch.object(stripe.PaymentIntent, 'create', return_value={'id': 'pi_cart', 'client_secret': 'pi_cart_secret'})
+        self.create_intent = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def checkout(self, quantity=1, key='key-1'):
+        return self.client.post(
+            '/api/part-orders/checkout/', {'items': [{'part_id': self.part.pk, 'quantity': quantity}]},
+            format='json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_is_replayed(self):
+        first = self.checkout()
+        second = self.checkout()
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data, first.data)
+        self.create_intent.assert_called_once()
+        self.assertEqual(self.create_intent.call_args.kwargs['idempotency_key'], f'checkout-{self.user.pk}-key-1')
+        self.assertEqual(PartOrder.objects.count(), 1)
+
+    def test_key_reused_for_another_body(self):
+        self.checkout(quantity=1)
+
+        response = self.checkout(quantity=2)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(PartOrder.objects.count(), 1)
+
+    def test_duplicate_while_in_progress(self):
+        nested = []
+
+        def create(**kwargs):
+            if not nested:
+                nested.append(self.checkout())
+            return {'id': 'pi_cart', 'client_secret': 'pi_cart_secret'}
+        self.create_intent.side_effect = create
+
+        self.assertEqual(self.checkout().status_code, 200)
+        self.assertEqual(nested[0].status_code, 409)
+        self.assertEqual(nested[0]['Retry-After'], '1')
+        self.assertEqual(PartOrder.objects.count(), 1)
+
+    def test_stale_lock_is_taken_over(self):
+        stalled, nested = [], []
+
+        def create(**kwargs):
+            if not stalled:
+                # The first request stalls past IDEMPOTENCY_LOCK_TIMEOUT
+                stalled.append(True)
+                IdempotencyRecord.objects.filter(key='key-1').update(locked_at=timezone.now() - timedelta(minutes=5))
+                nested.append(self.checkout())
+            return {'id': 'pi_cart', 'client_secret': 'pi_cart_secret'}
+        self.create_intent.side_effect = create
+
+        self.checkout()
+
+        self.assertEqual(nested[0].status_code, 200)
+        self.assertFalse(nested[0].has_header('Idempotent-Replayed'))
+
+    def test_provider_failures_are_not_stored(self):
+        self.create_intent.side_effect = stripe.APIConnectionError('connection reset')
+        failed = self.checkout()
+        self.assertEqual(failed.status_code, 503)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+        self.create_intent.side_effect = stripe.APIError('boom')
+        self.assertEqual(self.checkout().status_code, 502)
+
+        self.create_intent.side_effect = None
+        retried = self.checkout()
+        self.assertEqual(retried.status_code, 200)
+        self.assertFalse(retried.has_header('Idempotent-Replayed'))
+
+    def test_paid_booking_gets_no_client_secret(self):
+        vehicle = Vehicle.objects.create(owner=self.user, make='Honda', model='City', year=2020)
+        booking = Booking.objects.create(
+            user=self.user, vehicle=vehicle, appointment_time=timezone.now(), total_amount='500.00',
+            payment_status='PAID', stripe_payment_intent_id='pi_paid', stripe_client_secret='pi_paid_secret',
+            stripe_intent_amount=50000, stripe_intent_created_at=timezone.now(),
+        )
+
+        response = self.client.post(f'/api/bookings/{booking.pk}/create_payment_intent/')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('clientSecret', response.data)
+        self.create_intent.assert_not_called()
+
+    def test_failed_booking_gets_a_new_intent(self):
+        vehicle = Vehicle.objects.create(owner=self.user, make='Honda', model='City', year=2020)
+        fields = dict(
+            user=self.user, vehicle=vehicle, appointment_time=timezone.now(), total_amount='500.00',
+            stripe_payment_intent_id='pi_open', stripe_client_secret='pi_open_secret',
+            stripe_intent_amount=50000, stripe_intent_created_at=timezone.now(),
+        )
+        open_booking = Booking.objects.create(**fields)
+        # Reconcile found this one's intent canceled
+        failed = Booking.objects.create(**fields, payment_status='FAILED')
+
+        response = self.client.post(f'/api/bookings/{open_booking.pk}/create_payment_intent/')
+        self.assertEqual(response.data, {'clientSecret': 'pi_open_secret'})
+        self.create_intent.assert_not_called()
+
+        response = self.client.post(f'/api/bookings/{failed.pk}/create_payment_intent/')
+        self.assertEqual(response.data, {'clientSecret': 'pi_cart_secret'})
+        self.create_intent.assert_called_once()
+        failed.refresh_from_db()
+        self.assertEqual((failed.stripe_payment_intent_id, failed.payment_status), ('pi_cart', 'PENDING'))
+
+
+# --- REFUNDS ---
+
+class RefundTests(NoBrokerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        part = SparePart.objects.create(name='Filter', price='10.00', stock=5)
+        self.order = PartOrder.objects.create(
+            user=self.user, part=part, total_price='20.00', payment_status='PAID', stripe_payment_intent_id='pi_paid',
+        )
+        patcher = patch.object(stripe.Refund, 'create', return_value={'id': 're_1', 'status': 'succeeded'})
+        self.create_refund = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def queue(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = queue_refund(self.order)
+            self.order.save()
+        return job
+
+    def test_queued_after_commit_and_refunded(self):
+        job = self.queue()
+        self.refund_tasks.assert_called_once_with(job.pk)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'REFUND_PENDING')
+
+        run_refund(job.pk)
+
+        job.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.stripe_refund_id), ('SUCCEEDED', 1, 're_1'))
+        self.assertEqual(self.order.payment_status, 'REFUNDED')
+        self.assertEqual(self.create_refund.call_args.kwargs['idempotency_key'], f'refund-{job.pk}-0')
+        self.assertEqual(self.emails.call_count, 1)
+        # A duplicate task message does nothing
+        self.assertIsNone(run_refund(job.pk))
+        self.create_refund.assert_called_once()
+
+    def test_transient_error_retries_then_gives_up(self):
+        job = self.queue()
+        self.create_refund.side_effect = stripe.APIConnectionError('timeout')
+
+        with self.assertRaises(RetryRefund):
+            run_refund(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('QUEUED', 1))
+
+        run_refund(job.pk, final_attempt=True)
+        job.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('FAILED', 2))
+        self.assertEqual(self.order.payment_status, 'PAID')
+        self.emails.assert_not_called()
+
+    @override_settings(REFUND_MAX_ATTEMPTS=20)
+    def test_backoff(self):
+        job = self.queue()
+        self.create_refund.side_effect = stripe.APIConnectionError('timeout')
+
+        for retries, countdown in [(0, 30), (3, 240), (10, 3600)]:
+            process_refund.push_request(retries=retries)
+            try:
+                with patch.object(process_refund, 'retry', return_value=Retry()) as retry, self.assertRaises(Retry):
+                    process_refund.run(job.pk)
+            finally:
+                process_refund.pop_request()
+            self.assertEqual(retry.call_args.kwargs['countdown'], countdown)
+
+    def test_failed_job_starts_over(self):
+        job = self.queue()
+        RefundJob.objects.filter(pk=job.pk).update(status='FAILED', attempts=8, last_error='gave up')
+        PartOrder.objects.filter(pk=self.order.pk).update(payment_status='PAID')
+        self.order.refresh_from_db()
+        self.refund_tasks.reset_mock()
+
+        self.assertEqual(self.queue().pk, job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.last_error), ('QUEUED', 0, ''))
+        self.refund_tasks.assert_called_once_with(job.pk)
+
+    def test_restarted_job_gets_a_new_idempotency_key(self):
+        job = self.queue()
+        self.create_refund.side_effect = stripe.InvalidRequestError('No such payment_intent', 'payment_intent')
+        run_refund(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        first_key = self.create_refund.call_args.kwargs['idempotency_key']
+
+        # The order was paid again with a new intent, then cancelled again
+        PartOrder.objects.filter(pk=self.order.pk).update(stripe_payment_intent_id='pi_again')
+        self.order.refresh_from_db()
+        self.queue()
+        self.create_refund.side_effect = None
+        run_refund(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.generation), ('SUCCEEDED', 1))
+        retry = self.create_refund.call_args.kwargs
+        self.assertEqual(retry['payment_intent'], 'pi_again')
+        self.assertEqual(retry['idempotency_key'], f'refund-{job.pk}-1')
+        self.assertNotEqual(retry['idempotency_key'], first_key)
+
+    def test_admin_status_update(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True))
+        url = f'/api/admin-part-orders/{self.order.pk}/update_status/'
+
+        response = client.post(url, {'status': 'Lost'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'Pending')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(url, {'status': 'Cancelled'}, format='json')
+        self.assertEqual(response.data['payment_status'], 'REFUND_PENDING')
+        # A second cancel sees the locked, updated row and queues nothing more
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(url, {'status': 'Cancelled'}, format='json')
+
+        self.assertEqual(RefundJob.objects.filter(order=self.order).count(), 1)
+        self.refund_tasks.assert_called_once()
+
+    def test_sweeper_requeues_lost_jobs(self):
+        job = self.queue()
+        # Recently touched jobs are left to their own task
+        RefundJob.objects.create(stripe_payment_intent_id='pi_new')
+        RefundJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=3))
+        self.refund_tasks.reset_mock()
+
+        self.assertEqual(sweep_refunds(), 1)
+        self.refund_tasks.assert_called_once_with(job.pk)
+
+
+# --- ABANDONED CHECKOUTS ---
+
+class StubIntents:
+    """PaymentIntent.cancel/retrieve for expire_stale_orders, keyed by intent id."""
+
+    def __init__(self, states):
+        stub = self
+        self.cancelled = []
+
+        class PaymentIntent:
+            @staticmethod
+            def cancel(intent_id):
+                state = states.get(intent_id, 'requires_payment_method')
+                if state == 'missing':
+                    raise stripe.InvalidRequestError('No such payment_intent', 'intent', code='resource_missing')
+                if state == 'down':
+                    raise stripe.APIConnectionError('timeout')
+                if state in ('succeeded', 'processing', 'canceled'):
+                    raise stripe.InvalidRequestError('Cannot cancel', None, code='payment_intent_unexpected_state')
+                stub.cancelled.append(intent_id)
+
+            @staticmethod
+            def retrieve(intent_id):
+                return {'id': intent_id, 'status': states[intent_id]}
+
+        self.PaymentIntent = PaymentIntent
+
+
+class ExpireOrdersTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.old = timezone.now() - timedelta(days=2)
+
+    def order(self, intent_id, created_at=None):
+        order = PartOrder.objects.create(user=self.user, total_price='10.00', stripe_payment_intent_id=intent_id)
+        PartOrder.objects.filter(pk=order.pk).update(created_at=created_at or self.old)
+        return order.pk
+
+    def test_only_unchargeable_intents_expire(self):
+        states = {
+            'pi_open': 'requires_payment_method', 'pi_gone': 'missing', 'pi_canceled': 'canceled',
+            'pi_paid': 'succeeded', 'pi_settling': 'processing', 'pi_down': 'down',
+        }
+        ids = {intent_id: self.order(intent_id) for intent_id in states}
+        no_intent = self.order(None)
+        fresh = self.order('pi_fresh', created_at=timezone.now())
+        client = StubIntents(states)
+
+        expired, skipped = expire_stale_orders(client=client)
+
+        self.assertEqual(expired, 4)
+        self.assertEqual(sorted(skipped), sorted([ids['pi_paid'], ids['pi_settling'], ids['pi_down']]))
+        self.assertEqual(client.cancelled, ['pi_open'])
+        statuses = dict(PartOrder.objects.values_list('pk', 'status'))
+        for intent_id in ('pi_open', 'pi_gone', 'pi_canceled'):
+            self.assertEqual(statuses[ids[intent_id]], 'Expired')
+        self.assertEqual(statuses[no_intent], 'Expired')
+        for intent_id in ('pi_paid', 'pi_settling', 'pi_down'):
+            self.assertEqual(statuses[ids[intent_id]], 'Pending')
+        self.assertEqual(statuses[fresh], 'Pending')
+
+    def test_settling_payment_is_retried_next_run(self):
+        states = {'pi_settling': 'processing'}
+        order_id = self.order('pi_settling')
+        self.assertEqual(expire_stale_orders(client=StubIntents(states)), (0, [order_id]))
+
+        # The payment failed meanwhile; the intent can be cancelled now
+        states['pi_settling'] = 'requires_payment_method'
+        self.assertEqual(expire_stale_orders(client=StubIntents(states)), (1, []))
+        self.assertEqual(PartOrder.objects.get(pk=order_id).payment_status, 'FAILED')
+
+
+# --- FILTER QUERY PLANS ---
+
+def fk_index(model, field):
+    """Name of the index Django created for a foreign key column."""
+    column = model._meta.get_field(field).column
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+    return next(
+        name for name, info in constraints.items()
+        if info['index'] and info['columns'] == [column]
+    )
+
+
+class FilterIndexTests(TestCase):
+    """Every filter must be answered from an index, not a table scan."""
+
+    def assertUsesIndex(self, filterset_class, queryset, params, index):
+        filterset = filterset_class(params, queryset=queryset)
+        self.assertTrue(filterset.is_valid(), filterset.errors)
+        plan = filterset.qs.explain()
+        self.assertIn(index, plan, f'{params} did not use {index}:\n{plan}')
+
+    def test_booking_filters(self):
+        qs = Booking.objects.order_by('-appointment_time')
+        self.assertUsesIndex(BookingFilter, qs, {'status': 'CONFIRMED'}, 'booking_status_time_idx')
+        self.assertUsesIndex(BookingFilter, qs, {'payment_status': 'PAID'}, 'booking_paystatus_time_idx')
+        self.assertUsesIndex(BookingFilter, qs, {'date_from': '2026-01-01', 'date_to': '2026-02-01'}, 'booking_time_idx')
+        self.assertUsesIndex(BookingFilter, qs, {'user': 1}, fk_index(Booking, 'user'))
+        self.assertUsesIndex(BookingFilter, qs, {'vehicle': 1}, 'booking_vehicle_time_idx')
+
+    def test_part_order_filters(self):
+        qs = PartOrder.objects.order_by('-created_at')
+        self.assertUsesIndex(PartOrderFilter, qs, {'payment_status': 'PAID'}, 'partorder_pay_status_time_idx')
+        self.assertUsesIndex(PartOrderFilter, qs, {'payment_status': 'PAID', 'status': 'Shipped'}, 'partorder_pay_status_time_idx')
+        self.assertUsesIndex(PartOrderFilter, qs, {'status': 'Shipped'}, 'partorder_status_time_idx')
+        self.assertUsesIndex(PartOrderFilter, qs, {'date_from': '2026-01-01'}, 'partorder_created_idx')
+        self.assertUsesIndex(PartOrderFilter, qs, {'user': 1}, fk_index(PartOrder, 'user'))
+        self.assertUsesIndex(PartOrderFilter, qs, {'vehicle': 1}, 'partorder_vehicle_time_idx')
+
+    def test_denting_filters(self):
+        qs = DentingRequest.objects.order_by('-created_at')
+        self.assertUsesIndex(DentingRequestFilter, qs, {'status': 'Pending Review'}, 'denting_status_time_idx')
+        self.assertUsesIndex(DentingRequestFilter, qs, {'date_to': '2026-01-01'}, 'denting_created_idx')
+        self.assertUsesIndex(DentingRequestFilter, qs, {'user': 1}, fk_index(DentingRequest, 'user'))
+
+    def test_service_history_filters(self):
+        qs = ServiceHistory.objects.order_by('-completion_date')
+        self.assertUsesIndex(ServiceHistoryFilter, qs, {'user': 1}, 'history_user_time_idx')
+        self.assertUsesIndex(ServiceHistoryFilter, qs, {'vehicle': 1}, 'history_vehicle_time_idx')
+        self.assertUsesIndex(ServiceHistoryFilter, qs, {'date_from': '2026-01-01'}, 'history_completion_idx')
+        # A customer's own history narrowed to one vehicle
+        self.assertUsesIndex(ServiceHistoryFilter, qs.filter(user_id=1), {'vehicle': 1}, 'history_')
+
+    def test_invalid_status_is_rejected(self):
+        filterset = BookingFilter({'status': 'NOPE'}, queryset=Booking.objects.all())
+        self.assertFalse(filterset.is_valid())
+
+
+# --- VEHICLE TIMELINE ---
+
+class VehicleTimelineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.vehicle = Vehicle.objects.create(owner=self.user, make='Honda', model='City', year=2020)
+        other = Vehicle.objects.create(owner=self.user, make='Kia', model='Seltos', year=2022)
+        part = SparePart.objects.create(name='Filter', price='10.00', stock=5)
+
+        now = timezone.now().replace(microsecond=0)
+        self.expected = []
+        for i in range(3):
+            booking = Booking.objects.create(user=self.user, vehicle=self.vehicle, appointment_time=now - timedelta(days=i))
+            self.expected.append((now - timedelta(days=i), 0, 'booking', booking.pk))
+            history = ServiceHistory.objects.create(user=self.user, vehicle=self.vehicle, services_rendered='Wash', total_paid='10.00')
+            # Same time as a booking: ties are broken by stream, then pk
+            ServiceHistory.objects.filter(pk=history.pk).update(completion_date=now - timedelta(days=i))
+            self.expected.append((now - timedelta(days=i), 1, 'service_history', history.pk))
+        for hours in (5, 30):
+            order = PartOrder.objects.create(user=self.user, part=part, vehicle=self.vehicle, total_price='10.00')
+            PartOrder.objects.filter(pk=order.pk).update(created_at=now - timedelta(hours=hours))
+            self.expected.append((now - timedelta(hours=hours), 2, 'part_order', order.pk))
+        PartOrder.objects.create(user=self.user, part=part, vehicle=other, total_price='10.00')
+        self.expected.sort(reverse=True)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pages_cover_the_merged_stream(self):
+        seen = []
+        url = f'/api/vehicles/{self.vehicle.pk}/timeline/?limit=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend((item['type'], item['data']['id']) for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [(kind, pk) for _, _, kind, pk in self.expected])
+
+    def test_other_users_vehicle(self):
+        stranger = User.objects.create_user('stranger', 'stranger@example.com', 'pass')
+        self.client.force_authenticate(stranger)
+        self.assertEqual(self.client.get(f'/api/vehicles/{self.vehicle.pk}/timeline/').status_code, 404)
+
+    def test_bad_cursor(self):
+        response = self.client.get(f'/api/vehicles/{self.vehicle.pk}/timeline/?cursor=nope')
+        self.assertEqual(response.status_code, 400)
+
+
+# --- DASHBOARD BOOTSTRAP ---
+
+class BootstrapTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        vehicle = Vehicle.objects.create(owner=self.user, make='Honda', model='City', year=2020)
+        oil = Service.objects.create(name='Oil Change', description='Synthetic oil', base_price='1499.00')
+        for i in range(3):
+            booking = Booking.objects.create(user=self.user, vehicle=vehicle, appointment_time=timezone.now() - timedelta(days=i))
+            booking.services.set([oil])
+        part = SparePart.objects.create(name='Filter', price='10.00', stock=5)
+        order = PartOrder.objects.create(user=self.user, part=part, total_price='10.00')
+        PartOrderLine.objects.create(order=order, part=part, quantity=1, unit_price='10.00', line_total='10.00')
+        other = User.objects.create_user('other', 'other@example.com', 'pass')
+        DentingRequest.objects.create(user=other, description='Dent', vehicle_make='Kia', vehicle_model='Seltos')
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_sections_and_limits(self):
+        response = self.client.get('/api/bootstrap/?bookings_limit=2')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['user']['username'], 'owner')
+        self.assertEqual(len(data['vehicles']), 1)
+        self.assertEqual(len(data['bookings']), 2)
+        self.assertEqual(data['bookings'][0]['service_names'], ['Oil Change'])
+        self.assertEqual(len(data['part_orders'][0]['lines']), 1)
+        self.assertEqual(data['denting_requests'], [])
+        self.assertEqual(data['more'], {'vehicles': False, 'bookings': True, 'part_orders': False, 'history': False, 'denting_requests': False})
+
+    def test_limits_come_from_settings(self):
+        limits = {'vehicles': 50, 'bookings': 1, 'part_orders': 20, 'history': 20, 'denting_requests': 20}
+        with override_settings(BOOTSTRAP_SECTION_LIMITS=limits, BOOTSTRAP_MAX_LIMIT=2):
+            data = self.client.get('/api/bootstrap/').json()
+            self.assertEqual((len(data['bookings']), data['more']['bookings']), (1, True))
+            # ?<section>_limit= is capped at BOOTSTRAP_MAX_LIMIT
+            data = self.client.get('/api/bootstrap/?bookings_limit=50').json()
+            self.assertEqual(len(data['bookings']), 2)
+
+    def test_fixed_query_count(self):
+        self.client.get('/api/bootstrap/')  # warm the role cache
+        # five sections + order lines
+        with self.assertNumQueries(6):
+            self.client.get('/api/bootstrap/')
+
+    def test_etag_revalidation(self):
+        first = self.client.get('/api/bootstrap/')
+        etag = first['ETag']
+
+        repeat = self.client.get('/api/bootstrap/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.content, b'')
+
+        Vehicle.objects.create(owner=self.user, make='Kia', model='Seltos', year=2022)
+        changed = self.client.get('/api/bootstrap/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+
+# --- BATCH REQUESTS ---
+
+class BatchTests(NoBrokerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('admin', 'admin@example.com', 'pass', is_staff=True)
+        customer = User.objects.create_user('ravi', 'ravi@example.com', 'pass')
+        vehicle = Vehicle.objects.create(owner=customer, make='Hyundai', model='Creta', year=2021)
+        self.bookings = [
+            Booking.objects.create(user=customer, vehicle=vehicle, appointment_time=timezone.now())
+            for _ in range(2)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def finalize(self, booking_id, amount):
+        return {'method': 'POST', 'path': f'/api/admin-bookings/{booking_id}/finalize_booking/', 'body': {'final_amount': amount}}
+
+    def test_runs_each_request(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/batch/', {'requests': [
+                self.finalize(self.bookings[0].pk, '2500.00'),
+                self.finalize(999999, '1.00'),
+                {'method': 'GET', 'path': '/api/user-details/'},
+            ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.data['results']], [200, 404, 200])
+        self.assertEqual(response.data['results'][2]['body']['username'], 'admin')
+        self.bookings[0].refresh_from_db()
+        self.assertEqual(self.bookings[0].status, 'COMPLETED')
+        self.assertEqual(self.emails.call_count, 1)
+
+    def test_atomic_rolls_back_on_failure(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/batch/', {'atomic': True, 'requests': [
+                self.finalize(self.bookings[0].pk, '2500.00'),
+                {'method': 'POST', 'path': f'/api/admin-bookings/{self.bookings[1].pk}/finalize_booking/', 'body': {}},
+            ]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.data['rolled_back'])
+        self.bookings[0].refresh_from_db()
+        self.assertEqual(self.bookings[0].status, 'PENDING')
+        # The first sub-request's email went down with the rollback
+        self.emails.assert_not_called()
+
+    def test_atomic_batch_emails_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/batch/', {'atomic': True, 'requests': [
+                self.finalize(self.bookings[0].pk, '2500.00'),
+                self.finalize(self.bookings[1].pk, '1800.00'),
+            ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['rolled_back'])
+        self.assertEqual(self.emails.call_count, 2)
+
+    def test_rejects_bad_batches(self):
+        self.assertEqual(self.client.post('/api/batch/', {'requests': []}, format='json').status_code, 400)
+        with override_settings(BATCH_MAX_REQUESTS=1):
+            response = self.client.post('/api/batch/', {'requests': [{'path': '/api/user-details/'}] * 2}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/api/batch/', {'requests': [
+            {'method': 'POST', 'path': '/api/batch/', 'body': {'requests': []}},
+            {'path': '/admin/'},
+        ]}, format='json')
+        self.assertEqual([r['status'] for r in response.data['results']], [400, 400])
+
+
+# --- MEDIA ---
+
+class MediaTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_SENDFILE_HEADER=None)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        os.makedirs(os.path.join(self.media_root, 'denting_photos'))
+        with open(os.path.join(self.media_root, 'denting_photos', 'dent.jpg'), 'wb') as f:
+            f.write(b'0123456789')
+
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.stranger = User.objects.create_user('stranger', 'stranger@example.com', 'pass')
+        self.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        DentingRequest.objects.create(
+            user=self.owner, description='Dent', vehicle_make='Kia', vehicle_model='Seltos',
+            damage_image='denting_photos/dent.jpg',
+        )
+        self.url = '/media/denting_photos/dent.jpg'
+
+    def get(self, user=None, **headers):
+        url = self.url
+        if user is not None:
+            url += f'?token={RefreshToken.for_user(user).access_token}'
+        return self.client.get(url, **headers)
+
+    def test_owner_and_staff_only(self):
+        response = self.get(self.owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertIn('private', response['Cache-Control'])
+
+        self.assertEqual(self.get(self.staff).status_code, 200)
+        self.assertEqual(self.get(self.stranger).status_code, 404)
+        self.assertEqual(self.get().status_code, 404)
+        self.assertEqual(self.client.get('/media/denting_photos/../../settings.py').status_code, 404)
+
+    def test_range_and_revalidation(self):
+        response = self.get(self.owner, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+        self.assertEqual(self.get(self.owner, HTTP_RANGE='bytes=-3').status_code, 206)
+        self.assertEqual(self.get(self.owner, HTTP_RANGE='bytes=20-').status_code, 416)
+
+        etag = response['ETag']
+        self.assertEqual(self.get(self.owner, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_offload_to_front_server(self):
+        with override_settings(MEDIA_SENDFILE_HEADER='X-Accel-Redirect'):
+            response = self.get(self.owner)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/denting_photos/dent.jpg')
+        self.assertEqual(response.content, b'')
+
+
+# --- RESTOCK FORECAST ---
+
+class ForecastTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass')
+        self.part = SparePart.objects.create(name='Wiper', price='100.00', stock=3)
+        self.now = timezone.now().replace(hour=15, minute=0, second=0, microsecond=0)
+        self.today = self.now.replace(hour=0)
+
+    def sell(self, quantity, created_at, payment_status='PAID'):
+        order = PartOrder.objects.create(user=self.user, total_price='100.00', payment_status=payment_status)
+        PartOrderLine.objects.create(order=order, part=self.part, quantity=quantity, unit_price='100.00', line_total='100.00')
+        PartOrder.objects.filter(pk=order.pk).update(created_at=created_at)
+
+    def test_smooth_and_suggest_known_series(self):
+        matrix = np.array([[1, 1, 1, 1, 1, 1, 1, 8, 0], [2] * 9, [0] * 9], dtype=np.float32)
+
+        # Warm-up mean 1, then 0.5 * 8 + 0.5 * 1 = 4.5, then 0.5 * 0 + 0.5 * 4.5
+        self.assertEqual(list(smooth(matrix, 0.5)), [2.25, 2.0, 0.0])
+
+        demand, cover, reorder = suggest(np.array([3.0, 10.0, 5.0]), matrix, alpha=0.5, lead_days=4, target_days=10, z=2.0)
+        self.assertAlmostEqual(cover[0], 3 / 2.25)
+        self.assertEqual(cover[1], 5.0)
+        self.assertTrue(np.isnan(cover[2]))
+        # 2.25 * 14 + 2 * std(row) * sqrt(4) - 3 = 37.54 -> 38; 2 * 14 - 10 = 18; no demand, no reorder
+        self.assertEqual(list(reorder), [38, 18, 0])
+
+    @override_settings(RESTOCK_HISTORY_DAYS=14)
+    def test_window_ends_at_midnight(self):
+        self.sell(5, self.today - timedelta(hours=14))      # yesterday
+        self.sell(100, self.today + timedelta(hours=9))     # today, partial day
+        self.sell(50, self.today - timedelta(days=15))      # before the window
+        self.sell(7, self.today - timedelta(days=2), payment_status='PENDING')
+
+        matrix = demand_matrix([self.part.pk], self.today - timedelta(days=14), 14)
+        self.assertEqual(matrix.shape, (1, 14))
+        self.assertEqual(matrix[0, -1], 5)
+        self.assertEqual(matrix.sum(), 5)
+
+        self.assertEqual(forecast_restock(now=self.now), 1)
+        suggestion = RestockSuggestion.objects.get(part=self.part)
+        self.assertEqual(suggestion.stock, 3)
+        self.assertAlmostEqual(suggestion.daily_demand, 0.3 * 5, places=4)
+        self.assertEqual(suggestion.computed_at, self.now)
+
+    def test_endpoint_lists_most_urgent_first(self):
+        other = SparePart.objects.create(name='Bulb', price='20.00', stock=50)
+        idle = SparePart.objects.create(name='Mat', price='20.00', stock=50)
+        for part, cover, reorder in [(other, 25.0, 0), (self.part, 1.5, 40), (idle, None, 0)]:
+            RestockSuggestion.objects.create(
+                part=part, stock=part.stock, daily_demand=2.0, days_of_cover=cover,
+                reorder_quantity=reorder, computed_at=self.now,
+            )
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True))
+
+        response = client.get('/api/admin/restock/')
+        self.assertEqual([row['part'] for row in response.data['results']], [self.part.pk, other.pk, idle.pk])
+
+        response = client.get('/api/admin/restock/?reorder=1')
+        self.assertEqual([row['part'] for row in response.data['results']], [self.part.pk])
+
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/api/admin/restock/').status_code, 403)
+
+
+# --- THROTTLING AND LOAD SHEDDING ---
+
+class ThrottleTests(TestCase):
+    # Half way through a minute window
+    START = 6000 * 60 + 30.0
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        patcher = patch('Automotive_app.throttling.time.time', return_value=self.START)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def attempt(self, ip='10.0.0.1'):
+        throttle = LoginRateThrottle()  # '10/min'
+        allowed = throttle.allow_request(self.factory.post('/api/login/', REMOTE_ADDR=ip), None)
+        return allowed, throttle.wait()
+
+    def test_limit_per_window(self):
+        self.assertTrue(all(self.attempt()[0] for _ in range(10)))
+        self.assertEqual(self.attempt(), (False, 30.0))
+        # Other clients have their own count
+        self.assertTrue(self.attempt(ip='10.0.0.2')[0])
+        # The refused request did not count
+        self.assertEqual(cache.get('throttle:login:10.0.0.1:6000'), 10)
+
+    def test_previous_window_slides_out(self):
+        for _ in range(10):
+            self.attempt()
+        # 15s into the next window, 75% of the previous ten still count
+        self.clock.return_value = self.START + 45
+        self.assertEqual([self.attempt()[0] for _ in range(3)], [True, True, False])
+        self.assertAlmostEqual(self.attempt()[1], 3.0)
+
+        self.clock.return_value = self.START + 48
+        self.assertTrue(self.attempt()[0])
+
+    def test_concurrent_requests_cannot_overspend(self):
+        results = []
+        barrier = threading.Barrier(20)
+
+        def worker():
+            barrier.wait()
+            results.append(self.attempt()[0])
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 10)
+
+    def test_field_throttle_skips_missing_value(self):
+        throttle = LoginUsernameThrottle()
+        request = self.factory.post('/api/login/')
+        request.data = {}
+        self.assertTrue(all(throttle.allow_request(request, None) for _ in range(20)))
+
+    def test_field_values_are_hashed(self):
+        throttle = LoginUsernameThrottle()
+
+        def key(username):
+            request = self.factory.post('/api/login/')
+            request.data = {'username': username}
+            return throttle.get_ident_key(request, None)
+
+        long_key = key(' Ravi Kumar\n' * 100)
+        self.assertEqual(long_key, key(' ravi kumar\n' * 100))
+        self.assertRegex(long_key, r'^username:[0-9a-f]{64}$')
+        self.assertNotEqual(key('ravi'), key('meera'))
+        self.assertEqual(key('  Ravi '), key('ravi'))
+
+    def test_ident_hook_is_abstract(self):
+        class Incomplete(SlidingWindowThrottle):
+            scope = 'login'
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+
+class ConcurrencyLimitTests(TestCase):
+    @override_settings(MAX_CONCURRENT_REQUESTS=1, LOAD_SHED_RETRY_AFTER=2)
+    def test_sheds_requests_over_the_limit(self):
+        inner = []
+
+        def view(request):
+            # A second request arrives while this one holds the only slot
+            if not inner:
+                inner.append(middleware(request))
+            return HttpResponse('ok')
+        middleware = ConcurrencyLimitMiddleware(view)
+        request = RequestFactory().get('/api/spare-parts/')
+
+        self.assertEqual(middleware(request).status_code, 200)
+        self.assertEqual(inner[0].status_code, 503)
+        self.assertEqual(inner[0]['Retry-After'], '2')
+        # The slot is released afterwards
+        self.assertEqual(middleware(request).status_code, 200)
+
+
+# --- REAL-TIME EVENTS ---
+
+@override_settings(REALTIME_HEARTBEAT_SECONDS=0.05)
+class RealtimeTests(NoBrokerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pass')
+        vehicle = Vehicle.objects.create(owner=self.user, make='Honda', model='City', year=2020)
+        self.booking = Booking.objects.create(user=self.user, vehicle=vehicle, appointment_time=timezone.now())
+
+    def read_stream(self, broker, send, events=1):
+        """
+        Frames of the owner's stream until `events` events and then a
+        heartbeat arrived; send() runs once the stream is subscribed.
+        """
+        async def run():
+            stream = realtime._event_stream(self.user.pk)
+            received = [await stream.__anext__()]
+            await asyncio.to_thread(send)
+            while len(received) < 50:
+                received.append(await asyncio.wait_for(stream.__anext__(), 5))
+                if received[-1] == ': ping\n\n' and sum(f.startswith('event:') for f in received) >= events:
+                    break
+            await stream.aclose()
+            return received
+
+        with patch.object(realtime, '_broker', broker):
+            return asyncio.run(run())
+
+    def test_status_change_published_to_owner_after_commit(self):
+        with patch.object(realtime, 'publish') as publish:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.booking.status = 'CONFIRMED'
+                self.booking.save()
+                self.booking.final_amount = 10
+                self.booking.save()  # no tracked field changed
+            publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        publish.assert_called_once_with(
+            self.user.pk, {'type': 'booking', 'id': self.booking.pk, 'status': 'CONFIRMED', 'payment_status': 'PENDING'}
+        )
+
+    def test_stream_delivers_own_events_and_heartbeats(self):
+        broker = realtime.InMemoryBroker()
+
+        def send():
+            broker.publish(self.other.pk, json.dumps({'type': 'booking', 'id': 999}))
+            broker.publish(self.user.pk, json.dumps({'type': 'booking', 'id': self.booking.pk}))
+
+        frames = self.read_stream(broker, send)
+
+        self.assertEqual(frames[0], ': connected\n\n')
+        # Only the owner's event arrives; the idle stream gets heartbeats
+        self.assertEqual(
+            [f for f in frames if not f.startswith(':')],
+            [f'event: booking\ndata: {{"type": "booking", "id": {self.booking.pk}}}\n\n'],
+        )
+        self.assertEqual(frames[-1], ': ping\n\n')
+        self.assertEqual(broker._subscribers, {})
+
+    def test_redis_broker_crosses_processes(self):
+        server = fakeredis.FakeServer()
+        # Publisher and subscriber use separate connections, as a worker and a web process would
+        with patch.object(redis.Redis, 'from_url', lambda url: fakeredis.FakeRedis(server=server)), \
+                patch.object(redis.asyncio.Redis, 'from_url', lambda url: fakeredis.FakeAsyncRedis(server=server)):
+            publisher = realtime.RedisBroker('redis://localhost:6379/0')
+            subscriber = realtime.RedisBroker('redis://localhost:6379/0')
+
+            def send():
+                publisher.publish(self.other.pk, json.dumps({'type': 'denting', 'id': 1}))
+                publisher.publish(self.user.pk, json.dumps({'type': 'part_order', 'id': 2}))
+
+            frames = self.read_stream(subscriber, send)
+
+        self.assertEqual(
+            [f for f in frames if not f.startswith(':')],
+            ['event: part_order\ndata: {"type": "part_order", "id": 2}\n\n'],
+        )
+
+    def test_broker_outage_does_not_fail_the_write(self):
+        broken = realtime.RedisBroker('redis://localhost:1/0')
+        with patch.object(broken, 'publish', side_effect=redis.ConnectionError('refused')), \
+                patch.object(realtime, '_broker', broken), self.captureOnCommitCallbacks(execute=True):
+            self.booking.status = 'CANCELLED'
+            self.booking.save()
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'CANCELLED')
+
+    def test_expired_orders_are_published(self):
+        order = PartOrder.objects.create(user=self.user, total_price='10.00', stripe_payment_intent_id='pi_old')
+        PartOrder.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=2))
+        client = type('Client', (), {'PaymentIntent': type('PaymentIntent', (), {'cancel': staticmethod(lambda intent_id: None)})})
+
+        with patch.object(realtime, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expire_stale_orders(client=client), (1, []))
+
+        publish.assert_called_once_with(
+            self.user.pk, {'type': 'part_order', 'id': order.pk, 'status': 'Expired', 'payment_status': 'FAILED'}
+        )
+
+
+# --- HOT/COLD ARCHIVE ---
+
+class ArchiveTests(NoBrokerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.vehicle = Vehicle.objects.create(owner=self.user, make='Honda', model='City', year=2020)
+        self.oil = Service.objects.create(name='Oil Change', description='', base_price='1500.00')
+        self.long_ago = timezone.now() - timedelta(days=800)
+
+    def booking(self, status, when, payment_status='PAID'):
+        booking = Booking.objects.create(user=self.user, vehicle=self.vehicle, appointment_time=when)
+        Booking.objects.filter(pk=booking.pk).update(status=status, payment_status=payment_status)
+        return booking.pk
+
+    def history(self, when, service=None):
+        entry = ServiceHistory.objects.create(
+            user=self.user, vehicle=self.vehicle, services_rendered=service.name if service else 'General Service',
+            total_paid='1500.00',
+        )
+        ServiceHistory.objects.filter(pk=entry.pk).update(completion_date=when)
+        if service:
+            ServiceHistoryItem.objects.create(history=entry, service=service, name=service.name, price=service.base_price)
+        return entry.pk
+
+    def test_moves_only_old_finished_rows(self):
+        done = self.booking('COMPLETED', self.long_ago)
+        open_booking = self.booking('PENDING', self.long_ago)
+        recent = self.booking('COMPLETED', timezone.now())
+
+        self.assertEqual(archive_batch('booking', get_cutoff(), 100), 1)
+        self.assertEqual(archive_batch('booking', get_cutoff(), 100), 0)
+
+        self.assertEqual(set(Booking.objects.values_list('pk', flat=True)), {open_booking, recent})
+        record = ArchivedRecord.objects.get()
+        self.assertEqual((record.kind, record.original_id, record.user_id), ('booking', done, self.user.pk))
+        self.assertEqual(record.payload['id'], done)
+
+    def test_history_keeps_items_and_latest_entry(self):
+        older = self.history(self.long_ago - timedelta(days=200), self.oil)
+        latest = self.history(self.long_ago, self.oil)
+        general = self.history(self.long_ago - timedelta(days=100))
+
+        moved, remaining = archive_old_rows(['service_history'])
+
+        self.assertEqual((moved, remaining), ({'service_history': 2}, False))
+        # The newest oil change still drives the reminder
+        self.assertEqual(list(ServiceHistory.objects.values_list('pk', flat=True)), [latest])
+        payloads = {r.original_id: r.payload for r in ArchivedRecord.objects.filter(kind='service_history')}
+        self.assertEqual(set(payloads), {older, general})
+        self.assertEqual(payloads[older]['items'], [
+            {'name': 'Oil Change', 'service': self.oil.pk, 'booking': None, 'price': '1500.00'},
+        ])
+        self.assertEqual(payloads[general]['items'], [])
+
+    def test_keeps_rows_with_unsettled_payments(self):
+        refund_pending = self.booking('CANCELLED', self.long_ago, 'REFUND_PENDING')
+        unpaid = self.booking('COMPLETED', self.long_ago, 'PENDING')
+        # Refunded, but the job row says otherwise: wait for it
+        refunding = self.booking('CANCELLED', self.long_ago, 'REFUNDED')
+        RefundJob.objects.create(booking_id=refunding, stripe_payment_intent_id='pi_1', status='PROCESSING')
+        refunded = self.booking('CANCELLED', self.long_ago, 'REFUNDED')
+        RefundJob.objects.create(booking_id=refunded, stripe_payment_intent_id='pi_2', status='SUCCEEDED')
+        never_paid = self.booking('CANCELLED', self.long_ago, 'PENDING')
+
+        part = SparePart.objects.create(name='Filter', price='10.00', stock=5)
+        order = PartOrder.objects.create(user=self.user, part=part, total_price='10.00')
+        PartOrder.objects.filter(pk=order.pk).update(
+            status='Cancelled', payment_status='REFUND_PENDING', created_at=self.long_ago,
+        )
+
+        moved, _ = archive_old_rows(['booking', 'part_order'])
+
+        self.assertEqual(moved, {'booking': 2, 'part_order': 0})
+        self.assertEqual(
+            set(ArchivedRecord.objects.values_list('original_id', flat=True)), {refunded, never_paid},
+        )
+        self.assertEqual(
+            set(Booking.objects.values_list('pk', flat=True)), {refund_pending, unpaid, refunding},
+        )
+        self.assertTrue(PartOrder.objects.filter(pk=order.pk).exists())
+        self.assertEqual(RefundJob.objects.count(), 1)
+
+    def test_bounded_runs_report_remaining_rows(self):
+        for _ in range(3):
+            self.booking('CANCELLED', self.long_ago, 'REFUNDED')
+
+        self.assertEqual(archive_old_rows(['booking'], batch_size=1, max_batches=2), ({'booking': 2}, True))
+        self.assertEqual(archive_old_rows(['booking'], batch_size=1, max_batches=2), ({'booking': 1}, False))
+
+    def test_archive_view(self):
+        other = User.objects.create_user('other', 'other@example.com', 'pass')
+        self.booking('COMPLETED', self.long_ago)
+        self.history(self.long_ago)
+        archive_old_rows()
+        ArchivedRecord.objects.create(kind='booking', original_id=999, user=other, occurred_at=self.long_ago, payload={})
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get('/api/history/archive/')
+        self.assertEqual(sorted(r['kind'] for r in response.data['results']), ['booking', 'service_history'])
+
+        response = client.get('/api/history/archive/?kind=service_history')
+        self.assertEqual([r['kind'] for r in response.data['results']], ['service_history'])
+        self.assertIn('items', response.data['results'][0]['data'])
+
+        client.force_authenticate(User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True))
+        self.assertEqual(len(client.get('/api/history/archive/?kind=booking').data['results']), 2)
+
+
+# --- SERVICE REMINDERS ---
+
+DAY = 86400.0
+
+
+class ComputeDueTests(TestCase):
+    # One service: every 180 days or 5000 km
+    intervals = (np.array([180.0]), np.array([5000.0]))
+
+    def due(self, vehicles, ts, odo, pair_row, pair_service, intervals=None):
+        arrays = [np.array(vehicles, dtype=np.int64), np.array(ts, dtype=np.float64),
+                  np.array(odo, dtype=np.float64), np.array(pair_row, dtype=np.int64),
+                  np.array(pair_service, dtype=np.int64)]
+        return compute_due(*arrays, *(intervals or self.intervals))
+
+    def test_km_interval_comes_first(self):
+        # 5000 km in 100 days is 50 km/day: the next 5000 km take 100 days, before the 180 day mark
+        vehicle, service, cycle, due = self.due([1, 1], [0, 100 * DAY], [10000, 15000], [1], [0])
+        self.assertEqual((list(vehicle), list(service), list(cycle)), ([1], [0], [100 * DAY]))
+        self.assertAlmostEqual(due[0], 200 * DAY)
+
+    def test_day_interval_comes_first(self):
+        # 1000 km in 100 days: 5000 km take 500 days, so the 180 days win
+        vehicle, service, cycle, due = self.due([1, 1], [0, 100 * DAY], [10000, 11000], [1], [0])
+        self.assertAlmostEqual(due[0], 280 * DAY)
+
+    def test_without_odometer_only_days_count(self):
+        vehicle, service, cycle, due = self.due([1], [10 * DAY], [0], [0], [0])
+        self.assertAlmostEqual(due[0], 190 * DAY)
+
+        # A km-only service has no due date without readings
+        vehicle, service, cycle, due = self.due(
+            [1], [10 * DAY], [0], [0], [0], (np.array([np.nan]), np.array([5000.0])),
+        )
+        self.assertEqual(len(due), 0)
+
+    def test_last_occurrence_of_each_pair(self):
+        # Rows out of time order; vehicle 2 did service 0 twice, vehicle 1 did both services once
+        vehicles = [2, 1, 2, 1]
+        ts = [50 * DAY, 20 * DAY, 10 * DAY, 30 * DAY]
+        intervals = (np.array([180.0, 30.0]), np.array([np.nan, np.nan]))
+        vehicle, service, cycle, due = self.due(vehicles, ts, [0] * 4, [0, 2, 1, 3], [0, 0, 0, 1], intervals)
+
+        result = {(int(v), int(s)): (c / DAY, d / DAY) for v, s, c, d in zip(vehicle, service, cycle, due)}
+        self.assertEqual(result, {(2, 0): (50, 230), (1, 0): (20, 200), (1, 1): (30, 60)})
+
+
+class ReminderTests(NoBrokerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.oil = Service.objects.create(name='Oil Change', description='', base_price='1500.00', interval_days=30)
+
+    def owner_with_service_due(self, username):
+        user = User.objects.create_user(username, f'{username}@example.com', 'pass')
+        vehicle = Vehicle.objects.create(owner=user, make='Honda', model='City', year=2020)
+        entry = ServiceHistory.objects.create(
+            user=user, vehicle=vehicle, services_rendered='Oil Change', total_paid='1500.00',
+        )
+        ServiceHistory.objects.filter(pk=entry.pk).update(completion_date=timezone.now() - timedelta(days=40))
+        ServiceHistoryItem.objects.create(history=entry, service=self.oil, name='Oil Change', price='1500.00')
+        return user
+
+    def test_rerun_does_not_remind_again(self):
+        self.owner_with_service_due('ravi')
+
+        self.assertEqual(queue_reminders(), 1)
+        self.assertEqual(send_reminders(), 1)
+        self.assertEqual(queue_reminders(), 0)
+        self.assertEqual(send_reminders(), 0)
+
+        self.assertEqual(ServiceReminder.objects.count(), 1)
+        self.assertEqual(self.emails.call_count, 1)
+        self.assertEqual(self.emails.call_args.args[2], ['ravi@example.com'])
+
+    def test_failure_mid_batch_keeps_earlier_owners_sent(self):
+        self.owner_with_service_due('ravi')
+        self.owner_with_service_due('anita')
+        queue_reminders()
+        self.emails.side_effect = [None, ConnectionError('broker down')]
+
+        with self.assertRaises(ConnectionError):
+            send_reminders()
+        self.assertEqual(ServiceReminder.objects.filter(sent_at__isnull=True).count(), 1)
+
+        self.emails.side_effect = None
+        self.assertEqual(send_reminders(), 1)
+        recipients = [c.args[2] for c in self.emails.call_args_list]
+        self.assertEqual(recipients, [['ravi@example.com'], ['anita@example.com'], ['anita@example.com']])
+
+
+# --- ROLES ---
+
+class RoleTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def make_user(self, username, **flags):
+        user = User.objects.create_user(username, f'{username}@example.com', 'pass', is_staff=flags.pop('is_staff', False))
+        if flags:
+            UserProfile.objects.filter(user=user).update(**flags)
+            profile = UserProfile.objects.get(user=user)
+            profile.save()
+        return user
+
+    def role_rows(self, user):
+        return set(UserRole.objects.filter(user=user).values_list('role', flat=True))
+
+    def toggle_role(self, user, role):
+        return self.client.patch(f'/api/admin/users/{user.pk}/toggle_role/', {'role': role}, format='json')
+
+    def toggle_staff(self, user):
+        request = APIRequestFactory().patch(f'/admin/users/{user.pk}/toggle_staff/')
+        force_authenticate(request, user=self.admin)
+        return toggle_staff_status(request, user_id=user.pk)
+
+
+class StaffManagementTests(RoleTestMixin, TestCase):
+    def test_pages_newest_first(self):
+        users = [self.make_user(f'user{i}') for i in range(55)]
+
+        page = self.client.get('/api/admin/users/').data
+        self.assertEqual(page['count'], 55)
+        self.assertEqual(len(page['results']), 50)
+        self.assertEqual(page['results'][0]['username'], 'user54')
+        self.assertIsNotNone(page['next'])
+
+        page = self.client.get('/api/admin/users/?page=2').data
+        self.assertEqual([u['id'] for u in page['results']], [u.pk for u in reversed(users[:5])])
+
+        self.assertEqual(len(self.client.get('/api/admin/users/?page_size=10').data['results']), 10)
+
+    def test_filters_by_role(self):
+        mechanic = self.make_user('mike', is_mechanic=True)
+        both = self.make_user('bea', is_staff=True, is_billing=True)
+        self.make_user('plain')
+
+        def listed(role):
+            response = self.client.get(f'/api/admin/users/?role={role}')
+            return {u['id'] for u in response.data['results']}
+
+        self.assertEqual(listed('mechanic'), {mechanic.pk})
+        self.assertEqual(listed('billing'), {both.pk})
+        # The superuser holds staff too but is never listed
+        self.assertEqual(listed('staff'), {both.pk})
+        self.assertEqual(listed('ecommerce'), set())
+
+    def test_unknown_role_is_rejected(self):
+        response = self.client.get('/api/admin/users/?role=janitor')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('janitor', response.data['error'])
+
+    def test_only_superusers(self):
+        self.client.force_authenticate(self.make_user('bob', is_staff=True))
+        self.assertEqual(self.client.get('/api/admin/users/').status_code, 403)
+
+
+class RoleIndexTests(RoleTestMixin, TestCase):
+    def test_toggles_keep_index_in_sync(self):
+        user = self.make_user('mike')
+        self.assertEqual(self.role_rows(user), set())
+
+        self.assertEqual(self.toggle_role(user, 'is_mechanic').status_code, 200)
+        self.assertEqual(self.toggle_role(user, 'is_staff').status_code, 200)
+        self.assertEqual(self.role_rows(user), {'mechanic', 'staff'})
+
+        self.assertEqual(self.toggle_staff(user).data, {'is_staff': False})
+        self.assertEqual(self.toggle_role(user, 'is_billing').status_code, 200)
+        self.assertEqual(self.toggle_role(user, 'is_mechanic').status_code, 200)
+        self.assertEqual(self.role_rows(user), {'billing'})
+
+    def test_toggle_recreates_missing_profile(self):
+        user = self.make_user('mike')
+        UserProfile.objects.filter(user=user).delete()
+
+        self.assertEqual(self.toggle_role(user, 'is_ecommerce').status_code, 200)
+        self.assertTrue(UserProfile.objects.get(user=user).is_ecommerce)
+        self.assertEqual(self.role_rows(user), {'ecommerce'})
+
+    def test_invalid_toggle_role(self):
+        user = self.make_user('mike')
+        self.assertEqual(self.toggle_role(user, 'is_superuser').status_code, 400)
+        self.assertEqual(self.toggle_role(User(pk=9999), 'is_mechanic').status_code, 404)
+
+    def test_migration_backfills_existing_users(self):
+        migration = importlib.import_module('Automotive_app.migrations.0034_userrole')
+        mechanic = self.make_user('mike', is_mechanic=True, is_ecommerce=True)
+        staff = self.make_user('sara', is_staff=True)
+        self.make_user('plain')
+        UserRole.objects.all().delete()
+
+        migration.create_roles_for_existing_users(django_apps, None)
+
+        self.assertEqual(self.role_rows(mechanic), {'mechanic', 'ecommerce'})
+        self.assertEqual(self.role_rows(staff), {'staff'})
+        self.assertEqual(self.role_rows(self.admin), {'staff'})
+        self.assertEqual(UserRole.objects.count(), 4)
+
+
+class RoleCacheTests(RoleTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        roles._local.clear()
+        self.user = self.make_user('mike', is_mechanic=True)
+
+    def roles_now(self):
+        return get_roles(User.objects.get(pk=self.user.pk))
+
+    def test_warm_lookups_skip_the_database(self):
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(get_roles(user), {'mechanic'})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_roles(user), {'mechanic'})
+            # Another instance of the same user, as the next request has
+            self.assertEqual(get_roles(User(pk=user.pk)), {'mechanic'})
+
+        # Local entry gone (expired or another process): the shared cache answers
+        roles._local.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_roles(user), {'mechanic'})
+
+    def test_user_save_invalidates(self):
+        user = User.objects.get(pk=self.user.pk)
+        get_roles(user)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.roles_now(), {'mechanic', 'staff'})
+
+    def test_profile_save_invalidates(self):
+        self.roles_now()
+        profile = UserProfile.objects.get(user=self.user)
+        profile.is_mechanic = False
+        profile.is_billing = True
+        profile.save()
+        self.assertEqual(self.roles_now(), {'billing'})
+
+    def test_login_does_not_invalidate(self):
+        user = User.objects.get(pk=self.user.pk)
+        get_roles(user)
+        user.last_login = timezone.now()
+        user.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            get_roles(user)
+
+    def test_toggle_views_invalidate(self):
+        self.roles_now()
+        self.toggle_role(self.user, 'is_mechanic')
+        self.assertEqual(self.roles_now(), set())
+
+        self.toggle_role(self.user, 'is_ecommerce')
+        self.assertEqual(self.roles_now(), {'ecommerce'})
+
+        self.toggle_staff(self.user)
+        self.assertEqual(self.roles_now(), {'ecommerce', 'staff'})
+
+
+# --- ADMIN SEARCH ---
+
+class SearchTests(NoBrokerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.ravi = User.objects.create_user('ravi', 'ravi@example.com', 'pass')
+        self.city = Vehicle.objects.create(owner=self.ravi, make='Honda', model='City', year=2020, license_plate='KA01AB1234')
+        self.booking = Booking.objects.create(
+            user=self.ravi, vehicle=self.city, appointment_time=timezone.now(), stripe_payment_intent_id='pi_3ka01',
+        )
+
+    def hits(self, query, **kwargs):
+        return [(hit['type'], hit['id']) for hit in search(query, **kwargs)]
+
+    def test_every_term_must_match(self):
+        other = User.objects.create_user('kiran', 'kiran@example.com', 'pass')
+        creta = Vehicle.objects.create(owner=other, make='Hyundai', model='Creta', year=2021, license_plate='KA02CD5678')
+        Booking.objects.create(user=other, vehicle=creta, appointment_time=timezone.now())
+
+        self.assertEqual(self.hits('honda ka01', kinds=['booking']), [('booking', self.booking.pk)])
+        self.assertEqual(self.hits('honda creta'), [])
+        self.assertEqual(self.hits('zzz'), [])
+
+    def test_ranking(self):
+        # Same plate prefix on another row: the exact plate token scores double
+        near = Vehicle.objects.create(owner=self.ravi, make='Tata', model='Nexon', year=2022, license_plate='KA01AB12345')
+        near_booking = Booking.objects.create(user=self.ravi, vehicle=near, appointment_time=timezone.now())
+
+        hits = search('ka01ab1234', kinds=['booking'])
+
+        self.assertEqual([(h['id'], h['score']) for h in hits], [(self.booking.pk, 10), (near_booking.pk, 5)])
+        # Username outranks owner fields; equal scores list the newest id first
+        self.assertEqual(
+            self.hits('ravi'), [('user', self.ravi.pk), ('booking', near_booking.pk), ('booking', self.booking.pk)]
+        )
+        self.assertEqual(len(search('ravi', limit=2)), 2)
+
+    def test_intersection_is_not_cut_by_common_terms(self):
+        # Thousands of postings for "ravi"; the one booking that also matches the plate is still found
+        SearchToken.objects.bulk_create(
+            [SearchToken(token='ravi', kind='booking', object_id=100000 + i, weight=1) for i in range(6000)]
+        )
+        self.assertEqual(self.hits('ravi ka01ab1234', kinds=['booking']), [('booking', self.booking.pk)])
+
+    def test_incremental_updates(self):
+        self.assertEqual(self.hits('honda', kinds=['booking']), [('booking', self.booking.pk)])
+
+        self.city.make = 'Maruti'
+        self.city.save()
+        self.assertEqual(self.hits('honda', kinds=['booking']), [])
+        self.assertEqual(self.hits('maruti', kinds=['booking']), [('booking', self.booking.pk)])
+
+        self.booking.stripe_payment_intent_id = 'pi_new'
+        self.booking.save()
+        self.assertEqual(self.hits('pi_new', kinds=['booking']), [('booking', self.booking.pk)])
+
+        self.booking.delete()
+        self.assertEqual(self.hits('maruti', kinds=['booking']), [])
+
+    def test_status_saves_do_not_reindex(self):
+        booking = Booking.objects.get(pk=self.booking.pk)
+        with CaptureQueriesContext(connection) as queries:
+            booking.status = 'CONFIRMED'
+            booking.save()
+        self.assertFalse([q for q in queries.captured_queries if 'searchtoken' in q['sql']])
+        # The hit still shows the live status
+        self.assertIn('CONFIRMED', search('ka01ab1234', kinds=['booking'])[0]['subtitle'])
+
+    def test_user_saves_reindex_only_on_searchable_changes(self):
+        def index_queries(change):
+            user = User.objects.get(pk=self.ravi.pk)
+            with CaptureQueriesContext(connection) as queries:
+                change(user)
+                user.save()
+            sql = [q['sql'] for q in queries.captured_queries]
+            return [q for q in sql if 'searchtoken' in q], [q for q in sql if 'automotive_app_booking' in q.lower()]
+
+        # Password resets and role toggles change nothing searchable
+        tokens, bookings = index_queries(lambda u: u.set_password('new-pass'))
+        self.assertEqual((tokens, bookings), ([], []))
+        tokens, bookings = index_queries(lambda u: setattr(u, 'is_staff', True))
+        self.assertEqual((tokens, bookings), ([], []))
+
+        # First name is on the user's own document only
+        tokens, bookings = index_queries(lambda u: setattr(u, 'first_name', 'Ravi'))
+        self.assertTrue(tokens)
+        self.assertEqual(bookings, [])
+        self.assertEqual(self.hits('ravi', kinds=['user']), [('user', self.ravi.pk)])
+
+        # The email shows on owned documents too
+        tokens, bookings = index_queries(lambda u: setattr(u, 'email', 'ravi.k@example.org'))
+        self.assertTrue(bookings)
+        self.assertEqual(self.hits('ravi.k', kinds=['booking']), [('booking', self.booking.pk)])
@@ -0,0 +1,138 @@
+"""
+Sliding-window throttles for the expensive public endpoints.
+
+Rates come from REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] like DRF's own
+throttles: '10/min' allows 10 requests in any rolling minute. Requests are
+counted per fixed window in the shared cache with cache.add + cache.incr,
+which are atomic in Redis and in the local-memory cache, so concurrent
+requests from several web processes cannot overspend the limit. The rolling
+count is estimated from the current window and the tail of the previous
+one:
+
+    count = current + previous * (share of the previous window still in range)
+
+A refused request gives its increment back (cache.decr), so a client that
+keeps hammering is cut to the rate instead of locked out.
+"""
+import hashlib
+import time
+from abc import ABCMeta, abstractmethod
+
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'10/min' -> (limit 10, window 60 seconds)"""
+    num, period = rate.split('/')
+    return int(num), DURATIONS[period[0]]
+
+
+class SlidingWindowThrottle(BaseThrottle, metaclass=ABCMeta):
+    """Subclasses set scope and say whose requests are counted together."""
+    scope = None
+    cache = cache
+
+    def __init__(self):
+        rate = api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        self.limit, self.period = parse_rate(rate)
+        self.wait_time = None
+
+    @abstractmethod
+    def get_ident_key(self, request, view):
+        """Return the identity requests are counted under, or None to skip throttling."""
+
+    def _count(self, key):
+        # Each window is read again as the "previous" one, so it lives two periods
+        self.cache.add(key, 0, self.period * 2)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Evicted between add and incr
+            self.cache.add(key, 1, self.period * 2)
+            return 1
+
+    def allow_request(self, request, view):
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return True
+
+        now = time.time()
+        window, elapsed = divmod(now, self.period)
+        prefix = f'throttle:{self.scope}:{ident}'
+        current = self._count(f'{prefix}:{int(window)}')
+        previous = self.cache.get(f'{prefix}:{int(window) - 1}', 0)
+
+        share = 1 - elapsed / self.period
+        if current + previous * share <= self.limit:
+            return True
+
+        try:
+            self.cache.decr(f'{prefix}:{int(window)}')
+        except ValueError:
+            pass
+        current -= 1
+        if previous and current < self.limit:
+            # Until enough of the previous window has slid out of range
+            self.wait_time = max(share - (self.limit - current - 1) / previous, 0) * self.period
+        else:
+            self.wait_time = self.period - elapsed
+        return False
+
+    def wait(self):
+        return self.wait_time
+
+
+class IPThrottle(SlidingWindowThrottle):
+    def get_ident_key(self, request, view):
+        return self.get_ident(request)
+
+
+class UserThrottle(SlidingWindowThrottle):
+    def get_ident_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+
+class RequestFieldThrottle(SlidingWindowThrottle):
+    """
+    Bucket per submitted value (e.g. the username being guessed from many IPs).
+    The value is hashed: the client picks its length and characters, and
+    cache keys must stay short and free of whitespace (memcached).
+    """
+    field = None
+
+    def get_ident_key(self, request, view):
+        value = request.data.get(self.field)
+        if not value:
+            return None
+        normalized = str(value).strip().lower()
+        return f'{self.field}:' + hashlib.sha256(normalized.encode()).hexdigest()
+
+
+# --- ENDPOINT THROTTLES ---
+
+class LoginRateThrottle(IPThrottle):
+    scope = 'login'
+
+
+class LoginUsernameThrottle(RequestFieldThrottle):
+    scope = 'login_username'
+    field = 'username'
+
+
+class PasswordResetRateThrottle(IPThrottle):
+    scope = 'password_reset'
+
+
+class PasswordResetEmailThrottle(RequestFieldThrottle):
+    scope = 'password_reset_email'
+    field = 'email'
+
+
+class CheckoutRateThrottle(UserThrottle):
+    scope = 'checkout'
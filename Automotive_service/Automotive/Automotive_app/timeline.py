@@ -0,0 +1,99 @@
+"""
+Per-vehicle activity timeline.
+
+    GET /api/vehicles/12/timeline/?limit=20
+    GET /api/vehicles/12/timeline/?cursor=<next from the previous page>
+
+Bookings, service history and part orders of one vehicle, newest first, as
+one stream. Each table is read with its own (vehicle, time) index, at most
+limit + 1 rows per page, and the sorted streams are combined with a k-way
+heapq.merge. The cursor is the merge key of the last item returned, so the
+next page continues every stream from exactly where the merged one stopped.
+
+Denting requests are not linked to a Vehicle row (they only carry free-text
+make/model) and are not part of the timeline.
+"""
+import base64
+import heapq
+from datetime import datetime
+
+from django.db.models import Q
+
+from .fastpath import optimize_queryset
+from .models import Booking, ServiceHistory, PartOrder
+from .serializers import BookingSerializer, ServiceHistorySerializer, PartOrderSerializer
+
+# kind -> (model, time field, serializer); the order breaks ties on equal times
+STREAMS = {
+    'booking': (Booking, 'appointment_time', BookingSerializer),
+    'service_history': (ServiceHistory, 'completion_date', ServiceHistorySerializer),
+    'part_order': (PartOrder, 'created_at', PartOrderSerializer),
+}
+RANK = {kind: i for i, kind in enumerate(STREAMS)}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(key):
+    time, rank, pk = key
+    raw = f"{time.isoformat()}|{rank}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        time, rank, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(time), int(rank), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid cursor.')
+
+
+def _after(kind, time_field, cursor):
+    """Rows of one stream that come after the cursor in (time, rank, pk) descending order."""
+    time, rank, pk = cursor
+    older = Q(**{f'{time_field}__lt': time})
+    if RANK[kind] < rank:
+        return older | Q(**{time_field: time})
+    if RANK[kind] == rank:
+        return older | Q(**{time_field: time, 'pk__lt': pk})
+    return older
+
+
+def _stream(kind, vehicle, cursor, limit, context):
+    model, time_field, serializer_class = STREAMS[kind]
+    queryset = model.objects.filter(vehicle=vehicle)
+    if cursor is not None:
+        queryset = queryset.filter(_after(kind, time_field, cursor))
+    serializer = serializer_class(context=context)
+    queryset = optimize_queryset(queryset.order_by(f'-{time_field}', '-pk'), serializer)
+
+    for obj in queryset[:limit]:
+        time = getattr(obj, time_field)
+        yield (time, RANK[kind], obj.pk), kind, obj
+
+
+def vehicle_timeline(vehicle, cursor=None, limit=20, context=None):
+    """One page of the timeline: (items, next cursor or None)."""
+    context = context or {}
+    streams = [_stream(kind, vehicle, cursor, limit + 1, context) for kind in STREAMS]
+    merged = heapq.merge(*streams, key=lambda entry: entry[0], reverse=True)
+
+    page = []
+    for entry in merged:
+        page.append(entry)
+        if len(page) > limit:
+            break
+    more = len(page) > limit
+    page = page[:limit]
+
+    items = [
+        {
+            'type': kind,
+            'time': key[0],
+            'data': STREAMS[kind][2](obj, context=context).data,
+        }
+        for key, kind, obj in page
+    ]
+    return items, encode_cursor(page[-1][0]) if more else None
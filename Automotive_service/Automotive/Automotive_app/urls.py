@@ -7,9 +7,13 @@ from .views import (
     RegisterView, login_view, get_user_details, PartOrderViewSet,
     AdminPartOrderViewSet, UserServiceHistoryView,
     ServiceHistoryUpdateView, # Now exists in views.py
+    ArchivedHistoryView, admin_search, RestockSuggestionView,
     request_password_reset,
     StaffManagementView, toggle_staff_status,password_reset_confirm, toggle_user_role
 )
+from .realtime import events_stream
+from .bootstrap import bootstrap
+from .batch import batch
 
 router = DefaultRouter()
 router.register(r'vehicles', VehicleViewSet, basename='vehicle')
@@ -31,7 +35,11 @@ urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', login_view, name='login'), 
     path('user-details/', get_user_details, name='user-details'),
+    path('bootstrap/', bootstrap, name='bootstrap'),  # dashboard data in one request
+    path('batch/', batch, name='batch'),  # several API calls in one request
+    path('events/', events_stream, name='events'),  # Server-Sent Events (status push)
     path('history/', UserServiceHistoryView.as_view(), name='user-history'),
+    path('history/archive/', ArchivedHistoryView.as_view(), name='archived-history'),
 
     # Individual Path for History Update
     path('history/<int:pk>/update/', ServiceHistoryUpdateView.as_view(), name='update-history'),
@@ -39,6 +47,8 @@ urlpatterns = [
     # Staff Management
     path('admin/users/', StaffManagementView.as_view(), name='staff-list'),
    path('admin/users/<int:user_id>/toggle_role/', toggle_user_role, name='toggle-user-role'),
+    path('admin/search/', admin_search, name='admin-search'),
+    path('admin/restock/', RestockSuggestionView.as_view(), name='admin-restock'),
 
     # Password Reset
     path('password-reset/', request_password_reset, name='password_reset_request'),
@@ -1,12 +1,15 @@
 from rest_framework import viewsets, generics, status, permissions
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, permission_classes, throttle_classes, action
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from django.db.models import Q, Sum
+from django.db import transaction
+from django.db.models import F, Q, Sum
 from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
 import stripe
 import logging
 
@@ -15,14 +18,28 @@ from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_decode
 from django.template.loader import render_to_string
-from .tasks import send_async_email
+from .tasks import send_email_on_commit
+from .db_router import primary_only
+from .fastpath import FastListMixin, QueryOptimizerMixin
+from .delta import DeltaSyncMixin
+from .throttling import (
+    LoginRateThrottle, LoginUsernameThrottle,
+    PasswordResetRateThrottle, PasswordResetEmailThrottle,
+    CheckoutRateThrottle,
+)
 from django.core.mail import EmailMultiAlternatives
 from django.utils.html import strip_tags
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-from .models import Vehicle, Service, Booking, SparePart, DentingRequest, PartOrder, ServiceHistory, UserProfile
+from .models import Vehicle, Service, Booking, SparePart, DentingRequest, PartOrder, PartOrderLine, ServiceHistory, UserProfile, ArchivedRecord, UserRole, RestockSuggestion
+from .orders import mark_orders_paid
+from .idempotency import idempotent, stripe_options
+from .refunds import queue_refund
+from .search import search
+from .timeline import vehicle_timeline, decode_cursor, InvalidCursor
+from .roles import ROLE_SOURCES, get_roles, role_flags
 from .serializers import (
     UserSerializer, 
     VehicleSerializer, 
@@ -31,8 +48,13 @@ from .serializers import (
     SparePartSerializer, 
     DentingRequestSerializer,
     PartOrderSerializer,
-    ServiceHistorySerializer
+    ServiceHistorySerializer,
+    ArchivedRecordSerializer, RestockSuggestionSerializer,
 )
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+from django_filters.rest_framework import DjangoFilterBackend
+from .filters import BookingFilter, PartOrderFilter, DentingRequestFilter, ServiceHistoryFilter
 
 # Initialize Stripe
 stripe.api_key = getattr(settings, 'STRIPE_SECRET_KEY', None)
@@ -50,7 +72,7 @@ class RegisterView(generics.CreateAPIView):
         user.save()
         
         # SEND WELCOME EMAIL ASYNC
-        send_async_email.delay(
+        send_email_on_commit(
             subject="Welcome to AutoMart!",
             message=f"Hi {user.username}, thanks for joining AutoMart. You can now add your vehicles and book services.",
             recipient_list=[user.email]
@@ -61,23 +83,12 @@ class IsStaffOrSpecialist(permissions.BasePermission):
     Allows access if the user is a superuser, staff, or has a specialist role.
     """
     def has_permission(self, request, view):
-        user = request.user
-        if not user or not user.is_authenticated:
-            return False
-            
-        # Check standard staff status or your custom Profile roles
-        is_specialist = False
-        if hasattr(user, 'profile'):
-            is_specialist = any([
-                user.profile.is_mechanic,
-                user.profile.is_billing,
-                user.profile.is_ecommerce
-            ])
-            
-        return user.is_superuser or user.is_staff or is_specialist
+        # Any role at all (superuser, staff or a specialist profile flag); cached per user
+        return bool(get_roles(request.user))
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginRateThrottle, LoginUsernameThrottle])
 def login_view(request):
     username = request.data.get('username')
     password = request.data.get('password')
@@ -87,22 +98,12 @@ def login_view(request):
         refresh = RefreshToken.for_user(user)
         has_vehicle = Vehicle.objects.filter(owner=user).exists()
         
-        # Safely get role flags from the profile
-        # Using getattr handles cases where a profile might not exist yet
-        is_mechanic = getattr(user.profile, 'is_mechanic', False) if hasattr(user, 'profile') else False
-        is_billing = getattr(user.profile, 'is_billing', False) if hasattr(user, 'profile') else False
-        is_ecommerce = getattr(user.profile, 'is_ecommerce', False) if hasattr(user, 'profile') else False
-
         return Response({
             'refresh': str(refresh),
             'access': str(refresh.access_token),
             'user': {
                 'username': user.username,
-                'is_staff': user.is_staff,
-                'is_superuser': user.is_superuser,
-                'is_mechanic': is_mechanic,   # ADDED
-                'is_billing': is_billing,     # ADDED
-                'is_ecommerce': is_ecommerce, # ADDED
+                **role_flags(user),  # is_staff, is_superuser, is_mechanic, is_billing, is_ecommerce
                 'has_vehicle': has_vehicle 
             }
         })
@@ -113,12 +114,12 @@ def login_view(request):
 def get_user_details(request):
     return Response({
         'username': request.user.username,
-        'is_staff': request.user.is_staff,
-        'is_superuser': request.user.is_superuser
+        **role_flags(request.user),
     })
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([PasswordResetRateThrottle, PasswordResetEmailThrottle])
 def request_password_reset(request):
     email = request.data.get('email')
     user = User.objects.filter(email=email).first()
@@ -143,7 +144,7 @@ def request_password_reset(request):
         """
         
         # Update your Celery task call to send HTML content
-        send_async_email.delay(
+        send_email_on_commit(
             subject=subject,
             message=text_content,
             recipient_list=[email],
@@ -183,7 +184,7 @@ def password_reset_confirm(request):
     return Response({"error": "Token Check Failed"}, status=400)
 # --- CORE FUNCTIONALITY VIEWSETS ---
 
-class VehicleViewSet(viewsets.ModelViewSet):
+class VehicleViewSet(QueryOptimizerMixin, viewsets.ModelViewSet):
     serializer_class = VehicleSerializer
     permission_classes = [IsAuthenticated]
     queryset = Vehicle.objects.all()
@@ -194,8 +195,29 @@ class VehicleViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        """Bookings, service history and part orders of this vehicle, newest first."""
+        vehicle = self.get_object()
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+            cursor = request.query_params.get('cursor')
+            items, next_cursor = vehicle_timeline(
+                vehicle, decode_cursor(cursor) if cursor else None, max(limit, 1),
+                context=self.get_serializer_context(),
+            )
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=400)
+        except ValueError:
+            return Response({'error': 'limit must be a number.'}, status=400)
+
+        next_url = None
+        if next_cursor:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)
+        return Response({'next': next_url, 'results': items})
+
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(QueryOptimizerMixin, viewsets.ModelViewSet):
     queryset = Service.objects.all()
     serializer_class = ServiceSerializer
     
@@ -205,7 +227,7 @@ class ServiceViewSet(viewsets.ModelViewSet):
         return [AllowAny()]
 
 
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(DeltaSyncMixin, QueryOptimizerMixin, viewsets.ModelViewSet):
     serializer_class = BookingSerializer
     permission_classes = [IsAuthenticated]
 
@@ -217,13 +239,15 @@ class BookingViewSet(viewsets.ModelViewSet):
         
 
         # SEND BOOKING CONFIRMATION EMAIL ASYNC
-        send_async_email.delay(
+        send_email_on_commit(
             "Service Booking Received",
             f"Your booking for {booking.services.name} is received.",
             [self.request.user.email] 
         )
 
     @action(detail=True, methods=['post'])
+    @primary_only
+    @idempotent
     def create_payment_intent(self, request, pk=None):
         try:
             booking = self.get_object()
@@ -231,18 +255,41 @@ class BookingViewSet(viewsets.ModelViewSet):
             
             if not charge_amount or charge_amount <= 0:
                 return Response({'error': 'Payment amount not set by administrator.'}, status=400)
-
-            amount_in_cents = int(float(charge_amount) * 100)
+            if booking.payment_status in ('PAID', 'REFUND_PENDING', 'REFUNDED'):
+                # The stored intent has been used; never hand its secret out again
+                return Response({'error': f'Booking payment is already {booking.payment_status}.'}, status=400)
+
+            amount_in_cents = int(charge_amount * 100)
+
+            # Reuse the open intent if the amount has not changed since it was created.
+            # FAILED means reconcile saw it canceled; its secret can no longer pay.
+            reuse_after = timezone.now() - timedelta(hours=settings.PAYMENT_INTENT_REUSE_HOURS)
+            if (
+                booking.payment_status != 'FAILED'
+                and booking.stripe_client_secret
+                and booking.stripe_intent_amount == amount_in_cents
+                and booking.stripe_intent_created_at
+                and booking.stripe_intent_created_at > reuse_after
+            ):
+                return Response({'clientSecret': booking.stripe_client_secret})
             
             intent = stripe.PaymentIntent.create(
                 amount=amount_in_cents,
                 currency='inr',
                 metadata={'booking_id': booking.id, 'type': 'service_booking'},
                 automatic_payment_methods={'enabled': True},
+                **stripe_options(request, f'booking-{booking.id}'),
             )
             
             booking.stripe_payment_intent_id = intent['id']
-            booking.save()
+            booking.stripe_client_secret = intent['client_secret']
+            booking.stripe_intent_amount = amount_in_cents
+            booking.stripe_intent_created_at = timezone.now()
+            booking.payment_status = 'PENDING'
+            booking.save(update_fields=[
+                'stripe_payment_intent_id', 'stripe_client_secret',
+                'stripe_intent_amount', 'stripe_intent_created_at', 'payment_status', 'updated_at',
+            ])
             
             return Response({'clientSecret': intent['client_secret']})
         except Exception as e:
@@ -250,6 +297,32 @@ class BookingViewSet(viewsets.ModelViewSet):
             return Response({'error': str(e)}, status=500)
 
     @action(detail=True, methods=['post'])
+    @primary_only
+    def cancel(self, request, pk=None):
+        try:
+            with transaction.atomic():
+                booking = Booking.objects.select_for_update().get(pk=self.get_object().pk)
+                if booking.status not in ['PENDING', 'CONFIRMED']:
+                    return Response({'error': f'Booking cannot be cancelled at stage: {booking.status}'}, status=400)
+
+                booking.status = 'CANCELLED'
+                if booking.payment_status == 'PAID' and booking.stripe_payment_intent_id:
+                    # Refund runs in the background; the customer is emailed when it succeeds
+                    queue_refund(booking)
+                booking.save()
+
+            if booking.payment_status != 'REFUND_PENDING':
+                send_email_on_commit(
+                    "Service Booking Cancelled",
+                    f"Your booking #{booking.id} has been cancelled.",
+                    [booking.user.email]
+                )
+            return Response({'status': 'Booking cancelled.', 'booking_status': booking.status, 'payment_status': booking.payment_status})
+        except Exception as e:
+            return Response({'error': str(e)}, status=400)
+
+    @action(detail=True, methods=['post'])
+    @primary_only
     def verify_payment(self, request, pk=None):
         payment_intent_id = request.data.get('payment_intent_id')
         try:
@@ -260,7 +333,7 @@ class BookingViewSet(viewsets.ModelViewSet):
                 booking.save()
 
                 # NOTIFY USER OF PAYMENT SUCCESS
-                send_async_email.delay(
+                send_email_on_commit(
                     "Service Payment Confirmed",
                     f"Payment for Booking #{booking.id} was successful. See you at the workshop!",
                     [booking.user.email]
@@ -280,7 +353,7 @@ from django.db.models import Q
 from .models import SparePart
 from .serializers import SparePartSerializer
 
-class SparePartViewSet(viewsets.ModelViewSet):
+class SparePartViewSet(FastListMixin, viewsets.ModelViewSet):
     serializer_class = SparePartSerializer
 
     def get_permissions(self):
@@ -310,6 +383,7 @@ class SparePartViewSet(viewsets.ModelViewSet):
         return queryset.filter(query)
 
     @action(detail=True, methods=['post'], permission_classes=[AllowAny])
+    @primary_only
     def sell(self, request, pk=None):
         """
         Custom endpoint: /api/parts/{id}/sell/
@@ -330,7 +404,7 @@ class SparePartViewSet(viewsets.ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-class DentingRequestViewSet(viewsets.ModelViewSet):
+class DentingRequestViewSet(DeltaSyncMixin, QueryOptimizerMixin, viewsets.ModelViewSet):
     serializer_class = DentingRequestSerializer
     permission_classes = [IsAuthenticated]
 
@@ -343,85 +417,127 @@ class DentingRequestViewSet(viewsets.ModelViewSet):
 
 # --- SPARE PART ORDERS ---
 
-class PartOrderViewSet(viewsets.ModelViewSet):
+class PartOrderViewSet(DeltaSyncMixin, QueryOptimizerMixin, viewsets.ModelViewSet):
     serializer_class = PartOrderSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         return PartOrder.objects.filter(user=self.request.user).order_by('-created_at')
 
-    @action(detail=False, methods=['post'])
+    def create(self, request, *args, **kwargs):
+        # Orders without lines would skip stock accounting; checkout creates both
+        return Response({'error': 'Place orders through /api/part-orders/checkout/.'}, status=405)
+
+    @action(detail=False, methods=['post'], throttle_classes=[CheckoutRateThrottle])
+    @primary_only
+    @idempotent
     def checkout(self, request):
+        """
+        One order, one PaymentIntent for a whole cart:
+            {"items": [{"part_id": 3, "quantity": 2}, ...], "vehicle_id": ..., ...}
+        The single-part form {"part_id": 3, "quantity": 2} still works.
+        """
         try:
-            part_id = request.data.get('part_id')
             vehicle_id = request.data.get('vehicle_id')
             phone = request.data.get('phone_number')
             address = request.data.get('shipping_address')
-            # 1. Get quantity from request, default to 1
-            quantity = int(request.data.get('quantity', 1)) 
-            
-            part = SparePart.objects.get(id=part_id)
-            
-            # 2. Check if enough stock is available
-            if part.stock < quantity:
-                return Response({'error': f'Only {part.stock} items left in stock.'}, status=400)
+
+            # 1. Collect the cart (merging repeated parts)
+            items = request.data.get('items') or [
+                {'part_id': request.data.get('part_id'), 'quantity': request.data.get('quantity', 1)}
+            ]
+            quantities = {}
+            for item in items:
+                part_id, quantity = int(item['part_id']), int(item.get('quantity', 1))
+                if quantity < 1:
+                    return Response({'error': 'Quantity must be at least 1.'}, status=400)
+                quantities[part_id] = quantities.get(part_id, 0) + quantity
+
+            # 2. Validate every line's stock with one query
+            parts = SparePart.objects.only('id', 'name', 'price', 'stock').in_bulk(list(quantities))
+            missing = [pid for pid in quantities if pid not in parts]
+            if missing:
+                return Response({'error': f'Part(s) not found: {missing}'}, status=400)
+            for part_id, quantity in quantities.items():
+                part = parts[part_id]
+                if part.stock < quantity:
+                    return Response({'error': f'Only {part.stock} items left in stock.', 'part_id': part_id}, status=400)
 
             vehicle = Vehicle.objects.get(id=vehicle_id) if vehicle_id else None
 
-            # 3. Calculate total price based on quantity
-            total_price = float(part.price) * quantity
-            amount_in_cents = int(total_price * 100)
+            # 3. Price the lines
+            lines = [
+                PartOrderLine(part=parts[pid], quantity=q, unit_price=parts[pid].price, line_total=parts[pid].price * q)
+                for pid, q in quantities.items()
+            ]
+            total_price = sum(line.line_total for line in lines)
+            total_quantity = sum(quantities.values())
 
             intent = stripe.PaymentIntent.create(
-                amount=amount_in_cents,
+                amount=int(total_price * 100),
                 currency='inr',
                 metadata={
                     'user': request.user.username, 
                     'type': 'spare_part_purchase',
-                    'quantity': quantity # Useful for Stripe dashboard
+                    'quantity': total_quantity, # Useful for Stripe dashboard
+                    'lines': len(lines),
                 },
                 automatic_payment_methods={'enabled': True},
+                **stripe_options(request, 'checkout'),
             )
 
-            order = PartOrder.objects.create(
-                user=request.user,
-                part=part,
-                vehicle=vehicle,
-                phone_number=phone,
-                shipping_address=address,
-                # 4. Save the calculated total and the quantity
-                total_price=total_price,
-                quantity=quantity, # Ensure your PartOrder model has this field!
-                payment_status='PENDING',
-                stripe_payment_intent_id=intent['id']
-            )
+            # 4. Order header + all lines in one transaction
+            with transaction.atomic():
+                order = PartOrder.objects.create(
+                    user=request.user,
+                    part=lines[0].part if len(lines) == 1 else None,
+                    vehicle=vehicle,
+                    phone_number=phone,
+                    shipping_address=address,
+                    total_price=total_price,
+                    quantity=total_quantity,
+                    payment_status='PENDING',
+                    stripe_payment_intent_id=intent['id']
+                )
+                for line in lines:
+                    line.order = order
+                PartOrderLine.objects.bulk_create(lines)
 
             return Response({'clientSecret': intent['client_secret'], 'order_id': order.id})
-        except Exception as e:
+        except (KeyError, TypeError, ValueError, Vehicle.DoesNotExist) as e:
+            return Response({'error': str(e)}, status=400)
+        except stripe.InvalidRequestError as e:
             logger.error(f"Part Checkout Error: {str(e)}")
             return Response({'error': str(e)}, status=400)
+        # Transient or unexpected failures are 5xx, so @idempotent does not
+        # store them and a retry with the same key runs again
+        except (stripe.APIConnectionError, stripe.RateLimitError) as e:
+            logger.error(f"Part Checkout Error: {str(e)}")
+            return Response({'error': 'Payment service unavailable, please retry.'}, status=503, headers={'Retry-After': '5'})
+        except stripe.StripeError as e:
+            logger.error(f"Part Checkout Error: {str(e)}")
+            return Response({'error': 'Payment service error, please retry.'}, status=502)
+        except Exception as e:
+            logger.error(f"Part Checkout Error: {str(e)}")
+            return Response({'error': 'Checkout failed, please retry.'}, status=500)
         
     @action(detail=True, methods=['post'])
+    @primary_only
     def verify_part_payment(self, request, pk=None):
         payment_intent_id = request.data.get('payment_intent_id')
         try:
+            order = self.get_object()
+            if payment_intent_id != order.stripe_payment_intent_id:
+                return Response({'error': 'Payment does not belong to this order'}, status=400)
+
             intent = stripe.PaymentIntent.retrieve(payment_intent_id)
             if intent['status'] == 'succeeded':
-                order = self.get_object()
-                
-                # Prevent duplicate stock reduction if user refreshes
-                if order.payment_status != 'PAID':
-                    part = order.part
-                    part.stock -= order.quantity # Decrement by ordered amount
-                    part.save()
-                    
-                    order.payment_status = 'PAID'
-                    order.save()
-
+                # Takes every line's stock atomically; skipped if already PAID
+                if mark_orders_paid([order.pk]):
                     # NOTIFY USER
-                    send_async_email.delay(
+                    send_email_on_commit(
                         "AutoMart Order Confirmed",
-                        f"Your order for {order.quantity}x {order.part.name} is confirmed.",
+                        f"Your order for {order.describe_items()} is confirmed.",
                         [order.user.email]
                     )
 
@@ -431,36 +547,32 @@ class PartOrderViewSet(viewsets.ModelViewSet):
             return Response({'error': str(e)}, status=400)
         
     @action(detail=True, methods=['post'])
+    @primary_only
     def cancel_order(self, request, pk=None):
         try:
-            order = self.get_object()
-
-            send_async_email.delay(
-                "Service Final Quote",
-                f"Order cancellation requested for {order.part.name} completed. Amount will be refunded in due course.",
-                [order.user.email]
+            with transaction.atomic():
+                order = PartOrder.objects.select_for_update().get(pk=self.get_object().pk)
+                if order.status not in ['Pending', 'Confirmed']:
+                    return Response({'error': f'Order cannot be cancelled at stage: {order.status}'}, status=400)
 
-                
-            )
-            
-            if order.payment_status == 'PAID':
-                if not order.stripe_payment_intent_id:
-                    return Response({'error': 'No payment record found to refund.'}, status=400)
-                
-                refund = stripe.Refund.create(payment_intent=order.stripe_payment_intent_id)
-                if refund.status in ['succeeded', 'pending']:
-                    order.payment_status = 'REFUNDED'
-                else:
-                    return Response({'error': f'Refund failed: {refund.status}'}, status=400)
-
-            if order.status in ['Pending', 'Confirmed']:
                 order.status = 'Cancelled'
+                if order.payment_status == 'PAID':
+                    if not order.stripe_payment_intent_id:
+                        return Response({'error': 'No payment record found to refund.'}, status=400)
+                    # Refund runs in the background; the customer is emailed when it succeeds
+                    queue_refund(order)
                 order.save()
-                
-                msg = "Order cancelled and refund initiated." if order.payment_status == 'REFUNDED' else "Order cancelled."
-                return Response({'status': msg, 'order_status': order.status, 'payment_status': order.payment_status}, status=status.HTTP_200_OK)
-            
-            return Response({'error': f'Order cannot be cancelled at stage: {order.status}'}, status=400)
+
+            if order.payment_status == 'REFUND_PENDING':
+                msg = "Order cancelled and refund initiated."
+            else:
+                msg = "Order cancelled."
+                send_email_on_commit(
+                    "AutoMart Order Cancelled",
+                    f"Your order for {order.describe_items()} has been cancelled.",
+                    [order.user.email]
+                )
+            return Response({'status': msg, 'order_status': order.status, 'payment_status': order.payment_status}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({'error': str(e)}, status=400)
 
@@ -469,9 +581,12 @@ class PartOrderViewSet(viewsets.ModelViewSet):
 
 # --- ADMIN VIEWSETS ---
 
-class AdminBookingViewSet(viewsets.ModelViewSet):
+class AdminBookingViewSet(DeltaSyncMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Booking.objects.all().order_by('-appointment_time')
     serializer_class = BookingSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = BookingFilter
+    delta_all_users = True
     # UPDATED: Changed from IsAdminUser to IsStaffOrSpecialist
     permission_classes = [IsStaffOrSpecialist] 
 
@@ -488,7 +603,7 @@ class AdminBookingViewSet(viewsets.ModelViewSet):
             booking.status = 'COMPLETED'
             booking.save()
 
-            send_async_email.delay(
+            send_email_on_commit(
                 "Service Final Quote",
                 f"Your service is complete. The final amount is {final_amount}. Please pay via your dashboard.",
                 [booking.user.email]
@@ -501,42 +616,51 @@ class AdminBookingViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=400)
 
-class AdminDentingViewSet(viewsets.ModelViewSet):
+class AdminDentingViewSet(DeltaSyncMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = DentingRequest.objects.all().order_by('-created_at')
     serializer_class = DentingRequestSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = DentingRequestFilter
+    delta_all_users = True
     # UPDATED: Changed from IsAdminUser to IsStaffOrSpecialist
     permission_classes = [IsStaffOrSpecialist] 
 
-class AdminPartOrderViewSet(viewsets.ModelViewSet):
+class AdminPartOrderViewSet(DeltaSyncMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = PartOrder.objects.all().order_by('-created_at')
     serializer_class = PartOrderSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = PartOrderFilter
+    delta_all_users = True
     # UPDATED: Changed from IsAdminUser to IsStaffOrSpecialist
     permission_classes = [IsStaffOrSpecialist] 
 
+    def create(self, request, *args, **kwargs):
+        return Response({'error': 'Place orders through /api/part-orders/checkout/.'}, status=405)
+
     @action(detail=True, methods=['post'])
+    @primary_only
     def update_status(self, request, pk=None):
         try:
-            order = self.get_object()
             new_status = request.data.get('status')
-            
             if not new_status:
                 return Response({'error': 'Status is required'}, status=400)
+            if new_status not in dict(PartOrder.ORDER_STATUS):
+                return Response({'error': f'Unknown status: {new_status}'}, status=400)
+
+            with transaction.atomic():
+                # Row lock: two concurrent cancels must not both queue a refund
+                order = PartOrder.objects.select_for_update().get(pk=self.get_object().pk)
+                order.status = new_status
+                if new_status == 'Cancelled' and order.payment_status == 'PAID':
+                    if order.stripe_payment_intent_id:
+                        queue_refund(order)
+                order.save()
 
-            order.status = new_status
-            
-            send_async_email.delay(
+            send_email_on_commit(
                 f"AutoMart Order Update: {new_status}",
                 f"Your part order status has changed to: {new_status}",
                 [order.user.email]
             )
-            
-            if new_status == 'Cancelled' and order.payment_status == 'PAID':
-                if order.stripe_payment_intent_id:
-                    refund = stripe.Refund.create(payment_intent=order.stripe_payment_intent_id)
-                    if refund.status in ['succeeded', 'pending']:
-                        order.payment_status = 'REFUNDED'
-            
-            order.save()
             return Response({
                 'status': f'Order updated to {new_status}',
                 'payment_status': order.payment_status
@@ -546,8 +670,8 @@ class AdminPartOrderViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        revenue = PartOrder.objects.filter(payment_status='PAID').exclude(status='Cancelled').aggregate(total=Sum('total_price'))['total'] or 0
-        active_distributions = PartOrder.objects.exclude(status__in=['Cancelled', 'Delivered']).count()
+        revenue = PartOrder.objects.filter(payment_status='PAID').exclude(status__in=['Cancelled', 'Expired']).aggregate(total=Sum('total_price'))['total'] or 0
+        active_distributions = PartOrder.objects.exclude(status__in=['Cancelled', 'Delivered', 'Expired']).count()
 
         return Response({
             'total_paid_revenue': revenue,
@@ -555,39 +679,96 @@ class AdminPartOrderViewSet(viewsets.ModelViewSet):
         })
 
 
+@api_view(['GET'])
+@permission_classes([IsStaffOrSpecialist])
+def admin_search(request):
+    """Ranked hits across users, bookings, part orders and denting requests."""
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'error': 'Query parameter q is required.'}, status=400)
+
+    types = request.query_params.get('types')
+    try:
+        limit = min(int(request.query_params.get('limit', 20)), 100)
+    except ValueError:
+        return Response({'error': 'limit must be a number.'}, status=400)
+
+    results = search(query, kinds=types.split(',') if types else None, limit=limit)
+    return Response({'query': query, 'results': results})
+
+
 # --- LOGBOOK & STAFF MANAGEMENT ---
 
-class UserServiceHistoryView(generics.ListAPIView):
+class UserServiceHistoryView(DeltaSyncMixin, QueryOptimizerMixin, generics.ListAPIView):
     serializer_class = ServiceHistorySerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ServiceHistoryFilter
+
+    def is_privileged(self):
+        # Staff, mechanics and billing see every record (e-commerce staff do not)
+        return bool(get_roles(self.request.user) & {'superuser', 'staff', 'mechanic', 'billing'})
+
+    def delta_sees_all_users(self):
+        return self.is_privileged()
 
     def get_queryset(self):
         user = self.request.user
-        
-        # Initialize flags
-        is_mechanic = False
-        is_billing = False
-        
-        # Access the PROFILE model where you actually saved the roles
-        if hasattr(user, 'profile'):
-            is_mechanic = user.profile.is_mechanic
-            is_billing = user.profile.is_billing
-
-        # Now check if they have ANY privilege
-        is_privileged = (
-            user.is_superuser or 
-            user.is_staff or 
-            is_mechanic or 
-            is_billing
-        )
 
-        if is_privileged:
+        if self.is_privileged():
             # Show everything to staff/mechanics/billing
             return ServiceHistory.objects.all().order_by('-completion_date')
         
         # Show only personal records to regular customers
         return ServiceHistory.objects.filter(user=user).order_by('-completion_date')
 
+class ArchivePagination(CursorPagination):
+    ordering = '-occurred_at'
+    page_size = 50
+
+
+class ArchivedHistoryView(generics.ListAPIView):
+    """
+    Cold history: bookings, part orders and logbook entries moved out of
+    the live tables by the archive job. Filter with ?kind=booking etc.
+    """
+    serializer_class = ArchivedRecordSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = ArchivePagination
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = ArchivedRecord.objects.all()
+
+        if not IsStaffOrSpecialist().has_permission(self.request, self):
+            queryset = queryset.filter(user=user)
+
+        kind = self.request.query_params.get('kind')
+        if kind:
+            queryset = queryset.filter(kind=kind)
+        return queryset
+
+class RestockPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class RestockSuggestionView(generics.ListAPIView):
+    """
+    Nightly restock forecast, most urgent first (fewest days of cover).
+    ?reorder=1 lists only parts with a positive reorder quantity.
+    """
+    serializer_class = RestockSuggestionSerializer
+    permission_classes = [IsStaffOrSpecialist]
+    pagination_class = RestockPagination
+
+    def get_queryset(self):
+        queryset = RestockSuggestion.objects.select_related('part')
+        if self.request.query_params.get('reorder') in ('1', 'true'):
+            queryset = queryset.filter(reorder_quantity__gt=0)
+        return queryset.order_by(F('days_of_cover').asc(nulls_last=True), 'part_id')
+
 class ServiceHistoryUpdateView(generics.UpdateAPIView):
     queryset = ServiceHistory.objects.all()
     serializer_class = ServiceHistorySerializer
@@ -598,18 +779,44 @@ class IsSuperUser(permissions.BasePermission):
     def has_permission(self, request, view):
         return bool(request.user and request.user.is_superuser)
 
+class StaffPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
 class StaffManagementView(generics.ListAPIView):
-    queryset = User.objects.all().exclude(is_superuser=True).order_by('-date_joined')
+    """
+    Users with their role flags, 50 per page. ?role=mechanic (or staff,
+    billing, ecommerce) lists only holders of that role via the UserRole index;
+    any other role is a 400.
+    """
     serializer_class = UserSerializer
     permission_classes = [IsSuperUser]
+    pagination_class = StaffPagination
+
+    def list(self, request, *args, **kwargs):
+        role = request.query_params.get('role')
+        if role and role not in ROLE_SOURCES:
+            return Response({'error': f"Unknown role '{role}'. Use one of: {', '.join(ROLE_SOURCES)}."}, status=400)
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = User.objects.exclude(is_superuser=True).select_related('profile')
+        role = self.request.query_params.get('role')
+        if role:
+            queryset = queryset.filter(pk__in=UserRole.objects.filter(role=role).values('user_id'))
+        return queryset.order_by('-date_joined', '-pk')
 
 @api_view(['PATCH'])
 @permission_classes([IsSuperUser])
 def toggle_staff_status(request, user_id):
     try:
-        user = User.objects.get(id=user_id)
-        user.is_staff = not user.is_staff
-        user.save()
+        with transaction.atomic():
+            # Row lock: two concurrent toggles must not both read the old value
+            user = User.objects.select_for_update().get(id=user_id)
+            user.is_staff = not user.is_staff
+            user.save()  # profile save -> role index
         return Response({'is_staff': user.is_staff}, status=status.HTTP_200_OK)
     except User.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
@@ -620,26 +827,27 @@ def toggle_staff_status(request, user_id):
 @permission_classes([IsSuperUser])
 def toggle_user_role(request, user_id):
     try:
-        user = User.objects.get(id=user_id)
         role = request.data.get('role')
-        
-        # 1. Handle Built-in Django Staff Status
-        if role == 'is_staff':
-            user.is_staff = not user.is_staff
-            user.save()
-            return Response({'status': 'success'}, status=200)
+        if role not in ['is_staff', 'is_mechanic', 'is_billing', 'is_ecommerce']:
+            return Response({'error': 'Invalid role'}, status=400)
 
-        # 2. Handle Custom Roles (Mechanic, Billing, etc.)
-        if role in ['is_mechanic', 'is_billing', 'is_ecommerce']:
+        # Flag and role index change together, under a row lock
+        with transaction.atomic():
+            user = User.objects.select_for_update().get(id=user_id)
+
+            # 1. Handle Built-in Django Staff Status
+            if role == 'is_staff':
+                user.is_staff = not user.is_staff
+                user.save()
+                return Response({'status': 'success'}, status=200)
+
+            # 2. Handle Custom Roles (Mechanic, Billing, etc.)
             # get_or_create prevents the 500 crash if profile is missing
-            profile, created = UserProfile.objects.get_or_create(user=user)
-            current_val = getattr(profile, role)
-            setattr(profile, role, not current_val)
+            profile, created = UserProfile.objects.select_for_update().get_or_create(user=user)
+            setattr(profile, role, not getattr(profile, role))
             profile.save()
             return Response({'status': 'success'}, status=200)
 
-        return Response({'error': 'Invalid role'}, status=400)
-
     except User.DoesNotExist:
         return Response({'error': 'User not found'}, status=404)
     except Exception as e: